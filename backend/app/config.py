@@ -25,13 +25,51 @@ class Settings(BaseSettings):
     SUPABASE_ANON_KEY: Optional[str] = os.getenv("SUPABASE_ANON_KEY")
     SUPABASE_SERVICE_ROLE: Optional[str] = os.getenv("SUPABASE_SERVICE_ROLE")
     SUPABASE_SERVICE_KEY: Optional[str] = os.getenv("SUPABASE_SERVICE_KEY")
-    
+
+    # Pool de conexiones HTTP hacia Supabase (cliente asíncrono)
+    DB_POOL_MAX_CONNECTIONS: int = int(os.getenv("DB_POOL_MAX_CONNECTIONS", "200"))
+    DB_POOL_MAX_KEEPALIVE: int = int(os.getenv("DB_POOL_MAX_KEEPALIVE", "50"))
+    DB_POOL_KEEPALIVE_EXPIRY: float = float(os.getenv("DB_POOL_KEEPALIVE_EXPIRY", "30"))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+    DB_TIMEOUT: float = float(os.getenv("DB_TIMEOUT", "120"))
+    DB_CONNECT_TIMEOUT: float = float(os.getenv("DB_CONNECT_TIMEOUT", "10"))
+
     # Configuración de seguridad
     SECRET_KEY: str = os.getenv("SECRET_KEY", "red-social-univalle-2025-super-secret-key-change-in-production")
     ALGORITHM: str = os.getenv("ALGORITHM", "HS256")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
     REFRESH_TOKEN_EXPIRE_DAYS: int = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "7"))
     
+    # Caché de autenticación (tokens verificados y usuarios)
+    AUTH_CACHE_MAX_SIZE: int = int(os.getenv("AUTH_CACHE_MAX_SIZE", "10000"))
+    AUTH_TOKEN_CACHE_TTL: float = float(os.getenv("AUTH_TOKEN_CACHE_TTL", "300"))
+    AUTH_USER_CACHE_TTL: float = float(os.getenv("AUTH_USER_CACHE_TTL", "60"))
+    
+    # Hilos dedicados a bcrypt (máximo de hashes/verificaciones simultáneos)
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))
+    
+    # Importación masiva de estudiantes/docentes (filas por lote de inserción)
+    IMPORT_BATCH_SIZE: int = int(os.getenv("IMPORT_BATCH_SIZE", "200"))
+    
+    # Índice en memoria de búsqueda de usuarios (segundos entre reconstrucciones, 0 = nunca)
+    USER_SEARCH_INDEX_TTL: float = float(os.getenv("USER_SEARCH_INDEX_TTL", "900"))
+    
+    # Caché de lectura del catálogo académico (materias, grupos, horarios, gestiones)
+    CATALOG_CACHE_TTL: float = float(os.getenv("CATALOG_CACHE_TTL", "300"))
+    CATALOG_CACHE_MAX_SIZE: int = int(os.getenv("CATALOG_CACHE_MAX_SIZE", "1024"))
+    CATALOG_CACHE_BACKEND: str = os.getenv("CATALOG_CACHE_BACKEND", "")  # "" = solo local, "memoria"
+    
+    # Sincronización con el SIU (filas por INSERT/UPSERT/DELETE)
+    SIU_SYNC_BATCH_SIZE: int = int(os.getenv("SIU_SYNC_BATCH_SIZE", "1000"))
+    # Fracción máxima de filas del SIU que una sincronización elimina sin `permitir_eliminar`
+    SIU_SYNC_MAX_DELETE_RATIO: float = float(os.getenv("SIU_SYNC_MAX_DELETE_RATIO", "0.2"))
+    
+    # Nota mínima de aprobación (estadísticas de notas)
+    NOTA_APROBACION: float = float(os.getenv("NOTA_APROBACION", "51"))
+    
+    # Zona horaria de los horarios de clase (para "qué clase hay ahora")
+    TIMEZONE: str = os.getenv("TIMEZONE", "America/La_Paz")
+    
     # Configuración de CORS
     CORS_ORIGINS: Optional[str] = '["http://localhost:3000", "http://127.0.0.1:3000"]'
     BACKEND_CORS_ORIGINS: list = [
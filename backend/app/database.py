@@ -2,6 +2,12 @@
 Configuración de la base de datos con Supabase
 """
 from supabase import create_client, Client
+from postgrest import AsyncPostgrestClient
+from postgrest.exceptions import APIError
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import Dict, Optional
+import httpx
 from app.config import settings
 import logging
 
@@ -10,6 +16,60 @@ logger = logging.getLogger(__name__)
 # Cliente de Supabase
 supabase: Client = None
 
+# Cliente asíncrono de PostgREST (usado por las rutas)
+async_db: AsyncPostgrestClient = None
+
+# Código de PostgREST cuando la función RPC no existe en el esquema
+RPC_NO_ENCONTRADA = "PGRST202"
+
+# Código de Postgres cuando una columna pedida no existe
+COLUMNA_NO_EXISTE = "42703"
+
+# Request en curso (lo fija el middleware) para atribuir cada consulta a su ruta
+ruta_actual: ContextVar[Optional[dict]] = ContextVar("ruta_actual", default=None)
+
+# Consultas y bytes recibidos de PostgREST por ruta de la API
+_transferencia: Dict[str, Dict[str, int]] = defaultdict(lambda: {"consultas": 0, "bytes": 0})
+
+
+async def _medir_respuesta(response: httpx.Response) -> None:
+    """Suma el tamaño de cada respuesta de PostgREST a la ruta que la pidió"""
+    await response.aread()
+    scope = ruta_actual.get()
+    route = scope.get("route") if scope else None
+    clave = f"{scope['method']} {route.path}" if route else "(sin ruta)"
+    metricas = _transferencia[clave]
+    metricas["consultas"] += 1
+    metricas["bytes"] += len(response.content)
+
+
+def transferencia_stats() -> Dict[str, Dict[str, int]]:
+    """Consultas y bytes recibidos por ruta, de mayor a menor volumen"""
+    return dict(sorted(_transferencia.items(), key=lambda item: item[1]["bytes"], reverse=True))
+
+
+class PooledPostgrestClient(AsyncPostgrestClient):
+    """
+    Cliente PostgREST asíncrono con pool de conexiones keep-alive configurable
+    """
+
+    def create_session(self, base_url, headers, timeout, verify=True, proxy=None):
+        return httpx.AsyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=timeout,
+            verify=verify,
+            proxy=proxy,
+            follow_redirects=True,
+            http2=True,
+            event_hooks={"response": [_medir_respuesta]},
+            limits=httpx.Limits(
+                max_connections=settings.DB_POOL_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.DB_POOL_MAX_KEEPALIVE,
+                keepalive_expiry=settings.DB_POOL_KEEPALIVE_EXPIRY,
+            ),
+        )
+
 
 def get_supabase_client() -> Client:
     """
@@ -29,21 +89,72 @@ def get_supabase_client() -> Client:
     return supabase
 
 
+def get_async_client() -> AsyncPostgrestClient:
+    """
+    Obtiene o crea el cliente asíncrono de PostgREST
+
+    Las peticiones comparten un único pool HTTP, por lo que las consultas
+    no bloquean el event loop ni abren una conexión nueva por request.
+    """
+    global async_db
+    if async_db is None:
+        try:
+            async_db = PooledPostgrestClient(
+                f"{settings.SUPABASE_URL.rstrip('/')}/rest/v1",
+                headers={
+                    "apiKey": settings.SUPABASE_KEY,
+                    "Authorization": f"Bearer {settings.SUPABASE_KEY}",
+                },
+                timeout=httpx.Timeout(
+                    settings.DB_TIMEOUT,
+                    connect=settings.DB_CONNECT_TIMEOUT,
+                    pool=settings.DB_POOL_TIMEOUT,
+                ),
+            )
+            logger.info("✅ Cliente asíncrono de Supabase creado")
+        except Exception as e:
+            logger.error(f"❌ Error al crear el cliente asíncrono: {e}")
+            raise
+    return async_db
+
+
+def rpc_no_disponible(error: Exception) -> bool:
+    """
+    Indica si el error se debe a que la función RPC aún no fue creada en Supabase
+
+    Permite a las rutas usar una implementación alternativa mientras no se
+    ejecuten los scripts SQL de `baseDeDatos.md`.
+    """
+    return isinstance(error, APIError) and error.code == RPC_NO_ENCONTRADA
+
+
 def init_db():
     """
     Inicializa la conexión a la base de datos
     """
     try:
         get_supabase_client()
+        get_async_client()
         logger.info("✅ Base de datos inicializada correctamente")
     except Exception as e:
         logger.error(f"❌ Error al inicializar la base de datos: {e}")
         raise
 
 
+async def close_db():
+    """
+    Cierra las conexiones del pool asíncrono
+    """
+    global async_db
+    if async_db is not None:
+        await async_db.aclose()
+        async_db = None
+        logger.info("✅ Conexiones a la base de datos cerradas")
+
+
 # Dependencia para obtener el cliente de Supabase en las rutas
-async def get_db() -> Client:
+async def get_db() -> AsyncPostgrestClient:
     """
-    Dependencia para inyectar el cliente de Supabase en las rutas
+    Dependencia para inyectar el cliente asíncrono de Supabase en las rutas
     """
-    return get_supabase_client()
+    return get_async_client()
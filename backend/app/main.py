@@ -11,11 +11,17 @@ import logging
 import time
 
 from app.config import settings
-from app.database import init_db
+from app.database import init_db, close_db, ruta_actual, transferencia_stats
+from app.utils.cache import cache_stats
+from app.utils.catalogo import catalogo_stats
+from app.utils.ocupacion import indice_horarios
+from app.utils.security import hash_pool
+from app.utils.busqueda import indice_usuarios
+from app.utils.pagination import NEXT_CURSOR_HEADER
 
 # Importar routers
 from app.routes import auth, usuarios, estudiantes, docentes
-from app.routes import materias, notas, horarios, grupos
+from app.routes import materias, notas, horarios, grupos, siu
 from app.routes import publicaciones, comentarios, reacciones
 from app.routes import mensajes, notificaciones
 from app.routes import rutas, pasajeros
@@ -42,9 +48,11 @@ async def lifespan(app: FastAPI):
         logger.error(f"❌ Error al inicializar base de datos: {e}")
     
     yield
-    
+
     # Shutdown
     logger.info("👋 Cerrando aplicación...")
+    await close_db()
+    hash_pool.shutdown()
 
 
 # Crear la aplicación FastAPI
@@ -64,6 +72,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
 
@@ -74,6 +83,7 @@ async def log_requests(request: Request, call_next):
     Middleware para registrar todas las peticiones
     """
     start_time = time.time()
+    ruta_actual.set(request.scope)
     
     # Procesar request
     response = await call_next(request)
@@ -160,7 +170,13 @@ async def health_check():
     return {
         "status": "healthy",
         "version": settings.VERSION,
-        "environment": settings.ENVIRONMENT
+        "environment": settings.ENVIRONMENT,
+        "cache": cache_stats(),
+        "catalog_cache": catalogo_stats(),
+        "password_hashing": hash_pool.stats(),
+        "user_search_index": indice_usuarios.stats(),
+        "schedule_index": indice_horarios.stats(),
+        "db_transfer": transferencia_stats()
     }
 
 
@@ -180,6 +196,7 @@ app.include_router(materias.router, prefix=api_prefix, tags=["Materias"])
 app.include_router(notas.router, prefix=api_prefix, tags=["Notas"])
 app.include_router(horarios.router, prefix=api_prefix, tags=["Horarios"])
 app.include_router(grupos.router, prefix=api_prefix, tags=["Grupos"])
+app.include_router(siu.router, prefix=api_prefix, tags=["SIU"])
 
 # Red social
 app.include_router(publicaciones.router, prefix=api_prefix, tags=["Publicaciones"])
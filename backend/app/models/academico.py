@@ -2,7 +2,7 @@
 Modelos Pydantic para el módulo académico
 """
 from pydantic import BaseModel, Field, validator
-from typing import Optional, Literal
+from typing import Dict, List, Optional, Literal
 from datetime import datetime, date, time
 from enum import Enum
 
@@ -170,6 +170,74 @@ class Nota(NotaBase):
         from_attributes = True
 
 
+class CubetaNotas(BaseModel):
+    """Cantidad de notas en [desde, hasta) (la última cubeta incluye el 100)"""
+    desde: float
+    hasta: float
+    cantidad: int
+
+
+class EstadisticaNotas(BaseModel):
+    """Medidas de las notas de un tipo (parcial, final, etc.)"""
+    tipo_nota: str
+    cantidad: int
+    media: float
+    mediana: float
+    desviacion: float
+    minimo: float
+    maximo: float
+    percentiles: Dict[str, float] = {}  # "p25", "p50", "p75", "p90"
+    tasa_aprobacion: float  # Fracción de notas >= nota_aprobacion
+    histograma: List[CubetaNotas] = []
+
+
+class EstadisticasMateria(BaseModel):
+    """Estadísticas de las notas de una materia (o de un grupo en esa materia)"""
+    id_materia: str
+    id_grupo: Optional[str] = None
+    total: int
+    nota_aprobacion: float
+    por_tipo: List[EstadisticaNotas] = []
+
+
+class FilaCargaNotas(BaseModel):
+    """Resultado de una fila de la carga masiva de notas"""
+    fila: int  # Número de fila en el archivo (1 = primera fila de datos)
+    id_user: Optional[str] = None
+    ci_est: Optional[str] = None
+    nota: Optional[float] = None
+    estado: Literal["creada", "actualizada", "rechazada"]
+    errores: List[str] = []
+
+
+class ResultadoCargaNotas(BaseModel):
+    """Resumen de una carga masiva de notas"""
+    total_filas: int = 0
+    creadas: int = 0
+    actualizadas: int = 0
+    rechazadas: int = 0
+    filas: List[FilaCargaNotas] = []
+    duracion_segundos: float = 0.0
+    filas_por_segundo: float = 0.0
+
+
+class MateriaExpediente(BaseModel):
+    """Promedio de un estudiante en una materia"""
+    id_materia: str
+    materia: Optional[dict] = None  # id_materia, nombre_materia, codigo_materia
+    evaluaciones: int
+    promedio: float
+
+
+class Expediente(BaseModel):
+    """Expediente académico de un estudiante"""
+    id_user: str
+    materias: List[MateriaExpediente] = []
+    evaluaciones: int = 0
+    promedio_general: Optional[float] = None  # Cada materia pesa lo mismo
+    promedio_ponderado: Optional[float] = None  # Ponderado por cantidad de evaluaciones
+
+
 # ============= HORARIO =============
 
 class DiaSemanaEnum(str, Enum):
@@ -302,3 +370,75 @@ class Horario(HorarioBase):
 
     class Config:
         from_attributes = True
+
+
+class FranjaHorario(BaseModel):
+    """Intervalo de la grilla semanal entre dos horas de inicio/fin consecutivas"""
+    hora_inicio: str
+    hora_fin: str
+
+
+class HorarioSemanal(BaseModel):
+    """Horario semanal de un grupo armado como grilla días × franjas"""
+    id_grupo: str
+    franjas: List[FranjaHorario] = []
+    # grilla[dia][i]: IDs de los horarios que ocupan la franja i ese día
+    grilla: Dict[str, List[List[str]]] = {}
+    bloques: List[Horario] = []  # Horarios del grupo por día y hora
+    materias: List[Materia] = []  # Materias del grupo (el horario no indica la materia)
+
+
+class ConflictoHorario(BaseModel):
+    """Horario que se superpone con otro en la misma aula o el mismo grupo"""
+    tipo: Literal["aula", "grupo"]
+    id_horario: Optional[str] = None
+    fila: Optional[int] = None  # Fila del lote con la que choca (validación masiva)
+    dia_semana: str
+    hora_inicio: str
+    hora_fin: str
+    aula: str
+    id_grupo: str
+
+
+class ValidacionHorario(BaseModel):
+    """Choques de una fila del lote validado"""
+    fila: int
+    conflictos: List[ConflictoHorario]
+
+
+class ResultadoValidacionHorarios(BaseModel):
+    """Resultado de validar un lote completo de horarios"""
+    total: int
+    con_conflictos: int
+    filas: List[ValidacionHorario] = []
+
+
+class AulasLibres(BaseModel):
+    """Aulas sin clases en un intervalo de un día"""
+    dia_semana: DiaSemanaEnum
+    hora_inicio: str
+    hora_fin: str
+    aulas: List[str] = []  # Solo las aulas que aparecen en algún horario
+
+
+class ErrorSincronizacion(BaseModel):
+    """Fila de la exportación del SIU que no se aplicó"""
+    fila: Optional[int] = None  # None: eliminación rechazada de una fila de la base
+    id: Optional[str] = None  # ID de la fila de la base que no se pudo eliminar
+    errores: List[str]
+
+
+class ResultadoSincronizacion(BaseModel):
+    """Resumen de la sincronización de una entidad con el SIU"""
+    entidad: str
+    simulacion: bool = False
+    total_filas: int = 0
+    insertados: int = 0
+    actualizados: int = 0
+    eliminados: int = 0
+    sin_cambios: int = 0
+    omitidos_manual: int = 0  # Filas con la clave de una fila MANUAL
+    conservados: int = 0  # Filas del SIU que no se eliminaron (ver `errores` y `eliminacion_omitida`)
+    eliminacion_omitida: Optional[str] = None  # Motivo por el que no se aplicaron las eliminaciones
+    errores: List[ErrorSincronizacion] = []
+    duracion_segundos: float = 0.0
@@ -2,7 +2,7 @@
 Modelos Pydantic para el módulo social (publicaciones, comentarios, reacciones)
 """
 from pydantic import BaseModel, Field, validator
-from typing import Optional, List
+from typing import Optional, List, Dict
 from datetime import datetime
 from enum import Enum
 
@@ -44,6 +44,7 @@ class Publicacion(PublicacionBase):
     media: Optional[List[dict]] = []  # Lista de archivos multimedia
     comentarios_count: Optional[int] = 0
     reacciones_count: Optional[int] = 0
+    reacciones_por_tipo: Optional[Dict[str, int]] = {}  # Conteo por tipo de reacción
     mis_reacciones: Optional[List[str]] = []  # Reacciones del usuario actual
 
     class Config:
@@ -134,6 +135,7 @@ class Comentario(ComentarioBase):
     fecha_creacion: datetime
     usuario: Optional[dict] = None  # Información del usuario
     reacciones_count: Optional[int] = 0
+    reacciones_por_tipo: Optional[Dict[str, int]] = {}  # Conteo por tipo de reacción
     mis_reacciones: Optional[List[str]] = []  # Reacciones del usuario actual
 
     class Config:
@@ -186,6 +188,22 @@ class Reaccion(ReaccionBase):
         from_attributes = True
 
 
+class ReaccionesResumen(BaseModel):
+    """Resumen de reacciones de una publicación o comentario"""
+    total: int = 0
+    por_tipo: Dict[str, int] = {}  # Cantidad por tipo de reacción
+    mis_reacciones: List[str] = []  # Reacciones del usuario actual
+    muestra: List[dict] = []  # Algunos usuarios que reaccionaron
+
+
+class ReaccionToggle(BaseModel):
+    """Resultado de alternar una reacción"""
+    activa: bool  # True si la reacción quedó creada, False si se eliminó
+    reaccion: Optional[Reaccion] = None
+    reacciones_count: int = 0
+    reacciones_por_tipo: Dict[str, int] = {}
+
+
 # ============= MODELOS DE RESPUESTA AGREGADOS =============
 
 class PublicacionConDetalles(Publicacion):
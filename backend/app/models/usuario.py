@@ -2,7 +2,7 @@
 Modelos Pydantic para Usuario, Estudiante, Docente y Administrador
 """
 from pydantic import BaseModel, EmailStr, Field, validator
-from typing import Optional, Literal
+from typing import Optional, Literal, List
 from datetime import datetime
 from enum import Enum
 
@@ -71,6 +71,15 @@ class Usuario(UsuarioBase):
         from_attributes = True
 
 
+class UsuarioPublico(BaseModel):
+    """Datos públicos de un usuario (búsqueda y autocompletado)"""
+    id_user: str
+    nombre: str
+    apellido: str
+    rol: RolEnum
+    foto_perfil: Optional[str] = None
+
+
 # ============= ESTUDIANTE =============
 
 class EstudianteBase(BaseModel):
@@ -175,3 +184,23 @@ class Administrador(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+# ============= IMPORTACIÓN MASIVA =============
+
+class ErrorImportacion(BaseModel):
+    """Fila rechazada en una importación masiva"""
+    fila: int  # Número de fila en el archivo (1 = primera fila de datos)
+    ci: Optional[str] = None
+    correo: Optional[str] = None
+    errores: List[str]
+
+
+class ResultadoImportacion(BaseModel):
+    """Resumen de una importación masiva de estudiantes o docentes"""
+    total_filas: int = 0
+    creados: int = 0
+    rechazados: int = 0
+    errores: List[ErrorImportacion] = []
+    duracion_segundos: float = 0.0
+    filas_por_segundo: float = 0.0
@@ -17,6 +17,7 @@ from app.routes import (
     notificaciones,
     rutas,
     pasajeros,
+    siu,
 )
 
 __all__ = [
@@ -35,4 +36,5 @@ __all__ = [
     "notificaciones",
     "rutas",
     "pasajeros",
+    "siu",
 ]
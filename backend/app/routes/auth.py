@@ -5,19 +5,21 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from pydantic import BaseModel, EmailStr
 from datetime import timedelta
-from supabase import Client
+from postgrest import AsyncPostgrestClient
 
 from app.database import get_db
 from app.config import settings
 from app.utils.security import (
-    verify_password,
-    get_password_hash,
+    verify_password_async,
+    get_password_hash_async,
     create_access_token,
     create_refresh_token,
     verify_token
 )
 from app.utils.dependencies import get_current_user
-from app.models.usuario import UsuarioCreate, Usuario, RolEnum
+from app.utils.busqueda import indice_usuarios
+from app.models.usuario import UsuarioCreate, Usuario, UsuarioInDB, RolEnum
+from app.utils.proyeccion import columnas
 
 router = APIRouter(prefix="/auth")
 
@@ -38,14 +40,14 @@ class RefreshTokenRequest(BaseModel):
 @router.post("/register", response_model=TokenResponse, status_code=status.HTTP_201_CREATED)
 async def register(
     user_data: UsuarioCreate,
-    db: Client = Depends(get_db)
+    db: AsyncPostgrestClient = Depends(get_db)
 ):
     """
     Registrar un nuevo usuario
     """
     try:
         # Verificar si el correo ya existe
-        existing = db.table("usuario").select("id_user").eq("correo", user_data.correo).execute()
+        existing = await db.table("usuario").select("id_user").eq("correo", user_data.correo).execute()
         
         if existing.data:
             raise HTTPException(
@@ -54,7 +56,7 @@ async def register(
             )
         
         # Hash de la contraseña
-        hashed_password = get_password_hash(user_data.contrasena)
+        hashed_password = await get_password_hash_async(user_data.contrasena)
         
         # Crear usuario
         user_dict = {
@@ -66,7 +68,7 @@ async def register(
             "activo": True
         }
         
-        response = db.table("usuario").insert(user_dict).execute()
+        response = await db.table("usuario").insert(user_dict).execute()
         
         if not response.data:
             raise HTTPException(
@@ -75,6 +77,7 @@ async def register(
             )
         
         created_user = response.data[0]
+        indice_usuarios.registrar(created_user)
         
         # Crear tokens
         access_token = create_access_token(
@@ -106,14 +109,14 @@ async def register(
 @router.post("/login", response_model=TokenResponse)
 async def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Client = Depends(get_db)
+    db: AsyncPostgrestClient = Depends(get_db)
 ):
     """
     Iniciar sesión (username es el correo electrónico)
     """
     try:
         # Buscar usuario por correo
-        response = db.table("usuario").select("*").eq("correo", form_data.username).execute()
+        response = await db.table("usuario").select(columnas(UsuarioInDB)).eq("correo", form_data.username).execute()
         
         if not response.data:
             raise HTTPException(
@@ -125,7 +128,7 @@ async def login(
         user = response.data[0]
         
         # Verificar contraseña
-        if not verify_password(form_data.password, user["contrasena"]):
+        if not await verify_password_async(form_data.password, user["contrasena"]):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Credenciales incorrectas",
@@ -169,7 +172,7 @@ async def login(
 @router.post("/refresh", response_model=TokenResponse)
 async def refresh_token(
     token_data: RefreshTokenRequest,
-    db: Client = Depends(get_db)
+    db: AsyncPostgrestClient = Depends(get_db)
 ):
     """
     Refrescar el access token usando el refresh token
@@ -187,7 +190,7 @@ async def refresh_token(
     
     # Obtener usuario
     try:
-        response = db.table("usuario").select("*").eq("id_user", user_id).execute()
+        response = await db.table("usuario").select(columnas(Usuario)).eq("id_user", user_id).execute()
         
         if not response.data:
             raise HTTPException(
@@ -212,14 +215,11 @@ async def refresh_token(
             data={"sub": user["id_user"]}
         )
         
-        # Preparar respuesta
-        user_response = {k: v for k, v in user.items() if k != "contrasena"}
-        
         return {
             "access_token": new_access_token,
             "refresh_token": new_refresh_token,
             "token_type": "bearer",
-            "user": user_response
+            "user": user
         }
         
     except HTTPException:
@@ -233,12 +233,10 @@ async def refresh_token(
 
 @router.get("/me", response_model=Usuario)
 async def get_me(
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(get_current_user)
 ):
     """
     Obtener información del usuario actual
     """
-    # Remover contraseña
-    user_response = {k: v for k, v in current_user.items() if k != "contrasena"}
-    return user_response
+    return current_user
@@ -1,28 +1,43 @@
 """
 Rutas para gestión de comentarios
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from typing import List
-from supabase import Client
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from typing import List, Optional
+from postgrest import AsyncPostgrestClient
 
 from app.database import get_db
 from app.models.social import Comentario, ComentarioCreate, ComentarioUpdate
+from app.models.usuario import UsuarioPublico
 from app.utils.dependencies import get_current_active_user
+from app.utils.engagement import ajustar_contadores
+from app.utils.pagination import paginar, set_next_cursor
+from app.utils.proyeccion import columnas, seleccionar_con_respaldo
 
 router = APIRouter(prefix="/comentarios")
 
+ORDEN_COMENTARIOS = (("fecha_creacion", True), ("id_comentario", True))
+
+# Columnas de Comentario con el autor (datos públicos); sin contadores si aún no existen
+COLUMNAS_COMENTARIO = columnas(Comentario, excluir=("mis_reacciones",), usuario=UsuarioPublico)
+COLUMNAS_COMENTARIO_SIN_CONTADORES = columnas(
+    Comentario,
+    excluir=("mis_reacciones", "reacciones_count", "reacciones_por_tipo"),
+    usuario=UsuarioPublico
+)
+
 
 @router.post("", response_model=Comentario, status_code=status.HTTP_201_CREATED)
 async def create_comentario(
     comentario_data: ComentarioCreate,
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Crear un nuevo comentario"""
     try:
         com_dict = comentario_data.dict()
         com_dict["id_user"] = current_user["id_user"]
-        response = db.table("comentario").insert(com_dict).execute()
+        response = await db.table("comentario").insert(com_dict).execute()
+        await ajustar_contadores(db, id_publicacion=comentario_data.id_publicacion, comentarios=1)
         return response.data[0]
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
@@ -31,15 +46,23 @@ async def create_comentario(
 @router.get("/publicacion/{id_publicacion}", response_model=List[Comentario])
 async def get_comentarios_publicacion(
     id_publicacion: str,
-    skip: int = Query(0, ge=0),
+    http_response: Response,
+    cursor: Optional[str] = Query(None, description="Cursor de la página siguiente (encabezado X-Next-Cursor)"),
+    skip: int = Query(0, ge=0, deprecated=True),
     limit: int = Query(50, ge=1, le=100),
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Obtener comentarios de una publicación"""
     try:
-        response = db.table("comentario").select("*, usuario(nombre, apellido, foto_perfil)").eq("id_publicacion", id_publicacion).order("fecha_creacion", desc=True).range(skip, skip + limit - 1).execute()
+        response = await seleccionar_con_respaldo(
+            db, "comentario", COLUMNAS_COMENTARIO, COLUMNAS_COMENTARIO_SIN_CONTADORES,
+            lambda query: paginar(query.eq("id_publicacion", id_publicacion), ORDEN_COMENTARIOS, limit, cursor, skip)
+        )
+        set_next_cursor(http_response, response.data, ORDEN_COMENTARIOS, limit)
         return response.data
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
@@ -48,19 +71,19 @@ async def get_comentarios_publicacion(
 async def update_comentario(
     id_comentario: str,
     comentario_data: ComentarioUpdate,
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Actualizar un comentario"""
     try:
-        existing = db.table("comentario").select("*").eq("id_comentario", id_comentario).execute()
+        existing = await db.table("comentario").select("id_user, id_publicacion").eq("id_comentario", id_comentario).execute()
         if not existing.data:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Comentario no encontrado")
         if existing.data[0]["id_user"] != current_user["id_user"]:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="No autorizado")
         
         update_data = comentario_data.dict(exclude_unset=True)
-        response = db.table("comentario").update(update_data).eq("id_comentario", id_comentario).execute()
+        response = await db.table("comentario").update(update_data).eq("id_comentario", id_comentario).execute()
         return response.data[0]
     except HTTPException:
         raise
@@ -71,18 +94,19 @@ async def update_comentario(
 @router.delete("/{id_comentario}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_comentario(
     id_comentario: str,
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Eliminar un comentario"""
     try:
-        existing = db.table("comentario").select("*").eq("id_comentario", id_comentario).execute()
+        existing = await db.table("comentario").select("id_user, id_publicacion").eq("id_comentario", id_comentario).execute()
         if not existing.data:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Comentario no encontrado")
         if existing.data[0]["id_user"] != current_user["id_user"]:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="No autorizado")
         
-        db.table("comentario").delete().eq("id_comentario", id_comentario).execute()
+        await db.table("comentario").delete().eq("id_comentario", id_comentario).execute()
+        await ajustar_contadores(db, id_publicacion=existing.data[0]["id_publicacion"], comentarios=-1)
         return None
     except HTTPException:
         raise
@@ -1,81 +1,60 @@
 """
 Rutas para gestión de docentes
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response, UploadFile, File
 from typing import List, Optional
-from supabase import Client
+from postgrest import AsyncPostgrestClient
 
 from app.database import get_db
-from app.models.usuario import Docente, DocenteCreate, DocenteUpdate
-from app.utils.dependencies import get_current_active_user, require_admin
-from app.utils.security import get_password_hash
+from app.models.usuario import Docente, DocenteCreate, DocenteUpdate, ResultadoImportacion, Usuario
+from app.utils.dependencies import get_current_active_user, require_admin, get_loaders
+from app.utils.loaders import DataLoaders
+from app.utils.security import get_password_hash_async
+from app.utils.pagination import paginar, set_next_cursor
+from app.utils.importacion import importar_usuarios, leer_filas, bloques_upload, detectar_formato
+from app.utils.provision import provisionar_usuario, datos_docente
+from app.utils.proyeccion import columnas
 
 router = APIRouter(prefix="/docentes")
 
+ORDEN_DOCENTES = (("ci_doc", False),)
+
+# Columnas de Docente, y de su usuario embebido (sin contraseña)
+COLUMNAS_DOCENTE = columnas(Docente, excluir=("usuario",))
+COLUMNAS_DOCENTE_USUARIO = columnas(Docente, usuario=Usuario)
+
+
+async def _attach_usuarios(docentes: List[dict], loaders: DataLoaders) -> List[dict]:
+    """
+    Agrega los datos de usuario (sin contraseña) a cada docente usando un único lote
+    """
+    usuarios = await loaders.load_many(
+        "usuario", "id_user", [doc["id_user"] for doc in docentes],
+        select=columnas(Usuario)
+    )
+    
+    return [
+        {**doc, "usuario": usuario}
+        for doc, usuario in zip(docentes, usuarios)
+        if usuario
+    ]
+
 
 @router.post("", response_model=Docente, status_code=status.HTTP_201_CREATED)
 async def create_docente(
     docente_data: DocenteCreate,
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(require_admin)
 ):
     """
     Crear un nuevo docente (solo administradores)
     """
     try:
-        # Verificar que el CI no existe
-        existing_ci = db.table("docente").select("ci_doc").eq("ci_doc", docente_data.ci_doc).execute()
-        if existing_ci.data:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="El CI ya está registrado"
-            )
-        
-        # Verificar que el correo no existe
-        existing_email = db.table("usuario").select("id_user").eq("correo", docente_data.correo).execute()
-        if existing_email.data:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="El correo ya está registrado"
-            )
-        
-        # Crear usuario primero
-        user_dict = {
-            "nombre": docente_data.nombre,
-            "apellido": docente_data.apellido,
-            "correo": docente_data.correo,
-            "contrasena": get_password_hash(docente_data.contrasena),
-            "rol": "docente",
-            "activo": True
-        }
-        
-        user_response = db.table("usuario").insert(user_dict).execute()
-        if not user_response.data:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Error al crear usuario"
-            )
-        
-        user = user_response.data[0]
-        
-        # Crear docente
-        docente_dict = {
-            "ci_doc": docente_data.ci_doc,
-            "id_user": user["id_user"],
-            "especialidad_doc": docente_data.especialidad_doc
-        }
-        
-        doc_response = db.table("docente").insert(docente_dict).execute()
-        if not doc_response.data:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Error al crear docente"
-            )
+        contrasena_hash = await get_password_hash_async(docente_data.contrasena)
+        user_dict, docente_dict = datos_docente(docente_data, contrasena_hash)
         
-        docente = doc_response.data[0]
-        docente["usuario"] = {k: v for k, v in user.items() if k != "contrasena"}
-        
-        return docente
+        # Verificación de CI/correo e inserción de usuario y docente en una transacción
+        return await provisionar_usuario(db, user_dict, docente_dict)
         
     except HTTPException:
         raise
@@ -86,12 +65,40 @@ async def create_docente(
         )
 
 
+@router.post("/importar", response_model=ResultadoImportacion)
+async def importar_docentes(
+    archivo: UploadFile = File(..., description="Archivo CSV (con encabezado), NDJSON o arreglo JSON"),
+    formato: Optional[str] = Query(None, pattern="^(csv|ndjson|json)$", description="Por defecto se deduce de la extensión"),
+    db: AsyncPostgrestClient = Depends(get_db),
+    current_user: dict = Depends(require_admin)
+):
+    """
+    Importar docentes de forma masiva (solo administradores)
+
+    Las filas válidas se crean por lotes; las inválidas o repetidas se
+    devuelven en `errores` con su número de fila sin detener la importación.
+    """
+    try:
+        formato = formato or detectar_formato(archivo.filename)
+        return await importar_usuarios(db, "docentes", leer_filas(bloques_upload(archivo), formato))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error al importar docentes: {str(e)}"
+        )
+
+
 @router.get("")
 async def get_docentes(
-    skip: int = Query(0, ge=0),
+    http_response: Response,
+    cursor: Optional[str] = Query(None, description="Cursor de la página siguiente (encabezado X-Next-Cursor)"),
+    skip: int = Query(0, ge=0, deprecated=True),
     limit: int = Query(100, ge=1, le=100),
     especialidad: Optional[str] = None,
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
+    loaders: DataLoaders = Depends(get_loaders),
     current_user: dict = Depends(get_current_active_user)
 ):
     """
@@ -99,55 +106,23 @@ async def get_docentes(
     """
     try:
         # Primero obtener los docentes
-        query = db.table("docente").select("*")
+        query = db.table("docente").select(COLUMNAS_DOCENTE)
         
         if especialidad:
             query = query.eq("especialidad_doc", especialidad)
             
-        docentes_response = query.range(skip, skip + limit - 1).execute()
+        docentes_response = await paginar(query, ORDEN_DOCENTES, limit, cursor, skip).execute()
         
         if not docentes_response.data:
             return []
-            
-        # Obtener los IDs de usuario
-        user_ids = [doc["id_user"] for doc in docentes_response.data]
-        
-        # Obtener los datos de usuario correspondientes
-        usuarios_response = db.table("usuario").select("*").in_("id_user", user_ids).execute()
-        
-        if not usuarios_response.data:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Error al obtener datos de usuarios"
-            )
-            
-        # Crear un diccionario para mapear usuarios por ID
-        usuarios_map = {user["id_user"]: user for user in usuarios_response.data}
-        
-        # Combinar los datos
-        docentes = []
-        for doc in docentes_response.data:
-            usuario = usuarios_map.get(doc["id_user"])
-            if usuario:
-                # Remover contraseña del usuario
-                usuario_data = {k: v for k, v in usuario.items() if k != "contrasena"}
-                docente_data = {
-                    **doc,
-                    "usuario": usuario_data
-                }
-                docentes.append(docente_data)
-                
-        return docentes
-        query = db.table("docente").select("*, Usuario(*)")
         
-        if especialidad:
-            query = query.eq("especialidad_doc", especialidad)
+        set_next_cursor(http_response, docentes_response.data, ORDEN_DOCENTES, limit)
         
-        query = query.range(skip, skip + limit - 1)
-        response = query.execute()
-        
-        return response.data
+        # Los usuarios de toda la página se resuelven en una sola consulta
+        return await _attach_usuarios(docentes_response.data, loaders)
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -157,7 +132,7 @@ async def get_docentes(
 
 @router.get("/me", response_model=Docente)
 async def get_my_docente_data(
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """
@@ -170,7 +145,7 @@ async def get_my_docente_data(
         )
     
     try:
-        response = db.table("docente").select("*, Usuario(*)").eq("id_user", current_user["id_user"]).execute()
+        response = await db.table("docente").select(COLUMNAS_DOCENTE_USUARIO).eq("id_user", current_user["id_user"]).execute()
         
         if not response.data:
             raise HTTPException(
@@ -192,7 +167,8 @@ async def get_my_docente_data(
 @router.get("/{ci_doc}")
 async def get_docente(
     ci_doc: str,
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
+    loaders: DataLoaders = Depends(get_loaders),
     current_user: dict = Depends(get_current_active_user)
 ):
     """
@@ -200,7 +176,7 @@ async def get_docente(
     """
     try:
         # Obtener el docente
-        docente_response = db.table("docente").select("*").eq("ci_doc", ci_doc).execute()
+        docente_response = await db.table("docente").select(COLUMNAS_DOCENTE).eq("ci_doc", ci_doc).execute()
         
         if not docente_response.data:
             raise HTTPException(
@@ -211,24 +187,15 @@ async def get_docente(
         docente = docente_response.data[0]
         
         # Obtener los datos del usuario asociado
-        user_response = db.table("usuario").select("*").eq("id_user", docente["id_user"]).execute()
+        docentes = await _attach_usuarios([docente], loaders)
         
-        if not user_response.data:
+        if not docentes:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Usuario asociado no encontrado"
             )
-            
-        usuario = user_response.data[0]
         
-        # Remover contraseña del usuario
-        usuario_data = {k: v for k, v in usuario.items() if k != "contrasena"}
-        
-        # Combinar los datos
-        return {
-            **docente,
-            "usuario": usuario_data
-        }
+        return docentes[0]
         
     except HTTPException:
         raise
@@ -243,7 +210,8 @@ async def get_docente(
 async def update_docente(
     ci_doc: str,
     docente_data: DocenteUpdate,
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
+    loaders: DataLoaders = Depends(get_loaders),
     current_user: dict = Depends(get_current_active_user)
 ):
     """
@@ -251,7 +219,7 @@ async def update_docente(
     """
     try:
         # 1. Verificar que el docente existe
-        doc_response = db.table("docente").select("*").eq("ci_doc", ci_doc).execute()
+        doc_response = await db.table("docente").select(COLUMNAS_DOCENTE).eq("ci_doc", ci_doc).execute()
         if not doc_response.data:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -273,7 +241,7 @@ async def update_docente(
             update_data["especialidad_doc"] = docente_data.especialidad_doc
             
         if update_data:
-            update_response = db.table("docente").update(update_data).eq("ci_doc", ci_doc).execute()
+            update_response = await db.table("docente").update(update_data).eq("ci_doc", ci_doc).execute()
             if not update_response.data:
                 raise HTTPException(
                     status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -282,33 +250,15 @@ async def update_docente(
             docente = update_response.data[0]
         
         # 4. Obtener datos del usuario asociado
-        user_response = db.table("usuario").select("*").eq("id_user", docente["id_user"]).execute()
-        if not user_response.data:
+        docentes = await _attach_usuarios([docente], loaders)
+        if not docentes:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Usuario asociado no encontrado"
             )
-            
-        usuario = user_response.data[0]
-        usuario_data = {k: v for k, v in usuario.items() if k != "contrasena"}
         
         # 5. Retornar datos actualizados
-        return {
-            **docente,
-            "usuario": usuario_data
-        }
-        
-        # Actualizar
-        update_data = docente_data.dict(exclude_unset=True)
-        response = db.table("docente").update(update_data).eq("ci_doc", ci_doc).execute()
-        
-        if not response.data:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Error al actualizar docente"
-            )
-        
-        return response.data[0]
+        return docentes[0]
         
     except HTTPException:
         raise
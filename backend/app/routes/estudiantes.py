@@ -1,83 +1,57 @@
 """
 Rutas para gestión de estudiantes
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response, UploadFile, File
 from typing import List, Optional
-from supabase import Client
+from postgrest import AsyncPostgrestClient
 
 from app.database import get_db
-from app.models.usuario import Estudiante, EstudianteCreate, EstudianteUpdate, RolEnum
+from app.models.usuario import Estudiante, EstudianteCreate, EstudianteUpdate, RolEnum, ResultadoImportacion
 from app.utils.dependencies import get_current_active_user, require_estudiante, require_admin
-from app.utils.security import get_password_hash
+from app.utils.academico import invalidar_grupo_estudiante
+from app.utils.security import get_password_hash_async
+from app.utils.pagination import paginar, set_next_cursor
+from app.utils.estadisticas import invalidar_todas_las_estadisticas
+from app.utils.exportacion import exportar
+from app.utils.importacion import importar_usuarios, leer_filas, bloques_upload, detectar_formato
+from app.utils.provision import provisionar_usuario, datos_estudiante
+from app.utils.proyeccion import columnas
 
 router = APIRouter(prefix="/estudiantes")
 
+ORDEN_ESTUDIANTES = (("ci_est", False),)
+
+# Estudiante con su usuario embebido (columnas de `Usuario`, sin contraseña)
+COLUMNAS_ESTUDIANTE = columnas(Estudiante)
+
+# Columnas leídas y escritas por la exportación de la lista
+COLUMNAS_EXPORTACION_ESTUDIANTE = "ci_est, carrera, semestre, id_grupo, usuario(nombre, apellido, correo)"
+EXPORTACION_ESTUDIANTES = (
+    ("CI", "ci_est"),
+    ("Nombre", "usuario.nombre"),
+    ("Apellido", "usuario.apellido"),
+    ("Correo", "usuario.correo"),
+    ("Carrera", "carrera"),
+    ("Semestre", "semestre"),
+    ("Grupo", "id_grupo"),
+)
+
 
 @router.post("", response_model=Estudiante, status_code=status.HTTP_201_CREATED)
 async def create_estudiante(
     estudiante_data: EstudianteCreate,
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(require_admin)
 ):
     """
     Crear un nuevo estudiante (solo administradores)
     """
     try:
-        # Verificar que el CI no existe
-        existing_ci = db.table("estudiante").select("ci_est").eq("ci_est", estudiante_data.ci_est).execute()
-        if existing_ci.data:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="El CI ya está registrado"
-            )
-        
-        # Verificar que el correo no existe
-        existing_email = db.table("usuario").select("id_user").eq("correo", estudiante_data.correo).execute()
-        if existing_email.data:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="El correo ya está registrado"
-            )
-        
-        # Crear usuario primero
-        user_dict = {
-            "nombre": estudiante_data.nombre,
-            "apellido": estudiante_data.apellido,
-            "correo": estudiante_data.correo,
-            "contrasena": get_password_hash(estudiante_data.contrasena),
-            "rol": "estudiante",
-            "activo": True
-        }
-        
-        user_response = db.table("usuario").insert(user_dict).execute()
-        if not user_response.data:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Error al crear usuario"
-            )
-        
-        user = user_response.data[0]
-        
-        # Crear estudiante
-        estudiante_dict = {
-            "ci_est": estudiante_data.ci_est,
-            "id_user": user["id_user"],
-            "carrera": estudiante_data.carrera,
-            "semestre": estudiante_data.semestre,
-            "id_grupo": estudiante_data.id_grupo
-        }
+        contrasena_hash = await get_password_hash_async(estudiante_data.contrasena)
+        user_dict, estudiante_dict = datos_estudiante(estudiante_data, contrasena_hash)
         
-        est_response = db.table("estudiante").insert(estudiante_dict).execute()
-        if not est_response.data:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Error al crear estudiante"
-            )
-        
-        estudiante = est_response.data[0]
-        estudiante["usuario"] = {k: v for k, v in user.items() if k != "contrasena"}
-        
-        return estudiante
+        # Verificación de CI/correo e inserción de usuario y estudiante en una transacción
+        return await provisionar_usuario(db, user_dict, estudiante_dict)
         
     except HTTPException:
         raise
@@ -88,31 +62,60 @@ async def create_estudiante(
         )
 
 
+@router.post("/importar", response_model=ResultadoImportacion)
+async def importar_estudiantes(
+    archivo: UploadFile = File(..., description="Archivo CSV (con encabezado), NDJSON o arreglo JSON"),
+    formato: Optional[str] = Query(None, pattern="^(csv|ndjson|json)$", description="Por defecto se deduce de la extensión"),
+    db: AsyncPostgrestClient = Depends(get_db),
+    current_user: dict = Depends(require_admin)
+):
+    """
+    Importar estudiantes de forma masiva (solo administradores)
+
+    Las filas válidas se crean por lotes; las inválidas o repetidas se
+    devuelven en `errores` con su número de fila sin detener la importación.
+    """
+    try:
+        formato = formato or detectar_formato(archivo.filename)
+        return await importar_usuarios(db, "estudiantes", leer_filas(bloques_upload(archivo), formato))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error al importar estudiantes: {str(e)}"
+        )
+
+
 @router.get("", response_model=List[Estudiante])
 async def get_estudiantes(
-    skip: int = Query(0, ge=0),
+    http_response: Response,
+    cursor: Optional[str] = Query(None, description="Cursor de la página siguiente (encabezado X-Next-Cursor)"),
+    skip: int = Query(0, ge=0, deprecated=True),
     limit: int = Query(100, ge=1, le=100),
     carrera: Optional[str] = None,
     semestre: Optional[int] = None,
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """
     Obtener lista de estudiantes
     """
     try:
-        query = db.table("estudiante").select("*, Usuario(*)")
+        query = db.table("estudiante").select(COLUMNAS_ESTUDIANTE)
         
         if carrera:
             query = query.eq("carrera", carrera)
         if semestre:
             query = query.eq("semestre", semestre)
         
-        query = query.range(skip, skip + limit - 1)
-        response = query.execute()
+        response = await paginar(query, ORDEN_ESTUDIANTES, limit, cursor, skip).execute()
+        set_next_cursor(http_response, response.data, ORDEN_ESTUDIANTES, limit)
         
         return response.data
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -120,9 +123,44 @@ async def get_estudiantes(
         )
 
 
+@router.get("/exportar")
+async def exportar_estudiantes(
+    formato: str = Query("csv", pattern="^(csv|xlsx)$"),
+    carrera: Optional[str] = None,
+    semestre: Optional[int] = None,
+    id_grupo: Optional[str] = None,
+    db: AsyncPostgrestClient = Depends(get_db),
+    current_user: dict = Depends(require_admin)
+):
+    """
+    Descargar la lista completa de estudiantes en CSV o XLSX (solo administradores)
+
+    La lista se lee por páginas y se envía a medida que llega.
+    """
+    def consulta():
+        query = db.table("estudiante").select(COLUMNAS_EXPORTACION_ESTUDIANTE)
+        if carrera:
+            query = query.eq("carrera", carrera)
+        if semestre:
+            query = query.eq("semestre", semestre)
+        if id_grupo:
+            query = query.eq("id_grupo", id_grupo)
+        return query
+
+    try:
+        return await exportar(consulta, ORDEN_ESTUDIANTES, EXPORTACION_ESTUDIANTES, formato, "estudiantes")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error al exportar estudiantes: {str(e)}"
+        )
+
+
 @router.get("/me", response_model=Estudiante)
 async def get_my_estudiante_data(
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """
@@ -135,7 +173,7 @@ async def get_my_estudiante_data(
         )
     
     try:
-        response = db.table("estudiante").select("*, Usuario(*)").eq("id_user", current_user["id_user"]).execute()
+        response = await db.table("estudiante").select(COLUMNAS_ESTUDIANTE).eq("id_user", current_user["id_user"]).execute()
         
         if not response.data:
             raise HTTPException(
@@ -157,14 +195,14 @@ async def get_my_estudiante_data(
 @router.get("/{ci_est}", response_model=Estudiante)
 async def get_estudiante(
     ci_est: str,
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """
     Obtener un estudiante por CI
     """
     try:
-        response = db.table("estudiante").select("*, Usuario(*)").eq("ci_est", ci_est).execute()
+        response = await db.table("estudiante").select(COLUMNAS_ESTUDIANTE).eq("ci_est", ci_est).execute()
         
         if not response.data:
             raise HTTPException(
@@ -187,7 +225,7 @@ async def get_estudiante(
 async def update_estudiante(
     ci_est: str,
     estudiante_data: EstudianteUpdate,
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """
@@ -195,7 +233,7 @@ async def update_estudiante(
     """
     try:
         # Verificar que existe
-        existing = db.table("estudiante").select("*").eq("ci_est", ci_est).execute()
+        existing = await db.table("estudiante").select("id_user").eq("ci_est", ci_est).execute()
         if not existing.data:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -213,7 +251,11 @@ async def update_estudiante(
         
         # Actualizar
         update_data = estudiante_data.dict(exclude_unset=True)
-        response = db.table("estudiante").update(update_data).eq("ci_est", ci_est).execute()
+        response = await db.table("estudiante").update(update_data).eq("ci_est", ci_est).execute()
+        if "id_grupo" in update_data:
+            invalidar_grupo_estudiante(estudiante["id_user"])
+            # Sus notas pasan a contar en el desglose de otro grupo
+            await invalidar_todas_las_estadisticas()
         
         if not response.data:
             raise HTTPException(
@@ -1,26 +1,36 @@
 """
 Rutas para gestión de grupos
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from typing import List
-from supabase import Client
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from typing import List, Optional
+from postgrest import AsyncPostgrestClient
 
 from app.database import get_db
 from app.models.academico import Grupo, GrupoCreate, GrupoUpdate
+from app.utils.catalogo import cache_catalogo, invalidar_catalogo
 from app.utils.dependencies import get_current_active_user, require_admin
+from app.utils.pagination import paginar, set_next_cursor
+from app.utils.proyeccion import columnas
 
 router = APIRouter(prefix="/grupos")
 
+ORDEN_GRUPOS = (("id_grupo", False),)
+
+COLUMNAS_GRUPO = columnas(Grupo)
+
+cache_grupos = cache_catalogo("grupos", ("grupo",))
+
 
 @router.post("", response_model=Grupo, status_code=status.HTTP_201_CREATED)
 async def create_grupo(
     grupo_data: GrupoCreate,
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(require_admin)
 ):
     """Crear un nuevo grupo"""
     try:
-        response = db.table("grupo").insert(grupo_data.dict()).execute()
+        response = await db.table("grupo").insert(grupo_data.dict()).execute()
+        await invalidar_catalogo("grupo")
         return response.data[0]
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
@@ -28,15 +38,25 @@ async def create_grupo(
 
 @router.get("", response_model=List[Grupo])
 async def get_grupos(
-    skip: int = Query(0, ge=0),
+    http_response: Response,
+    cursor: Optional[str] = Query(None, description="Cursor de la página siguiente (encabezado X-Next-Cursor)"),
+    skip: int = Query(0, ge=0, deprecated=True),
     limit: int = Query(100, ge=1, le=100),
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Obtener lista de grupos"""
-    try:
-        response = db.table("grupo").select("*").range(skip, skip + limit - 1).execute()
+    async def cargar():
+        query = db.table("grupo").select(COLUMNAS_GRUPO)
+        response = await paginar(query, ORDEN_GRUPOS, limit, cursor, skip).execute()
         return response.data
+
+    try:
+        grupos = await cache_grupos.obtener(("pagina", cursor, skip, limit), cargar)
+        set_next_cursor(http_response, grupos, ORDEN_GRUPOS, limit)
+        return grupos
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
@@ -44,15 +64,19 @@ async def get_grupos(
 @router.get("/{id_grupo}", response_model=Grupo)
 async def get_grupo(
     id_grupo: str,
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Obtener un grupo por ID"""
+    async def cargar():
+        response = await db.table("grupo").select(COLUMNAS_GRUPO).eq("id_grupo", id_grupo).execute()
+        return response.data[0] if response.data else None
+
     try:
-        response = db.table("grupo").select("*").eq("id_grupo", id_grupo).execute()
-        if not response.data:
+        grupo = await cache_grupos.obtener(("id", id_grupo), cargar)
+        if grupo is None:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Grupo no encontrado")
-        return response.data[0]
+        return grupo
     except HTTPException:
         raise
     except Exception as e:
@@ -63,13 +87,14 @@ async def get_grupo(
 async def update_grupo(
     id_grupo: str,
     grupo_data: GrupoUpdate,
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(require_admin)
 ):
     """Actualizar un grupo"""
     try:
         update_data = grupo_data.dict(exclude_unset=True)
-        response = db.table("grupo").update(update_data).eq("id_grupo", id_grupo).execute()
+        response = await db.table("grupo").update(update_data).eq("id_grupo", id_grupo).execute()
+        await invalidar_catalogo("grupo")
         if not response.data:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Grupo no encontrado")
         return response.data[0]
@@ -2,34 +2,86 @@
 Rutas para gestión de horarios
 """
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from typing import List
-from datetime import datetime
-from supabase import Client
+from typing import List, Optional
+from datetime import datetime, time
+from postgrest import AsyncPostgrestClient
 
 from app.database import get_db
-from app.models.academico import Horario, HorarioCreate, HorarioUpdate
+from app.models.academico import (
+    AulasLibres,
+    DiaSemanaEnum,
+    Horario,
+    HorarioCreate,
+    HorarioUpdate,
+    HorarioSemanal,
+    ResultadoValidacionHorarios
+)
+from app.utils.academico import (
+    grupo_del_estudiante,
+    horarios_del_grupo,
+    horario_semanal,
+    invalidar_horarios_grupo
+)
 from app.utils.dependencies import get_current_active_user, require_docente_or_admin
+from app.utils.exportacion import exportar
+from app.utils.ocupacion import CAMPOS_HORARIO, a_segundos, ahora, indice_horarios, validar_horarios
 
 router = APIRouter(prefix="/horarios")
 
+# Hora "HH:MM" o "HH:MM:SS" en los parámetros de consulta
+PATRON_HORA = r"^([01]\d|2[0-3]):[0-5]\d(:[0-5]\d)?$"
+
+# Exportación de horarios: agrupados por grupo (dia_semana es texto, su orden no es el de la semana)
+EXPORTACION_HORARIOS = (
+    ("Grupo", "id_grupo"),
+    ("Día", "dia_semana"),
+    ("Inicio", "hora_inicio"),
+    ("Fin", "hora_fin"),
+    ("Aula", "aula"),
+    ("Origen", "origen"),
+)
+ORDEN_EXPORTACION_HORARIOS = (("id_grupo", False), ("id_horario", False))
+
+
+def _error_conflictos(conflictos: List[dict]) -> HTTPException:
+    """Error 409 con los horarios que ocupan la misma aula o el mismo grupo"""
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail={
+            "mensaje": "El horario se superpone con otros en la misma aula o el mismo grupo",
+            "conflictos": conflictos
+        }
+    )
+
 
 @router.post("", response_model=Horario, status_code=status.HTTP_201_CREATED)
 async def create_horario(
     horario_data: HorarioCreate,
-    db: Client = Depends(get_db),
+    forzar: bool = Query(False, description="Guardar aunque se superponga con otros horarios"),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(require_docente_or_admin)
 ):
-    """Crear un nuevo horario"""
+    """Crear un nuevo horario (409 si el aula o el grupo ya están ocupados a esa hora)"""
     try:
-        response = db.table("horario").insert(horario_data.dict()).execute()
+        horario_dict = horario_data.dict()
+        await indice_horarios.asegurar(db)
+        async with indice_horarios.escritura:
+            conflictos = indice_horarios.conflictos(horario_dict)
+            if conflictos and not forzar:
+                raise _error_conflictos(conflictos)
+            response = await db.table("horario").insert(horario_dict).execute()
+            indice_horarios.registrar(response.data[0])
+        await invalidar_horarios_grupo(response.data[0]["id_grupo"])
         return response.data[0]
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
 
 @router.get("/mi-horario", response_model=List[Horario])
 async def get_my_horario(
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Obtener horario del estudiante actual"""
@@ -37,16 +89,114 @@ async def get_my_horario(
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Solo para estudiantes")
     
     try:
-        # Obtener grupo del estudiante
-        est_response = db.table("estudiante").select("id_grupo").eq("id_user", current_user["id_user"]).execute()
-        if not est_response.data or not est_response.data[0].get("id_grupo"):
+        id_grupo = await grupo_del_estudiante(db, current_user["id_user"])
+        if not id_grupo:
             return []
+        return await horarios_del_grupo(db, id_grupo)
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+@router.get("/mi-horario/semana", response_model=HorarioSemanal)
+async def get_my_horario_semanal(
+    db: AsyncPostgrestClient = Depends(get_db),
+    current_user: dict = Depends(get_current_active_user)
+):
+    """Obtener el horario semanal del estudiante actual como grilla días × franjas"""
+    if current_user["rol"] != "estudiante":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Solo para estudiantes")
+    
+    try:
+        id_grupo = await grupo_del_estudiante(db, current_user["id_user"])
+        if not id_grupo:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="El estudiante no tiene grupo asignado")
+        return await horario_semanal(db, id_grupo)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+@router.get("/aulas-libres", response_model=AulasLibres)
+async def get_aulas_libres(
+    dia: DiaSemanaEnum,
+    desde: str = Query(..., pattern=PATRON_HORA, description="Hora de inicio (HH:MM)"),
+    hasta: str = Query(..., pattern=PATRON_HORA, description="Hora de fin (HH:MM)"),
+    db: AsyncPostgrestClient = Depends(get_db),
+    current_user: dict = Depends(get_current_active_user)
+):
+    """Aulas sin ninguna clase entre `desde` y `hasta` el día indicado"""
+    if a_segundos(hasta) <= a_segundos(desde):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="La hora de fin debe ser posterior a la hora de inicio"
+        )
+    
+    try:
+        await indice_horarios.asegurar(db)
+        return {
+            "dia_semana": dia,
+            "hora_inicio": desde,
+            "hora_fin": hasta,
+            "aulas": indice_horarios.aulas_libres(dia, desde, hasta)
+        }
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+@router.get("/en-curso", response_model=List[Horario])
+async def get_horarios_en_curso(
+    id_grupo: Optional[str] = Query(None, description="Grupo consultado (por defecto, el del estudiante actual)"),
+    db: AsyncPostgrestClient = Depends(get_db),
+    current_user: dict = Depends(get_current_active_user)
+):
+    """Clases del grupo que se están dictando ahora (hora de `TIMEZONE`)"""
+    try:
+        if id_grupo is None:
+            if current_user["rol"] != "estudiante":
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Indique id_grupo (solo los estudiantes tienen un grupo propio)"
+                )
+            id_grupo = await grupo_del_estudiante(db, current_user["id_user"])
+            if not id_grupo:
+                return []
         
-        id_grupo = est_response.data[0]["id_grupo"]
-        
-        # Obtener horarios del grupo
-        response = db.table("horario").select("*").eq("id_grupo", id_grupo).order("dia_semana, hora_inicio").execute()
-        return response.data
+        dia, hora = ahora()
+        if dia is None:
+            return []
+        await indice_horarios.asegurar(db)
+        return indice_horarios.en_curso(id_grupo, dia, hora)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+@router.get("/exportar")
+async def exportar_horarios(
+    formato: str = Query("csv", pattern="^(csv|xlsx)$"),
+    id_grupo: Optional[str] = None,
+    dia: Optional[DiaSemanaEnum] = None,
+    aula: Optional[str] = None,
+    db: AsyncPostgrestClient = Depends(get_db),
+    current_user: dict = Depends(require_docente_or_admin)
+):
+    """Descargar los horarios (todos o filtrados por grupo, día o aula) en CSV o XLSX"""
+    def consulta():
+        query = db.table("horario").select(", ".join(CAMPOS_HORARIO))
+        if id_grupo:
+            query = query.eq("id_grupo", id_grupo)
+        if dia:
+            query = query.eq("dia_semana", dia.value)
+        if aula:
+            query = query.eq("aula", aula)
+        return query
+
+    try:
+        return await exportar(consulta, ORDEN_EXPORTACION_HORARIOS, EXPORTACION_HORARIOS, formato, "horarios")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
@@ -54,13 +204,25 @@ async def get_my_horario(
 @router.get("/grupo/{id_grupo}", response_model=List[Horario])
 async def get_horario_grupo(
     id_grupo: str,
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Obtener horarios de un grupo específico"""
     try:
-        response = db.table("horario").select("*").eq("id_grupo", id_grupo).order("dia_semana, hora_inicio").execute()
-        return response.data
+        return await horarios_del_grupo(db, id_grupo)
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+@router.get("/grupo/{id_grupo}/semana", response_model=HorarioSemanal)
+async def get_horario_semanal_grupo(
+    id_grupo: str,
+    db: AsyncPostgrestClient = Depends(get_db),
+    current_user: dict = Depends(get_current_active_user)
+):
+    """Obtener el horario semanal de un grupo como grilla días × franjas"""
+    try:
+        return await horario_semanal(db, id_grupo)
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
@@ -69,13 +231,14 @@ async def get_horario_grupo(
 async def update_horario(
     id_horario: str,
     horario_data: HorarioUpdate,
-    db: Client = Depends(get_db),
+    forzar: bool = Query(False, description="Guardar aunque se superponga con otros horarios"),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(require_docente_or_admin)
 ):
-    """Actualizar un horario"""
+    """Actualizar un horario (409 si el aula o el grupo ya están ocupados a esa hora)"""
     try:
         # Primero verificamos si el horario existe
-        existing = db.table("horario").select("*").eq("id_horario", id_horario).execute()
+        existing = await db.table("horario").select(", ".join(CAMPOS_HORARIO)).eq("id_horario", id_horario).execute()
         if not existing.data:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Horario no encontrado")
 
@@ -102,11 +265,29 @@ async def update_horario(
                                 status_code=status.HTTP_400_BAD_REQUEST,
                                 detail=f"Formato inválido para {field}. Use HH:MM:SS"
                             )
+                elif isinstance(value, time):
+                    update_data[field] = value.strftime('%H:%M:%S')
             else:
                 update_data[field] = value
 
+        # El bloque resultante debe seguir siendo válido y no chocar con otros
+        horario = {**existing.data[0], **update_data}
+        if horario["hora_fin"] <= horario["hora_inicio"]:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="La hora de fin debe ser posterior a la hora de inicio"
+            )
+
         # Realizar la actualización
-        response = db.table("horario").update(update_data).eq("id_horario", id_horario).execute()
+        await indice_horarios.asegurar(db)
+        async with indice_horarios.escritura:
+            conflictos = indice_horarios.conflictos(horario, ignorar=id_horario)
+            if conflictos and not forzar:
+                raise _error_conflictos(conflictos)
+            response = await db.table("horario").update(update_data).eq("id_horario", id_horario).execute()
+            indice_horarios.registrar(response.data[0])
+        # Si cambió de grupo se invalidan ambos
+        await invalidar_horarios_grupo(existing.data[0]["id_grupo"], response.data[0]["id_grupo"])
         return response.data[0]
     except HTTPException:
         raise
@@ -117,12 +298,38 @@ async def update_horario(
 @router.delete("/{id_horario}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_horario(
     id_horario: str,
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(require_docente_or_admin)
 ):
     """Eliminar un horario"""
     try:
-        db.table("horario").delete().eq("id_horario", id_horario).execute()
+        response = await db.table("horario").delete().eq("id_horario", id_horario).execute()
+        for horario in response.data:
+            indice_horarios.quitar(horario["id_horario"])
+        await invalidar_horarios_grupo(*(h["id_grupo"] for h in response.data))
         return None
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+@router.post("/validar", response_model=ResultadoValidacionHorarios)
+async def validar_lote_horarios(
+    horarios: List[HorarioCreate],
+    contra_existentes: bool = Query(True, description="Comparar también con los horarios ya guardados"),
+    db: AsyncPostgrestClient = Depends(get_db),
+    current_user: dict = Depends(require_docente_or_admin)
+):
+    """
+    Validar un lote de horarios (por ejemplo, el semestre importado del SIU)
+    sin guardarlo: informa cada fila que choca con otra del lote o con un
+    horario existente en la misma aula o el mismo grupo
+    """
+    try:
+        base = None
+        if contra_existentes:
+            await indice_horarios.asegurar(db)
+            base = indice_horarios
+        filas = validar_horarios([h.dict() for h in horarios], base)
+        return {"total": len(horarios), "con_conflictos": len(filas), "filas": filas}
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
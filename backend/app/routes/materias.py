@@ -1,26 +1,37 @@
 """
 Rutas para gestión de materias
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from typing import List, Optional
-from supabase import Client
+from postgrest import AsyncPostgrestClient
 
 from app.database import get_db
 from app.models.academico import Materia, MateriaCreate, MateriaUpdate
+from app.utils.academico import grupo_del_estudiante, materias_del_grupo
+from app.utils.catalogo import cache_catalogo, invalidar_catalogo
 from app.utils.dependencies import get_current_active_user, require_docente_or_admin
+from app.utils.pagination import paginar, set_next_cursor
+from app.utils.proyeccion import columnas
 
 router = APIRouter(prefix="/materias")
 
+ORDEN_MATERIAS = (("id_materia", False),)
+
+COLUMNAS_MATERIA = columnas(Materia, excluir=("docente",))
+
+cache_materias = cache_catalogo("materias", ("materia",))
+
 
 @router.post("", response_model=Materia, status_code=status.HTTP_201_CREATED)
 async def create_materia(
     materia_data: MateriaCreate,
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(require_docente_or_admin)
 ):
     """Crear una nueva materia"""
     try:
-        response = db.table("materia").insert(materia_data.dict()).execute()
+        response = await db.table("materia").insert(materia_data.dict()).execute()
+        await invalidar_catalogo("materia")
         return response.data[0]
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
@@ -28,22 +39,32 @@ async def create_materia(
 
 @router.get("", response_model=List[Materia])
 async def get_materias(
-    skip: int = Query(0, ge=0),
+    http_response: Response,
+    cursor: Optional[str] = Query(None, description="Cursor de la página siguiente (encabezado X-Next-Cursor)"),
+    skip: int = Query(0, ge=0, deprecated=True),
     limit: int = Query(100, ge=1, le=100),
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Obtener lista de materias"""
-    try:
-        response = db.table("materia").select("*").range(skip, skip + limit - 1).execute()
+    async def cargar():
+        query = db.table("materia").select(COLUMNAS_MATERIA)
+        response = await paginar(query, ORDEN_MATERIAS, limit, cursor, skip).execute()
         return response.data
+
+    try:
+        materias = await cache_materias.obtener(("pagina", cursor, skip, limit), cargar)
+        set_next_cursor(http_response, materias, ORDEN_MATERIAS, limit)
+        return materias
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
 
 @router.get("/mis-materias", response_model=List[Materia])
 async def get_my_materias(
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Obtener materias del estudiante actual"""
@@ -51,17 +72,10 @@ async def get_my_materias(
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Solo para estudiantes")
     
     try:
-        # Obtener grupo del estudiante
-        est_response = db.table("estudiante").select("id_grupo").eq("id_user", current_user["id_user"]).execute()
-        if not est_response.data or not est_response.data[0].get("id_grupo"):
+        id_grupo = await grupo_del_estudiante(db, current_user["id_user"])
+        if not id_grupo:
             return []
-        
-        id_grupo = est_response.data[0]["id_grupo"]
-        
-        # Obtener materias del grupo
-        response = db.table("grupomateria").select("Materia(*)").eq("id_grupo", id_grupo).execute()
-        materias = [item["Materia"] for item in response.data if item.get("Materia")]
-        return materias
+        return await materias_del_grupo(db, id_grupo)
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
@@ -69,15 +83,19 @@ async def get_my_materias(
 @router.get("/{id_materia}", response_model=Materia)
 async def get_materia(
     id_materia: str,
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Obtener una materia por ID"""
+    async def cargar():
+        response = await db.table("materia").select(COLUMNAS_MATERIA).eq("id_materia", id_materia).execute()
+        return response.data[0] if response.data else None
+
     try:
-        response = db.table("materia").select("*").eq("id_materia", id_materia).execute()
-        if not response.data:
+        materia = await cache_materias.obtener(("id", id_materia), cargar)
+        if materia is None:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Materia no encontrada")
-        return response.data[0]
+        return materia
     except HTTPException:
         raise
     except Exception as e:
@@ -88,13 +106,14 @@ async def get_materia(
 async def update_materia(
     id_materia: str,
     materia_data: MateriaUpdate,
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(require_docente_or_admin)
 ):
     """Actualizar una materia"""
     try:
         update_data = materia_data.dict(exclude_unset=True)
-        response = db.table("materia").update(update_data).eq("id_materia", id_materia).execute()
+        response = await db.table("materia").update(update_data).eq("id_materia", id_materia).execute()
+        await invalidar_catalogo("materia")
         if not response.data:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Materia no encontrada")
         return response.data[0]
@@ -1,25 +1,47 @@
 """
 Rutas para gestión de mensajes y conversaciones
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from typing import List
-from supabase import Client
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from typing import Dict, List, Optional
+from collections import Counter
+from datetime import datetime, timezone
+import asyncio
+import logging
+from postgrest import AsyncPostgrestClient
+from postgrest.types import CountMethod
 
-from app.database import get_db
+from app.database import get_db, rpc_no_disponible
 from app.models.mensajeria import (
     Conversacion, ConversacionCreate,
     Mensaje, MensajeCreate,
     MensajesNoLeidos
 )
-from app.utils.dependencies import get_current_active_user
+from app.models.usuario import UsuarioPublico
+from app.utils.bulk import insertar_con_hijos
+from app.utils.dependencies import get_current_active_user, get_loaders
+from app.utils.loaders import DataLoaders
+from app.utils.pagination import paginar, set_next_cursor
+from app.utils.proyeccion import columnas
 
 router = APIRouter(prefix="/mensajes")
 
+# Los mensajes de una conversación se leen en orden cronológico
+ORDEN_MENSAJES = (("fecha_envio", False), ("id_mensaje", False))
+
+# Mensaje con su autor (datos públicos) y conversación sin los campos calculados
+COLUMNAS_MENSAJE = columnas(Mensaje, usuario=UsuarioPublico)
+COLUMNAS_CONVERSACION = columnas(
+    Conversacion,
+    excluir=("participantes", "ultimo_mensaje", "mensajes_no_leidos")
+)
+
+logger = logging.getLogger(__name__)
+
 
 @router.post("/conversaciones", response_model=Conversacion, status_code=status.HTTP_201_CREATED)
 async def create_conversacion(
     conv_data: ConversacionCreate,
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Crear una nueva conversación"""
@@ -38,89 +60,131 @@ async def create_conversacion(
                 detail="Debe proporcionar al menos un participante además del usuario actual"
             )
 
-        # Crear conversación
+        # Crear conversación y participantes en una sola transacción
         conv_dict = {"tipo": conv_data.tipo.value, "nombre": conv_data.nombre}
-        response = db.table("conversacion").insert(conv_dict).execute()
-        conversacion = response.data[0]
-        
-        # Agregar participantes
-        for id_usuario in participantes:
-            user_conv = {
+        miembros = [
+            {
                 "id_usuario": id_usuario,
-                "id_conversacion": conversacion["id_conversacion"],
                 "rol": "admin" if id_usuario == current_user["id_user"] else "miembro"
             }
-            db.table("usuarioconversacion").insert(user_conv).execute()
-        
-        return conversacion
+            for id_usuario in dict.fromkeys(participantes)
+        ]
+        return await insertar_con_hijos(
+            db, "crear_conversacion",
+            "conversacion", conv_dict, "id_conversacion",
+            "usuarioconversacion", miembros
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
 
-@router.get("/conversaciones", response_model=List[Conversacion])
-async def get_my_conversaciones(
-    db: Client = Depends(get_db),
-    current_user: dict = Depends(get_current_active_user)
-):
-    """Obtener conversaciones del usuario actual"""
-    try:
-        # Obtener directamente las conversaciones donde el usuario actual es participante
-        query = db.table("usuarioconversacion")\
-            .select(
-                "conversacion:conversacion(*), usuario:usuario(id_user, nombre, apellido, foto_perfil)"
-            )\
-            .eq("id_usuario", current_user["id_user"])\
-            .execute()
+def _ultima_actividad(conv: dict) -> datetime:
+    """Fecha del último mensaje o, si no hay, de creación (el orden de `resumen_conversaciones`)"""
+    valor = (conv.get("ultimo_mensaje") or {}).get("fecha_envio") or conv.get("fecha_creacion")
+    if not valor:
+        return datetime.min.replace(tzinfo=timezone.utc)
+    fecha = valor if isinstance(valor, datetime) else datetime.fromisoformat(str(valor).replace('Z', '+00:00'))
+    return fecha if fecha.tzinfo else fecha.replace(tzinfo=timezone.utc)
 
-        if not query.data:
-            return []
 
-        # Procesar las conversaciones
-        resultado = []
-        conv_processed = set()  # Para evitar duplicados
+async def _resumen_por_lotes(
+    db: AsyncPostgrestClient,
+    loaders: DataLoaders,
+    id_user: str
+) -> List[dict]:
+    """
+    Resumen de la bandeja armado con consultas por lotes
 
-        for item in query.data:
-            if not item.get("conversacion") or item["conversacion"]["id_conversacion"] in conv_processed:
-                continue
+    Se usa cuando la función `resumen_conversaciones` aún no existe en la base de datos.
+    """
+    # Obtener directamente las conversaciones donde el usuario actual es participante
+    query = await db.table("usuarioconversacion")\
+        .select(f"conversacion({COLUMNAS_CONVERSACION})")\
+        .eq("id_usuario", id_user)\
+        .execute()
 
-            conv = item["conversacion"]
-            conv_id = conv["id_conversacion"]
-            conv_processed.add(conv_id)
+    if not query.data:
+        return []
 
-            # Obtener otros participantes
-            otros_participantes = db.table("usuarioconversacion")\
-                .select("usuario:usuario(id_user, nombre, apellido, foto_perfil)")\
-                .eq("id_conversacion", conv_id)\
-                .execute()
+    # Procesar las conversaciones
+    conversaciones = []
+    conv_processed = set()  # Para evitar duplicados
 
-            conv["participantes"] = [
-                p["usuario"] for p in otros_participantes.data 
-                if p.get("usuario") and p["usuario"]["id_user"] != current_user["id_user"]
-            ]
+    for item in query.data:
+        if not item.get("conversacion") or item["conversacion"]["id_conversacion"] in conv_processed:
+            continue
+
+        conv = item["conversacion"]
+        conv_processed.add(conv["id_conversacion"])
+        conversaciones.append(conv)
+
+    # Participantes y mensajes no leídos de todas las conversaciones en un lote cada uno
+    participantes_loader = loaders.get(
+        "usuarioconversacion", "id_conversacion",
+        select=f"id_conversacion, usuario({columnas(UsuarioPublico)})",
+        many=True
+    )
+    no_leidos_loader = loaders.get(
+        "mensaje", "id_conversacion",
+        select="id_conversacion",
+        many=True,
+        filters=(("eq", "leido", False), ("neq", "id_user", id_user))
+    )
+
+    conv_ids = [conv["id_conversacion"] for conv in conversaciones]
+
+    # El último mensaje no se puede pedir con `.in_()`; se consulta en paralelo
+    async def ultimo_mensaje(conv_id: str):
+        response = await db.table("mensaje")\
+            .select(COLUMNAS_MENSAJE)\
+            .eq("id_conversacion", conv_id)\
+            .order("fecha_envio", desc=True)\
+            .limit(1)\
+            .execute()
+        return response.data[0] if response.data else None
 
-            # Obtener último mensaje
-            ultimo_mensaje = db.table("mensaje")\
-                .select("*, usuario:usuario(nombre, apellido)")\
-                .eq("id_conversacion", conv_id)\
-                .order("fecha_envio", desc=True)\
-                .limit(1)\
-                .execute()
+    participantes, no_leidos, ultimos = await asyncio.gather(
+        participantes_loader.load_many(conv_ids),
+        no_leidos_loader.load_many(conv_ids),
+        asyncio.gather(*(ultimo_mensaje(conv_id) for conv_id in conv_ids))
+    )
 
-            conv["ultimo_mensaje"] = ultimo_mensaje.data[0] if ultimo_mensaje.data else None
+    for conv, miembros, pendientes, ultimo in zip(conversaciones, participantes, no_leidos, ultimos):
+        conv["participantes"] = [
+            p["usuario"] for p in miembros
+            if p.get("usuario") and p["usuario"]["id_user"] != id_user
+        ]
+        conv["ultimo_mensaje"] = ultimo
+        conv["mensajes_no_leidos"] = len(pendientes)
 
-            # Contar mensajes no leídos
-            mensajes_no_leidos = db.table("mensaje")\
-                .select("id_mensaje")\
-                .eq("id_conversacion", conv_id)\
-                .eq("leido", False)\
-                .neq("id_user", current_user["id_user"])\
-                .execute()
+    # Mismo orden que la función: la conversación con actividad más reciente primero
+    conversaciones.sort(key=_ultima_actividad, reverse=True)
+    return conversaciones
 
-            conv["mensajes_no_leidos"] = len(mensajes_no_leidos.data)
 
-            resultado.append(conv)
+@router.get("/conversaciones", response_model=List[Conversacion])
+async def get_my_conversaciones(
+    db: AsyncPostgrestClient = Depends(get_db),
+    loaders: DataLoaders = Depends(get_loaders),
+    current_user: dict = Depends(get_current_active_user)
+):
+    """Obtener conversaciones del usuario actual"""
+    try:
+        # Participantes, último mensaje y no leídos se calculan en la base de datos en una sola llamada
+        try:
+            response = await db.rpc(
+                "resumen_conversaciones",
+                {"p_id_user": current_user["id_user"]}
+            ).execute()
+            return response.data
+        except Exception as e:
+            if not rpc_no_disponible(e):
+                raise
+            logger.warning("Función resumen_conversaciones no disponible, usando consultas por lotes")
 
-        return resultado
+        return await _resumen_por_lotes(db, loaders, current_user["id_user"])
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
@@ -128,14 +192,14 @@ async def get_my_conversaciones(
 @router.post("", response_model=Mensaje, status_code=status.HTTP_201_CREATED)
 async def send_mensaje(
     mensaje_data: MensajeCreate,
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Enviar un mensaje"""
     try:
         msg_dict = mensaje_data.dict()
         msg_dict["id_user"] = current_user["id_user"]
-        response = db.table("mensaje").insert(msg_dict).execute()
+        response = await db.table("mensaje").insert(msg_dict).execute()
         return response.data[0]
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
@@ -144,25 +208,26 @@ async def send_mensaje(
 @router.get("/conversacion/{id_conversacion}", response_model=List[Mensaje])
 async def get_mensajes_conversacion(
     id_conversacion: str,
-    skip: int = Query(0, ge=0),
+    http_response: Response,
+    cursor: Optional[str] = Query(None, description="Cursor de la página siguiente (encabezado X-Next-Cursor)"),
+    skip: int = Query(0, ge=0, deprecated=True),
     limit: int = Query(50, ge=1, le=100),
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Obtener mensajes de una conversación"""
     try:
         # Verificar que el usuario está en la conversación
-        user_conv = db.table("usuarioconversacion").select("*").eq("id_conversacion", id_conversacion).eq("id_usuario", current_user["id_user"]).execute()
+        user_conv = await db.table("usuarioconversacion").select("id_conversacion").eq("id_conversacion", id_conversacion).eq("id_usuario", current_user["id_user"]).execute()
         if not user_conv.data:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="No tienes acceso a esta conversación")
         
         # Obtener mensajes
-        response = db.table("mensaje")\
-            .select("*, usuario:usuario(nombre, apellido, foto_perfil)")\
-            .eq("id_conversacion", id_conversacion)\
-            .order("fecha_envio")\
-            .range(skip, skip + limit - 1)\
-            .execute()
+        query = db.table("mensaje")\
+            .select(COLUMNAS_MENSAJE)\
+            .eq("id_conversacion", id_conversacion)
+        response = await paginar(query, ORDEN_MENSAJES, limit, cursor, skip).execute()
+        set_next_cursor(http_response, response.data, ORDEN_MENSAJES, limit)
         return response.data
     except HTTPException:
         raise
@@ -173,12 +238,12 @@ async def get_mensajes_conversacion(
 @router.put("/{id_mensaje}/leer", response_model=Mensaje)
 async def marcar_mensaje_leido(
     id_mensaje: str,
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Marcar un mensaje como leído"""
     try:
-        response = db.table("mensaje").update({"leido": True}).eq("id_mensaje", id_mensaje).execute()
+        response = await db.table("mensaje").update({"leido": True}).eq("id_mensaje", id_mensaje).execute()
         if not response.data:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Mensaje no encontrado")
         return response.data[0]
@@ -188,26 +253,82 @@ async def marcar_mensaje_leido(
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
 
+async def _ids_conversaciones(db: AsyncPostgrestClient, id_user: str) -> List[str]:
+    """IDs de las conversaciones en las que participa el usuario"""
+    user_convs = await db.table("usuarioconversacion").select("id_conversacion").eq("id_usuario", id_user).execute()
+    return [uc["id_conversacion"] for uc in user_convs.data]
+
+
+async def _no_leidos_por_conversacion(db: AsyncPostgrestClient, id_user: str) -> Dict[str, int]:
+    """
+    Cantidad de mensajes no leídos por conversación (solo las que tienen alguno)
+
+    Usa la función SQL `contar_mensajes_no_leidos` (agrupa en Postgres); si aún
+    no existe, descarga solo la columna `id_conversacion` y agrupa aquí.
+    """
+    try:
+        response = await db.rpc("contar_mensajes_no_leidos", {"p_id_user": id_user}).execute()
+        return {fila["id_conversacion"]: fila["no_leidos"] for fila in response.data}
+    except Exception as e:
+        if not rpc_no_disponible(e):
+            raise
+        logger.warning("Función contar_mensajes_no_leidos no disponible, se agrupa en la API")
+
+    conv_ids = await _ids_conversaciones(db, id_user)
+    if not conv_ids:
+        return {}
+
+    response = await db.table("mensaje")\
+        .select("id_conversacion")\
+        .in_("id_conversacion", conv_ids)\
+        .eq("leido", False)\
+        .neq("id_user", id_user)\
+        .execute()
+    return dict(Counter(m["id_conversacion"] for m in response.data))
+
+
 @router.get("/no-leidos", response_model=MensajesNoLeidos)
 async def get_mensajes_no_leidos(
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
-    """Obtener contador de mensajes no leídos"""
+    """Obtener contador de mensajes no leídos, desglosado por conversación"""
     try:
-        # Obtener conversaciones del usuario
-        user_convs = db.table("usuarioconversacion").select("id_conversacion").eq("id_usuario", current_user["id_user"]).execute()
-        conv_ids = [uc["id_conversacion"] for uc in user_convs.data]
-        
-        if not conv_ids:
-            return {"total_no_leidos": 0, "conversaciones": []}
-        
-        # Contar mensajes no leídos
-        response = db.table("mensaje").select("*").in_("id_conversacion", conv_ids).eq("leido", False).neq("id_user", current_user["id_user"]).execute()
-        
+        por_conversacion = await _no_leidos_por_conversacion(db, current_user["id_user"])
         return {
-            "total_no_leidos": len(response.data),
-            "conversaciones": []  # TODO: agrupar por conversación
+            "total_no_leidos": sum(por_conversacion.values()),
+            "conversaciones": [
+                {"id_conversacion": conv_id, "no_leidos": cantidad}
+                for conv_id, cantidad in por_conversacion.items()
+            ]
         }
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+@router.get("/no-leidos/contador", response_model=MensajesNoLeidos)
+async def contar_mensajes_no_leidos(
+    db: AsyncPostgrestClient = Depends(get_db),
+    current_user: dict = Depends(get_current_active_user)
+):
+    """
+    Total de mensajes no leídos para el indicador (badge)
+
+    Solo transfiere el conteo: `count=exact` con `limit(0)` devuelve un cuerpo vacío
+    y el total en `Content-Range` (postgrest-py no lee el conteo de las respuestas HEAD).
+    """
+    try:
+        conv_ids = await _ids_conversaciones(db, current_user["id_user"])
+        if not conv_ids:
+            return {"total_no_leidos": 0, "conversaciones": []}
+
+        response = await db.table("mensaje")\
+            .select("id_mensaje", count=CountMethod.exact)\
+            .in_("id_conversacion", conv_ids)\
+            .eq("leido", False)\
+            .neq("id_user", current_user["id_user"])\
+            .limit(0)\
+            .execute()
+        return {"total_no_leidos": response.count or 0, "conversaciones": []}
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
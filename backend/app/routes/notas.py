@@ -1,34 +1,112 @@
 """
 Rutas para gestión de notas
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from typing import List
-from supabase import Client
+from fastapi import APIRouter, Depends, File, HTTPException, status, Query, UploadFile
+from typing import List, Optional
+import asyncio
+from postgrest import AsyncPostgrestClient
 
-from app.database import get_db
-from app.models.academico import Nota, NotaCreate, NotaUpdate
-from app.utils.dependencies import get_current_active_user, require_docente_or_admin
+from app.database import get_db, rpc_no_disponible
+from app.models.academico import (
+    EstadisticasMateria,
+    Expediente,
+    Nota,
+    NotaCreate,
+    NotaUpdate,
+    Materia,
+    ResultadoCargaNotas
+)
+from app.utils.academico import materias_del_grupo
+from app.utils.carga_notas import cargar_notas
+from app.utils.dependencies import get_current_active_user, require_admin, require_docente_or_admin
+from app.utils.estadisticas import estadisticas_materia, invalidar_estadisticas
+from app.utils.exportacion import exportar
+from app.utils.expediente import (
+    actualizar_nota,
+    ajustar_expediente,
+    expediente_estudiante,
+    reconciliar_expediente
+)
+from app.utils.importacion import bloques_upload, detectar_formato, leer_filas
+from app.utils.proyeccion import columnas
 
 router = APIRouter(prefix="/notas")
 
+# Nota con su materia embebida
+COLUMNAS_NOTA = columnas(
+    Nota,
+    excluir=("usuario",),
+    materia=columnas(Materia, excluir=("docente",))
+)
+
+# Nota con el estudiante que la recibió, para la exportación por materia
+COLUMNAS_EXPORTACION_NOTA = (
+    "id_nota, tipo_nota, nota, origen, fecha_registro_nota, "
+    "usuario(nombre, apellido, estudiante(ci_est, id_grupo))"
+)
+EXPORTACION_NOTAS = (
+    ("CI", "usuario.estudiante.ci_est"),
+    ("Nombre", "usuario.nombre"),
+    ("Apellido", "usuario.apellido"),
+    ("Grupo", "usuario.estudiante.id_grupo"),
+    ("Tipo de nota", "tipo_nota"),
+    ("Nota", "nota"),
+    ("Origen", "origen"),
+    ("Fecha de registro", "fecha_registro_nota"),
+)
+ORDEN_EXPORTACION_NOTAS = (("tipo_nota", False), ("id_nota", False))
+
 
 @router.post("", response_model=Nota, status_code=status.HTTP_201_CREATED)
 async def create_nota(
     nota_data: NotaCreate,
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(require_docente_or_admin)
 ):
     """Crear una nueva nota"""
     try:
-        response = db.table("nota").insert(nota_data.dict()).execute()
-        return response.data[0]
+        response = await db.table("nota").insert(nota_data.dict()).execute()
+        nota = response.data[0]
+        await ajustar_expediente(db, nota["id_user"], nota["id_materia"], 1, nota["nota"])
+        await invalidar_estadisticas(nota["id_materia"])
+        return nota
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+@router.post("/carga-masiva", response_model=ResultadoCargaNotas)
+async def carga_masiva_notas(
+    id_materia: str = Query(..., description="Materia de todas las notas del archivo"),
+    tipo_nota: str = Query(..., min_length=2, max_length=50, description="Tipo de todas las notas (ej. Parcial 1)"),
+    id_grupo: Optional[str] = Query(None, description="Grupo cuya lista se verifica (por defecto, todos los de la materia)"),
+    archivo: UploadFile = File(..., description="CSV (con encabezado), NDJSON o arreglo JSON con id_user o ci_est y nota"),
+    formato: Optional[str] = Query(None, pattern="^(csv|ndjson|json)$", description="Por defecto se deduce de la extensión"),
+    db: AsyncPostgrestClient = Depends(get_db),
+    current_user: dict = Depends(require_docente_or_admin)
+):
+    """
+    Cargar las notas de un tipo para toda una materia (o un grupo)
+
+    Si el estudiante ya tiene una nota de ese tipo en la materia se reemplaza.
+    Cada fila del archivo aparece en `filas` como creada, actualizada o
+    rechazada (con sus errores) sin detener la carga.
+    """
+    try:
+        formato = formato or detectar_formato(archivo.filename)
+        return await cargar_notas(
+            db, id_materia, tipo_nota,
+            leer_filas(bloques_upload(archivo), formato),
+            id_grupo=id_grupo
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
 
 @router.get("/mis-notas", response_model=List[Nota])
 async def get_my_notas(
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Obtener notas del estudiante actual"""
@@ -36,40 +114,150 @@ async def get_my_notas(
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Solo para estudiantes")
     
     try:
-        response = db.table("nota").select("*, materia(*)").eq("id_user", current_user["id_user"]).execute()
+        response = await db.table("nota").select(COLUMNAS_NOTA).eq("id_user", current_user["id_user"]).execute()
         return response.data
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
 
+@router.get("/mi-expediente", response_model=Expediente)
+async def get_my_expediente(
+    db: AsyncPostgrestClient = Depends(get_db),
+    current_user: dict = Depends(get_current_active_user)
+):
+    """Promedio por materia, cantidad de evaluaciones y promedios generales del estudiante actual"""
+    if current_user["rol"] != "estudiante":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Solo para estudiantes")
+    
+    try:
+        return await expediente_estudiante(db, current_user["id_user"])
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+@router.get("/estudiante/{id_user}/expediente", response_model=Expediente)
+async def get_expediente_estudiante(
+    id_user: str,
+    db: AsyncPostgrestClient = Depends(get_db),
+    current_user: dict = Depends(require_docente_or_admin)
+):
+    """Expediente académico de un estudiante específico"""
+    try:
+        return await expediente_estudiante(db, id_user)
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+@router.post("/expediente/reconciliar")
+async def reconciliar_expedientes(
+    db: AsyncPostgrestClient = Depends(get_db),
+    current_user: dict = Depends(require_admin)
+):
+    """Recalcular el resumen de notas de todos los estudiantes (solo administradores)"""
+    try:
+        return await reconciliar_expediente(db)
+    except Exception as e:
+        if rpc_no_disponible(e):
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="La función reconciliar_resumen_notas no existe; ejecute los scripts de baseDeDatos.md"
+            )
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
 @router.get("/estudiante/{id_user}", response_model=List[Nota])
 async def get_notas_estudiante(
     id_user: str,
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(require_docente_or_admin)
 ):
     """Obtener notas de un estudiante específico"""
     try:
-        response = db.table("nota").select("*, materia(*)").eq("id_user", id_user).execute()
+        response = await db.table("nota").select(COLUMNAS_NOTA).eq("id_user", id_user).execute()
         return response.data
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
 
+@router.get("/exportar/materia/{id_materia}")
+async def exportar_notas_materia(
+    id_materia: str,
+    formato: str = Query("csv", pattern="^(csv|xlsx)$"),
+    tipo_nota: Optional[str] = None,
+    db: AsyncPostgrestClient = Depends(get_db),
+    current_user: dict = Depends(require_docente_or_admin)
+):
+    """Descargar todas las notas de una materia en CSV o XLSX, por tipo de nota"""
+    def consulta():
+        query = db.table("nota").select(COLUMNAS_EXPORTACION_NOTA).eq("id_materia", id_materia)
+        if tipo_nota:
+            query = query.eq("tipo_nota", tipo_nota)
+        return query
+
+    try:
+        return await exportar(
+            consulta, ORDEN_EXPORTACION_NOTAS, EXPORTACION_NOTAS, formato, f"notas_{id_materia}", hoja="notas"
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+@router.get("/estadisticas/materia/{id_materia}", response_model=EstadisticasMateria)
+async def get_estadisticas_materia(
+    id_materia: str,
+    db: AsyncPostgrestClient = Depends(get_db),
+    current_user: dict = Depends(require_docente_or_admin)
+):
+    """Media, mediana, desviación, percentiles, aprobación e histograma por tipo de nota"""
+    try:
+        return await estadisticas_materia(db, id_materia)
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+@router.get("/estadisticas/grupo/{id_grupo}", response_model=List[EstadisticasMateria])
+async def get_estadisticas_grupo(
+    id_grupo: str,
+    db: AsyncPostgrestClient = Depends(get_db),
+    current_user: dict = Depends(require_docente_or_admin)
+):
+    """Estadísticas de las notas del grupo en cada una de sus materias"""
+    try:
+        materias = await materias_del_grupo(db, id_grupo)
+        por_materia = await asyncio.gather(*(
+            estadisticas_materia(db, materia["id_materia"]) for materia in materias
+        ))
+        resultado = []
+        for estadisticas in por_materia:
+            grupo = estadisticas["por_grupo"].get(id_grupo, {"total": 0, "por_tipo": []})
+            resultado.append({
+                "id_materia": estadisticas["id_materia"],
+                "id_grupo": id_grupo,
+                "nota_aprobacion": estadisticas["nota_aprobacion"],
+                **grupo
+            })
+        return resultado
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
 @router.put("/{id_nota}", response_model=Nota)
 async def update_nota(
     id_nota: str,
     nota_data: NotaUpdate,
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(require_docente_or_admin)
 ):
     """Actualizar una nota"""
     try:
-        update_data = nota_data.dict(exclude_unset=True)
-        response = db.table("nota").update(update_data).eq("id_nota", id_nota).execute()
-        if not response.data:
+        # Edición y ajuste del expediente en una transacción
+        nota = await actualizar_nota(db, id_nota, nota_data.dict(exclude_unset=True))
+        if nota is None:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Nota no encontrada")
-        return response.data[0]
+        await invalidar_estadisticas(nota["id_materia"])
+        return nota
     except HTTPException:
         raise
     except Exception as e:
@@ -79,12 +267,15 @@ async def update_nota(
 @router.delete("/{id_nota}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_nota(
     id_nota: str,
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(require_docente_or_admin)
 ):
     """Eliminar una nota"""
     try:
-        db.table("nota").delete().eq("id_nota", id_nota).execute()
+        response = await db.table("nota").delete().eq("id_nota", id_nota).execute()
+        for nota in response.data:
+            await ajustar_expediente(db, nota["id_user"], nota["id_materia"], -1, -float(nota["nota"]))
+        await invalidar_estadisticas(*(nota["id_materia"] for nota in response.data))
         return None
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
@@ -1,26 +1,33 @@
 """
 Rutas para gestión de notificaciones
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from typing import List
-from supabase import Client
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from typing import List, Optional
+from postgrest import AsyncPostgrestClient
+from postgrest.types import CountMethod
 
 from app.database import get_db
 from app.models.notificacion import Notificacion, NotificacionCreate, NotificacionesNoLeidas
 from app.utils.dependencies import get_current_active_user
+from app.utils.pagination import paginar, set_next_cursor
+from app.utils.proyeccion import columnas
 
 router = APIRouter(prefix="/notificaciones")
 
+ORDEN_NOTIFICACIONES = (("fecha_envio", True), ("id_notificacion", True))
+
+COLUMNAS_NOTIFICACION = columnas(Notificacion)
+
 
 @router.post("", response_model=Notificacion, status_code=status.HTTP_201_CREATED)
 async def create_notificacion(
     notif_data: NotificacionCreate,
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Crear una nueva notificación"""
     try:
-        response = db.table("notificacion").insert(notif_data.dict()).execute()
+        response = await db.table("notificacion").insert(notif_data.dict()).execute()
         return response.data[0]
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
@@ -28,22 +35,26 @@ async def create_notificacion(
 
 @router.get("", response_model=List[Notificacion])
 async def get_my_notificaciones(
-    skip: int = Query(0, ge=0),
+    http_response: Response,
+    cursor: Optional[str] = Query(None, description="Cursor de la página siguiente (encabezado X-Next-Cursor)"),
+    skip: int = Query(0, ge=0, deprecated=True),
     limit: int = Query(50, ge=1, le=100),
     leida: bool = None,
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Obtener notificaciones del usuario actual"""
     try:
-        query = db.table("notificacion").select("*").eq("id_user", current_user["id_user"]).order("fecha_envio", desc=True)
+        query = db.table("notificacion").select(COLUMNAS_NOTIFICACION).eq("id_user", current_user["id_user"])
         
         if leida is not None:
             query = query.eq("leida", leida)
         
-        query = query.range(skip, skip + limit - 1)
-        response = query.execute()
+        response = await paginar(query, ORDEN_NOTIFICACIONES, limit, cursor, skip).execute()
+        set_next_cursor(http_response, response.data, ORDEN_NOTIFICACIONES, limit)
         return response.data
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
@@ -51,12 +62,12 @@ async def get_my_notificaciones(
 @router.put("/{id_notificacion}/leer", response_model=Notificacion)
 async def marcar_notificacion_leida(
     id_notificacion: str,
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Marcar una notificación como leída"""
     try:
-        response = db.table("notificacion").update({"leida": True}).eq("id_notificacion", id_notificacion).eq("id_user", current_user["id_user"]).execute()
+        response = await db.table("notificacion").update({"leida": True}).eq("id_notificacion", id_notificacion).eq("id_user", current_user["id_user"]).execute()
         if not response.data:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Notificación no encontrada")
         return response.data[0]
@@ -68,12 +79,12 @@ async def marcar_notificacion_leida(
 
 @router.put("/marcar-todas-leidas", status_code=status.HTTP_200_OK)
 async def marcar_todas_leidas(
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Marcar todas las notificaciones como leídas"""
     try:
-        db.table("notificacion").update({"leida": True}).eq("id_user", current_user["id_user"]).eq("leida", False).execute()
+        await db.table("notificacion").update({"leida": True}).eq("id_user", current_user["id_user"]).eq("leida", False).execute()
         return {"message": "Todas las notificaciones han sido marcadas como leídas"}
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
@@ -81,35 +92,65 @@ async def marcar_todas_leidas(
 
 @router.get("/no-leidas", response_model=NotificacionesNoLeidas)
 async def get_notificaciones_no_leidas(
-    db: Client = Depends(get_db),
+    limit: int = Query(50, ge=1, le=100),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
-    """Obtener contador de notificaciones no leídas"""
+    """Obtener contador de notificaciones no leídas y las más recientes"""
     try:
-        response = db.table("notificacion").select("*").eq("id_user", current_user["id_user"]).eq("leida", False).execute()
+        response = await db.table("notificacion")\
+            .select(COLUMNAS_NOTIFICACION, count=CountMethod.exact)\
+            .eq("id_user", current_user["id_user"])\
+            .eq("leida", False)\
+            .order("fecha_envio", desc=True)\
+            .limit(limit)\
+            .execute()
         return {
-            "total_no_leidas": len(response.data),
+            "total_no_leidas": response.count if response.count is not None else len(response.data),
             "notificaciones": response.data
         }
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
 
+@router.get("/no-leidas/contador", response_model=NotificacionesNoLeidas)
+async def contar_notificaciones_no_leidas(
+    db: AsyncPostgrestClient = Depends(get_db),
+    current_user: dict = Depends(get_current_active_user)
+):
+    """
+    Total de notificaciones no leídas para el indicador (badge)
+
+    Solo transfiere el conteo: `count=exact` con `limit(0)` devuelve un cuerpo vacío
+    y el total en `Content-Range` (postgrest-py no lee el conteo de las respuestas HEAD).
+    """
+    try:
+        response = await db.table("notificacion")\
+            .select("id_notificacion", count=CountMethod.exact)\
+            .eq("id_user", current_user["id_user"])\
+            .eq("leida", False)\
+            .limit(0)\
+            .execute()
+        return {"total_no_leidas": response.count or 0}
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
 @router.delete("/{id_notificacion}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_notificacion(
     id_notificacion: str,
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Eliminar una notificación"""
     try:
-        existing = db.table("notificacion").select("*").eq("id_notificacion", id_notificacion).execute()
+        existing = await db.table("notificacion").select("id_user").eq("id_notificacion", id_notificacion).execute()
         if not existing.data:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Notificación no encontrada")
         if existing.data[0]["id_user"] != current_user["id_user"]:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="No autorizado")
         
-        db.table("notificacion").delete().eq("id_notificacion", id_notificacion).execute()
+        await db.table("notificacion").delete().eq("id_notificacion", id_notificacion).execute()
         return None
     except HTTPException:
         raise
@@ -3,25 +3,30 @@ Rutas para gestión de pasajeros en rutas de carpooling
 """
 from fastapi import APIRouter, Depends, HTTPException, status
 from typing import List
-from supabase import Client
+from postgrest import AsyncPostgrestClient
 
 from app.database import get_db
 from app.models.carpooling import PasajeroRuta, PasajeroRutaCreate, PasajeroRutaUpdate
+from app.models.usuario import UsuarioPublico
 from app.utils.dependencies import get_current_active_user
+from app.utils.proyeccion import columnas
 
 router = APIRouter(prefix="/pasajeros")
 
+# Solicitudes con los datos públicos del pasajero
+COLUMNAS_PASAJERO = columnas(PasajeroRuta, excluir=("ruta",), pasajero=("usuario", UsuarioPublico))
+
 
 @router.post("", response_model=PasajeroRuta, status_code=status.HTTP_201_CREATED)
 async def postular_como_pasajero(
     pasajero_data: PasajeroRutaCreate,
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Postularse como pasajero en una ruta"""
     try:
         # Verificar que la ruta existe y está activa
-        ruta = db.table("ruta").select("*").eq("id_ruta", pasajero_data.id_ruta).eq("activa", True).execute()
+        ruta = await db.table("ruta").select("id_user").eq("id_ruta", pasajero_data.id_ruta).eq("activa", True).execute()
         if not ruta.data:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Ruta no encontrada o inactiva")
         
@@ -30,14 +35,14 @@ async def postular_como_pasajero(
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No puedes ser pasajero de tu propia ruta")
         
         # Verificar que no esté ya postulado
-        existing = db.table("pasajeroruta").select("*").eq("id_ruta", pasajero_data.id_ruta).eq("id_user", current_user["id_user"]).execute()
+        existing = await db.table("pasajeroruta").select("id_pasajero_ruta").eq("id_ruta", pasajero_data.id_ruta).eq("id_user", current_user["id_user"]).execute()
         if existing.data:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Ya estás postulado en esta ruta")
         
         # Crear solicitud
         pasajero_dict = pasajero_data.dict()
         pasajero_dict["id_user"] = current_user["id_user"]
-        response = db.table("pasajeroruta").insert(pasajero_dict).execute()
+        response = await db.table("pasajeroruta").insert(pasajero_dict).execute()
         return response.data[0]
         
     except HTTPException:
@@ -49,13 +54,13 @@ async def postular_como_pasajero(
 @router.get("/ruta/{id_ruta}", response_model=List[PasajeroRuta])
 async def get_pasajeros_ruta(
     id_ruta: str,
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Obtener pasajeros de una ruta"""
     try:
-        response = db.table("pasajeroruta")\
-            .select("*, usuario:usuario(nombre, apellido, foto_perfil)")\
+        response = await db.table("pasajeroruta")\
+            .select(COLUMNAS_PASAJERO)\
             .eq("id_ruta", id_ruta)\
             .execute()
         return response.data
@@ -67,14 +72,14 @@ async def get_pasajeros_ruta(
 async def update_estado_pasajero(
     id_pasajero_ruta: str,
     pasajero_data: PasajeroRutaUpdate,
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Actualizar estado de un pasajero (solo conductor)"""
     try:
         # Verificar que existe
-        pasajero = db.table("pasajeroruta")\
-            .select("*, ruta:ruta(*)")\
+        pasajero = await db.table("pasajeroruta")\
+            .select("id_pasajero_ruta, ruta(id_user)")\
             .eq("id_pasajero_ruta", id_pasajero_ruta)\
             .execute()
         if not pasajero.data:
@@ -87,7 +92,7 @@ async def update_estado_pasajero(
         
         # Actualizar estado
         update_data = pasajero_data.dict(exclude_unset=True)
-        response = db.table("pasajeroruta").update(update_data).eq("id_pasajero_ruta", id_pasajero_ruta).execute()
+        response = await db.table("pasajeroruta").update(update_data).eq("id_pasajero_ruta", id_pasajero_ruta).execute()
         return response.data[0]
         
     except HTTPException:
@@ -99,13 +104,13 @@ async def update_estado_pasajero(
 @router.delete("/{id_pasajero_ruta}", status_code=status.HTTP_204_NO_CONTENT)
 async def cancelar_solicitud(
     id_pasajero_ruta: str,
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Cancelar solicitud de pasajero"""
     try:
         # Verificar que existe
-        pasajero = db.table("pasajeroruta").select("*").eq("id_pasajero_ruta", id_pasajero_ruta).execute()
+        pasajero = await db.table("pasajeroruta").select("id_user").eq("id_pasajero_ruta", id_pasajero_ruta).execute()
         if not pasajero.data:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Solicitud no encontrada")
         
@@ -114,7 +119,7 @@ async def cancelar_solicitud(
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="No autorizado")
         
         # Eliminar o marcar como cancelado
-        db.table("pasajeroruta").update({"estado": "cancelado"}).eq("id_pasajero_ruta", id_pasajero_ruta).execute()
+        await db.table("pasajeroruta").update({"estado": "cancelado"}).eq("id_pasajero_ruta", id_pasajero_ruta).execute()
         return None
         
     except HTTPException:
@@ -1,56 +1,171 @@
 """
 Rutas para gestión de publicaciones
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from typing import List
-from supabase import Client
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from typing import Dict, List, Optional
+import asyncio
+import logging
+from postgrest import AsyncPostgrestClient
 
-from app.database import get_db
-from app.models.social import Publicacion, PublicacionCreate, PublicacionUpdate
-from app.utils.dependencies import get_current_active_user
+from app.database import get_db, rpc_no_disponible
+from app.models.social import Publicacion, PublicacionCreate, PublicacionUpdate, Media
+from app.models.usuario import UsuarioPublico
+from app.utils.dependencies import get_current_active_user, get_loaders, require_admin
+from app.utils.bulk import insertar_con_hijos
+from app.utils.engagement import reconciliar_contadores
+from app.utils.loaders import DataLoaders
+from app.utils.pagination import paginar, set_next_cursor
+from app.utils.proyeccion import columnas, seleccionar_con_respaldo
 
 router = APIRouter(prefix="/publicaciones")
 
+# Orden del feed: más recientes primero, desempate por ID
+ORDEN_PUBLICACIONES = (("fecha_creacion", True), ("id_publicacion", True))
+
+# Columnas de Publicacion con autor (datos públicos) y media; `mis_reacciones` se calcula
+COLUMNAS_PUBLICACION = columnas(
+    Publicacion,
+    excluir=("mis_reacciones",),
+    usuario=UsuarioPublico,
+    media=Media
+)
+# Sin los contadores, para bases donde aún no se creó la sección 26 de baseDeDatos.md
+# (en ese caso `_hidratar_publicaciones` calcula los conteos)
+COLUMNAS_PUBLICACION_SIN_CONTADORES = columnas(
+    Publicacion,
+    excluir=("mis_reacciones", "comentarios_count", "reacciones_count", "reacciones_por_tipo"),
+    usuario=UsuarioPublico,
+    media=Media
+)
+
+logger = logging.getLogger(__name__)
+
 
 @router.post("", response_model=Publicacion, status_code=status.HTTP_201_CREATED)
 async def create_publicacion(
     publicacion_data: PublicacionCreate,
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Crear una nueva publicación"""
     try:
         pub_dict = publicacion_data.dict(exclude={"media_urls"})
         pub_dict["id_user"] = current_user["id_user"]
-        response = db.table("publicacion").insert(pub_dict).execute()
-        publicacion = response.data[0]
-        
-        # Crear registros de media si hay URLs
-        if publicacion_data.media_urls:
-            for url in publicacion_data.media_urls:
-                media_dict = {
-                    "tipo": "imagen",  # Detectar tipo automáticamente en prod
-                    "url": url,
-                    "id_publicacion": publicacion["id_publicacion"]
-                }
-                db.table("media").insert(media_dict).execute()
         
-        return publicacion
+        # Publicación y media se crean juntas en una sola transacción
+        media = [
+            {
+                "tipo": "imagen",  # Detectar tipo automáticamente en prod
+                "url": url
+            }
+            for url in publicacion_data.media_urls or []
+        ]
+        return await insertar_con_hijos(
+            db, "crear_publicacion",
+            "publicacion", pub_dict, "id_publicacion",
+            "media", media
+        )
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
 
+async def _engagement_por_lotes(
+    loaders: DataLoaders,
+    ids: List[str],
+    id_user: str
+) -> Dict[str, dict]:
+    """
+    Conteos de comentarios y reacciones armados con dos consultas por lotes
+
+    Se usa cuando la función `engagement_publicaciones` aún no existe en la base de datos.
+    """
+    comentarios_loader = loaders.get("comentario", "id_publicacion", select="id_publicacion", many=True)
+    reacciones_loader = loaders.get("reaccion", "id_publicacion", select="id_publicacion, id_user, tipo_reac", many=True)
+
+    comentarios, reacciones = await asyncio.gather(
+        comentarios_loader.load_many(ids),
+        reacciones_loader.load_many(ids)
+    )
+
+    return {
+        id_pub: {
+            "comentarios_count": len(coms),
+            "reacciones_count": len(reacs),
+            "mis_reacciones": [r["tipo_reac"] for r in reacs if r["id_user"] == id_user]
+        }
+        for id_pub, coms, reacs in zip(ids, comentarios, reacciones)
+    }
+
+
+async def _hidratar_publicaciones(
+    db: AsyncPostgrestClient,
+    loaders: DataLoaders,
+    publicaciones: List[dict],
+    id_user: str
+) -> List[dict]:
+    """
+    Completa `comentarios_count`, `reacciones_count` y `mis_reacciones` de una página
+
+    Si las publicaciones ya traen sus contadores desnormalizados solo falta
+    consultar las reacciones del usuario actual. Si no, los conteos se agregan
+    en la base de datos con una llamada a `engagement_publicaciones`.
+    """
+    ids = [pub["id_publicacion"] for pub in publicaciones]
+    if not ids:
+        return publicaciones
+
+    if all("comentarios_count" in pub for pub in publicaciones):
+        mis_reacciones = await loaders.load_many(
+            "reaccion", "id_publicacion", ids,
+            select="id_publicacion, tipo_reac",
+            many=True,
+            filters=(("eq", "id_user", id_user),)
+        )
+        for pub, reacs in zip(publicaciones, mis_reacciones):
+            pub["mis_reacciones"] = [r["tipo_reac"] for r in reacs]
+        return publicaciones
+
+    try:
+        response = await db.rpc(
+            "engagement_publicaciones",
+            {"p_ids": ids, "p_id_user": id_user}
+        ).execute()
+        resumen = {fila["id_publicacion"]: fila for fila in response.data}
+    except Exception as e:
+        if not rpc_no_disponible(e):
+            raise
+        logger.warning("Función engagement_publicaciones no disponible, usando consultas por lotes")
+        resumen = await _engagement_por_lotes(loaders, ids, id_user)
+
+    for pub in publicaciones:
+        fila = resumen.get(pub["id_publicacion"], {})
+        pub["comentarios_count"] = fila.get("comentarios_count") or 0
+        pub["reacciones_count"] = fila.get("reacciones_count") or 0
+        pub["mis_reacciones"] = fila.get("mis_reacciones") or []
+
+    return publicaciones
+
+
 @router.get("", response_model=List[Publicacion])
 async def get_publicaciones(
-    skip: int = Query(0, ge=0),
+    http_response: Response,
+    cursor: Optional[str] = Query(None, description="Cursor de la página siguiente (encabezado X-Next-Cursor)"),
+    skip: int = Query(0, ge=0, deprecated=True),
     limit: int = Query(50, ge=1, le=100),
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
+    loaders: DataLoaders = Depends(get_loaders),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Obtener feed de publicaciones"""
     try:
-        response = db.table("publicacion").select("*, usuario(nombre, apellido, foto_perfil)").order("fecha_creacion", desc=True).range(skip, skip + limit - 1).execute()
-        return response.data
+        response = await seleccionar_con_respaldo(
+            db, "publicacion", COLUMNAS_PUBLICACION, COLUMNAS_PUBLICACION_SIN_CONTADORES,
+            lambda query: paginar(query, ORDEN_PUBLICACIONES, limit, cursor, skip)
+        )
+        set_next_cursor(http_response, response.data, ORDEN_PUBLICACIONES, limit)
+        return await _hidratar_publicaciones(db, loaders, response.data, current_user["id_user"])
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
@@ -58,15 +173,20 @@ async def get_publicaciones(
 @router.get("/{id_publicacion}", response_model=Publicacion)
 async def get_publicacion(
     id_publicacion: str,
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
+    loaders: DataLoaders = Depends(get_loaders),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Obtener una publicación por ID"""
     try:
-        response = db.table("publicacion").select("*, usuario(*), media(*)").eq("id_publicacion", id_publicacion).execute()
+        response = await seleccionar_con_respaldo(
+            db, "publicacion", COLUMNAS_PUBLICACION, COLUMNAS_PUBLICACION_SIN_CONTADORES,
+            lambda query: query.eq("id_publicacion", id_publicacion)
+        )
         if not response.data:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Publicación no encontrada")
-        return response.data[0]
+        publicaciones = await _hidratar_publicaciones(db, loaders, response.data, current_user["id_user"])
+        return publicaciones[0]
     except HTTPException:
         raise
     except Exception as e:
@@ -77,20 +197,20 @@ async def get_publicacion(
 async def update_publicacion(
     id_publicacion: str,
     publicacion_data: PublicacionUpdate,
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Actualizar una publicación"""
     try:
         # Verificar que es del usuario
-        existing = db.table("publicacion").select("*").eq("id_publicacion", id_publicacion).execute()
+        existing = await db.table("publicacion").select("id_user").eq("id_publicacion", id_publicacion).execute()
         if not existing.data:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Publicación no encontrada")
         if existing.data[0]["id_user"] != current_user["id_user"]:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="No autorizado")
         
         update_data = publicacion_data.dict(exclude_unset=True)
-        response = db.table("publicacion").update(update_data).eq("id_publicacion", id_publicacion).execute()
+        response = await db.table("publicacion").update(update_data).eq("id_publicacion", id_publicacion).execute()
         return response.data[0]
     except HTTPException:
         raise
@@ -101,21 +221,38 @@ async def update_publicacion(
 @router.delete("/{id_publicacion}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_publicacion(
     id_publicacion: str,
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Eliminar una publicación"""
     try:
         # Verificar que es del usuario
-        existing = db.table("publicacion").select("*").eq("id_publicacion", id_publicacion).execute()
+        existing = await db.table("publicacion").select("id_user").eq("id_publicacion", id_publicacion).execute()
         if not existing.data:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Publicación no encontrada")
         if existing.data[0]["id_user"] != current_user["id_user"]:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="No autorizado")
         
-        db.table("publicacion").delete().eq("id_publicacion", id_publicacion).execute()
+        await db.table("publicacion").delete().eq("id_publicacion", id_publicacion).execute()
         return None
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+@router.post("/contadores/reconciliar")
+async def reconciliar_contadores_publicaciones(
+    db: AsyncPostgrestClient = Depends(get_db),
+    current_user: dict = Depends(require_admin)
+):
+    """Recalcular los contadores de comentarios y reacciones (solo administradores)"""
+    try:
+        return await reconciliar_contadores(db)
+    except Exception as e:
+        if rpc_no_disponible(e):
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="La función reconciliar_engagement no existe; ejecute los scripts de baseDeDatos.md"
+            )
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
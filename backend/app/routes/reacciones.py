@@ -1,24 +1,116 @@
 """
 Rutas para gestión de reacciones
 """
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List
-from supabase import Client
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from typing import Dict, List, Optional
+from collections import Counter
+import asyncio
+import logging
+from postgrest import AsyncPostgrestClient
+from postgrest.exceptions import APIError
+from postgrest.types import CountMethod
 
-from app.database import get_db
-from app.models.social import Reaccion, ReaccionCreate
+from app.database import get_db, rpc_no_disponible, COLUMNA_NO_EXISTE
+from app.models.social import (
+    Reaccion, ReaccionCreate, ReaccionToggle,
+    ReaccionesResumen, TipoReaccionEnum
+)
+from app.models.usuario import UsuarioPublico
 from app.utils.dependencies import get_current_active_user
+from app.utils.engagement import ajustar_contadores
+from app.utils.pagination import paginar, set_next_cursor
+from app.utils.proyeccion import columnas
 
 router = APIRouter(prefix="/reacciones")
 
+ORDEN_REACCIONES = (("fecha_creacion_reac", True), ("id_reaccion", True))
 
-@router.post("", response_model=Reaccion, status_code=status.HTTP_201_CREATED)
+# Columnas de Reaccion, con y sin los datos públicos del autor
+COLUMNAS_REACCION = columnas(Reaccion, excluir=("usuario",))
+COLUMNAS_REACCION_USUARIO = columnas(Reaccion, usuario=UsuarioPublico)
+COLUMNAS_MUESTRA = f"tipo_reac,usuario({columnas(UsuarioPublico)})"
+
+logger = logging.getLogger(__name__)
+
+# Código de Postgres para violación de restricción UNIQUE
+VIOLACION_UNICA = "23505"
+
+
+async def _alternar_sin_rpc(db: AsyncPostgrestClient, reaccion_data: ReaccionCreate, id_user: str) -> dict:
+    """
+    Alterna la reacción con consultas separadas
+
+    Se usa cuando la función `alternar_reaccion` aún no existe en la base de datos.
+    """
+    columna, id_objetivo = (
+        ("id_publicacion", reaccion_data.id_publicacion)
+        if reaccion_data.id_publicacion
+        else ("id_comentario", reaccion_data.id_comentario)
+    )
+    tipo_reac = reaccion_data.tipo_reac.value
+
+    existing = await db.table("reaccion").select(COLUMNAS_REACCION)\
+        .eq("id_user", id_user)\
+        .eq("tipo_reac", tipo_reac)\
+        .eq(columna, id_objetivo)\
+        .execute()
+
+    if existing.data:
+        # Si ya existe, eliminarla (toggle)
+        reaccion = existing.data[0]
+        await db.table("reaccion").delete().eq("id_reaccion", reaccion["id_reaccion"]).execute()
+        activa, delta = False, -1
+    else:
+        # Crear nueva reacción; si otra petición la creó antes, queda activa
+        reac_dict = reaccion_data.dict(exclude_unset=True)
+        reac_dict["id_user"] = id_user
+        try:
+            response = await db.table("reaccion").insert(reac_dict).execute()
+            reaccion, delta = response.data[0], 1
+        except APIError as e:
+            if e.code != VIOLACION_UNICA:
+                raise
+            duplicada = await db.table("reaccion").select(COLUMNAS_REACCION)\
+                .eq("id_user", id_user)\
+                .eq("tipo_reac", tipo_reac)\
+                .eq(columna, id_objetivo)\
+                .execute()
+            reaccion, delta = (duplicada.data[0] if duplicada.data else None), 0
+        activa = True
+
+    if delta:
+        await ajustar_contadores(
+            db,
+            id_publicacion=reaccion_data.id_publicacion,
+            id_comentario=reaccion_data.id_comentario,
+            tipo_reac=tipo_reac,
+            reacciones=delta
+        )
+
+    conteos = await db.table("reaccion").select("tipo_reac").eq(columna, id_objetivo).execute()
+    por_tipo = dict(Counter(r["tipo_reac"] for r in conteos.data))
+
+    return {
+        "activa": activa,
+        "reaccion": reaccion,
+        "reacciones_count": sum(por_tipo.values()),
+        "reacciones_por_tipo": por_tipo
+    }
+
+
+@router.post("", response_model=ReaccionToggle)
 async def create_reaccion(
     reaccion_data: ReaccionCreate,
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
-    """Crear o actualizar una reacción"""
+    """
+    Crear o quitar una reacción (toggle)
+
+    La función `alternar_reaccion` elimina o inserta la reacción y ajusta los
+    contadores en una sola transacción, por lo que toques repetidos no crean
+    duplicados. Devuelve el estado final y los conteos actualizados.
+    """
     try:
         # Validar que no se proporcionen ambos IDs
         if reaccion_data.id_publicacion and reaccion_data.id_comentario:
@@ -34,27 +126,142 @@ async def create_reaccion(
                 detail="Debe proporcionar id_publicacion o id_comentario"
             )
 
-        # Verificar si ya existe una reacción del mismo tipo
-        query = db.table("reaccion").select("*").eq("id_user", current_user["id_user"]).eq("tipo_reac", reaccion_data.tipo_reac.value)
-        
-        if reaccion_data.id_publicacion:
-            query = query.eq("id_publicacion", reaccion_data.id_publicacion)
-        else:
-            query = query.eq("id_comentario", reaccion_data.id_comentario)
-        
-        existing = query.execute()
-        
-        if existing.data:
-            # Si ya existe, eliminarla (toggle)
-            db.table("reaccion").delete().eq("id_reaccion", existing.data[0]["id_reaccion"]).execute()
-            return existing.data[0]
-        else:
-            # Crear nueva reacción
-            reac_dict = reaccion_data.dict(exclude_unset=True)
-            reac_dict["id_user"] = current_user["id_user"]  # Agregar id_user del usuario autenticado
-            response = db.table("reaccion").insert(reac_dict).execute()
-            return response.data[0]
+        try:
+            response = await db.rpc("alternar_reaccion", {
+                "p_id_user": current_user["id_user"],
+                "p_tipo_reac": reaccion_data.tipo_reac.value,
+                "p_id_publicacion": reaccion_data.id_publicacion,
+                "p_id_comentario": reaccion_data.id_comentario
+            }).execute()
+            return response.data
+        except Exception as e:
+            if not rpc_no_disponible(e):
+                raise
+            logger.warning("Función alternar_reaccion no disponible, usando consultas separadas")
+
+        return await _alternar_sin_rpc(db, reaccion_data, current_user["id_user"])
             
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+async def _conteos_por_tipo(db: AsyncPostgrestClient, tabla: str, pk: str, id_objetivo: str) -> Dict[str, int]:
+    """
+    Conteo de reacciones por tipo de una publicación o comentario
+
+    Lee los contadores desnormalizados; si la tabla aún no tiene esas columnas,
+    pide un conteo exacto por tipo (solo viaja el total, no las filas).
+    """
+    try:
+        response = await db.table(tabla).select("reacciones_por_tipo").eq(pk, id_objetivo).execute()
+        if not response.data:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Objetivo de la reacción no encontrado")
+        return response.data[0]["reacciones_por_tipo"] or {}
+    except APIError as e:
+        if e.code != COLUMNA_NO_EXISTE:
+            raise
+
+    async def contar(tipo: str) -> int:
+        response = await db.table("reaccion")\
+            .select("id_reaccion", count=CountMethod.exact)\
+            .eq(pk, id_objetivo)\
+            .eq("tipo_reac", tipo)\
+            .limit(0)\
+            .execute()
+        return response.count or 0
+
+    tipos = [tipo.value for tipo in TipoReaccionEnum]
+    conteos = await asyncio.gather(*(contar(tipo) for tipo in tipos))
+    return {tipo: n for tipo, n in zip(tipos, conteos) if n}
+
+
+async def _resumen_reacciones(
+    db: AsyncPostgrestClient,
+    tabla: str,
+    pk: str,
+    id_objetivo: str,
+    id_user: str,
+    muestra: int
+) -> dict:
+    """Arma el resumen de reacciones con consultas en paralelo"""
+    async def mis_reacciones() -> List[str]:
+        response = await db.table("reaccion").select("tipo_reac").eq(pk, id_objetivo).eq("id_user", id_user).execute()
+        return [r["tipo_reac"] for r in response.data]
+
+    async def ultimas() -> List[dict]:
+        if not muestra:
+            return []
+        response = await db.table("reaccion")\
+            .select(COLUMNAS_MUESTRA)\
+            .eq(pk, id_objetivo)\
+            .order("fecha_creacion_reac", desc=True)\
+            .limit(muestra)\
+            .execute()
+        return response.data
+
+    por_tipo, mias, muestra_usuarios = await asyncio.gather(
+        _conteos_por_tipo(db, tabla, pk, id_objetivo),
+        mis_reacciones(),
+        ultimas()
+    )
+    return {
+        "total": sum(por_tipo.values()),
+        "por_tipo": por_tipo,
+        "mis_reacciones": mias,
+        "muestra": muestra_usuarios
+    }
+
+
+async def _listar_reacciones(
+    db: AsyncPostgrestClient,
+    http_response: Response,
+    pk: str,
+    id_objetivo: str,
+    tipo_reac: Optional[TipoReaccionEnum],
+    limit: int,
+    cursor: Optional[str]
+) -> List[dict]:
+    """Página de reacciones (más recientes primero) con paginación por cursor"""
+    query = db.table("reaccion")\
+        .select(COLUMNAS_REACCION_USUARIO)\
+        .eq(pk, id_objetivo)
+    if tipo_reac:
+        query = query.eq("tipo_reac", tipo_reac.value)
+    response = await paginar(query, ORDEN_REACCIONES, limit, cursor).execute()
+    set_next_cursor(http_response, response.data, ORDEN_REACCIONES, limit)
+    return response.data
+
+
+@router.get("/publicacion/{id_publicacion}/resumen", response_model=ReaccionesResumen)
+async def get_resumen_reacciones_publicacion(
+    id_publicacion: str,
+    muestra: int = Query(3, ge=0, le=10, description="Cantidad de usuarios de ejemplo"),
+    db: AsyncPostgrestClient = Depends(get_db),
+    current_user: dict = Depends(get_current_active_user)
+):
+    """Obtener conteos por tipo, mis reacciones y una muestra de usuarios de una publicación"""
+    try:
+        return await _resumen_reacciones(db, "publicacion", "id_publicacion", id_publicacion, current_user["id_user"], muestra)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+@router.get("/comentario/{id_comentario}/resumen", response_model=ReaccionesResumen)
+async def get_resumen_reacciones_comentario(
+    id_comentario: str,
+    muestra: int = Query(3, ge=0, le=10, description="Cantidad de usuarios de ejemplo"),
+    db: AsyncPostgrestClient = Depends(get_db),
+    current_user: dict = Depends(get_current_active_user)
+):
+    """Obtener conteos por tipo, mis reacciones y una muestra de usuarios de un comentario"""
+    try:
+        return await _resumen_reacciones(db, "comentario", "id_comentario", id_comentario, current_user["id_user"], muestra)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
@@ -62,13 +269,18 @@ async def create_reaccion(
 @router.get("/publicacion/{id_publicacion}", response_model=List[Reaccion])
 async def get_reacciones_publicacion(
     id_publicacion: str,
-    db: Client = Depends(get_db),
+    http_response: Response,
+    tipo_reac: Optional[TipoReaccionEnum] = None,
+    cursor: Optional[str] = Query(None, description="Cursor de la página siguiente (encabezado X-Next-Cursor)"),
+    limit: int = Query(50, ge=1, le=100),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
-    """Obtener reacciones de una publicación"""
+    """Obtener reacciones de una publicación (paginadas)"""
     try:
-        response = db.table("reaccion").select("*").eq("id_publicacion", id_publicacion).execute()
-        return response.data
+        return await _listar_reacciones(db, http_response, "id_publicacion", id_publicacion, tipo_reac, limit, cursor)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
@@ -76,13 +288,18 @@ async def get_reacciones_publicacion(
 @router.get("/comentario/{id_comentario}", response_model=List[Reaccion])
 async def get_reacciones_comentario(
     id_comentario: str,
-    db: Client = Depends(get_db),
+    http_response: Response,
+    tipo_reac: Optional[TipoReaccionEnum] = None,
+    cursor: Optional[str] = Query(None, description="Cursor de la página siguiente (encabezado X-Next-Cursor)"),
+    limit: int = Query(50, ge=1, le=100),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
-    """Obtener reacciones de un comentario"""
+    """Obtener reacciones de un comentario (paginadas)"""
     try:
-        response = db.table("reaccion").select("*").eq("id_comentario", id_comentario).execute()
-        return response.data
+        return await _listar_reacciones(db, http_response, "id_comentario", id_comentario, tipo_reac, limit, cursor)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
@@ -90,18 +307,26 @@ async def get_reacciones_comentario(
 @router.delete("/{id_reaccion}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_reaccion(
     id_reaccion: str,
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Eliminar una reacción"""
     try:
-        existing = db.table("reaccion").select("*").eq("id_reaccion", id_reaccion).execute()
+        existing = await db.table("reaccion").select(COLUMNAS_REACCION).eq("id_reaccion", id_reaccion).execute()
         if not existing.data:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Reacción no encontrada")
         if existing.data[0]["id_user"] != current_user["id_user"]:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="No autorizado")
         
-        db.table("reaccion").delete().eq("id_reaccion", id_reaccion).execute()
+        reaccion = existing.data[0]
+        await db.table("reaccion").delete().eq("id_reaccion", id_reaccion).execute()
+        await ajustar_contadores(
+            db,
+            id_publicacion=reaccion.get("id_publicacion"),
+            id_comentario=reaccion.get("id_comentario"),
+            tipo_reac=reaccion["tipo_reac"],
+            reacciones=-1
+        )
         return None
     except HTTPException:
         raise
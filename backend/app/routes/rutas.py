@@ -1,82 +1,110 @@
 """
 Rutas para gestión de rutas de carpooling
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from typing import List, Optional
-from supabase import Client
+from postgrest import AsyncPostgrestClient
 
 from app.database import get_db
-from app.models.carpooling import Ruta, RutaCreate, RutaUpdate, MisRutas
+from app.models.carpooling import Ruta, RutaCreate, RutaUpdate, MisRutas, Parada, PasajeroRuta
+from app.models.usuario import UsuarioPublico
+from app.utils.bulk import insertar_con_hijos
 from app.utils.dependencies import get_current_active_user
+from app.utils.pagination import paginar, set_next_cursor
+from app.utils.proyeccion import columnas
 
 router = APIRouter(prefix="/rutas-carpooling")
 
+ORDEN_RUTAS = (("fecha_creacion", True), ("id_ruta", True))
+
+# Campos de Ruta que la API no guarda como columna
+CAMPOS_CALCULADOS_RUTA = ("pasajeros_count", "pasajeros_aceptados", "lugares_disponibles")
+
+# Listados: ruta con su conductor (datos públicos); el detalle agrega las paradas
+COLUMNAS_RUTA = columnas(
+    Ruta,
+    excluir=CAMPOS_CALCULADOS_RUTA + ("paradas",),
+    conductor=("usuario", UsuarioPublico)
+)
+COLUMNAS_RUTA_DETALLE = columnas(
+    Ruta,
+    excluir=CAMPOS_CALCULADOS_RUTA,
+    conductor=("usuario", UsuarioPublico),
+    paradas=("parada", Parada)
+)
+COLUMNAS_PASAJERO_RUTA = columnas(
+    PasajeroRuta,
+    excluir=("pasajero",),
+    ruta=columnas(Ruta, excluir=CAMPOS_CALCULADOS_RUTA + ("conductor", "paradas"))
+)
+
 
 @router.post("", response_model=Ruta, status_code=status.HTTP_201_CREATED)
 async def create_ruta(
     ruta_data: RutaCreate,
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Crear una nueva ruta de carpooling"""
     try:
         ruta_dict = ruta_data.dict(exclude={"paradas"})
         ruta_dict["id_user"] = current_user["id_user"]
-        response = db.table("ruta").insert(ruta_dict).execute()
-        ruta = response.data[0]
-        
-        # Crear paradas si las hay
-        if ruta_data.paradas:
-            for parada in ruta_data.paradas:
-                parada_dict = {
-                    "orden_parada": parada.get("orden_parada"),
-                    "ubicacion_parada": parada.get("ubicacion_parada"),
-                    "id_ruta": ruta["id_ruta"]
-                }
-                db.table("parada").insert(parada_dict).execute()
         
-        return ruta
+        # Ruta y paradas se crean juntas en una sola transacción
+        paradas = [
+            {
+                "orden_parada": parada.get("orden_parada"),
+                "ubicacion_parada": parada.get("ubicacion_parada")
+            }
+            for parada in ruta_data.paradas or []
+        ]
+        return await insertar_con_hijos(
+            db, "crear_ruta",
+            "ruta", ruta_dict, "id_ruta",
+            "parada", paradas
+        )
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
 
 @router.get("", response_model=List[Ruta])
 async def get_rutas(
-    skip: int = Query(0, ge=0),
+    http_response: Response,
+    cursor: Optional[str] = Query(None, description="Cursor de la página siguiente (encabezado X-Next-Cursor)"),
+    skip: int = Query(0, ge=0, deprecated=True),
     limit: int = Query(50, ge=1, le=100),
     activa: bool = True,
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Obtener lista de rutas disponibles"""
     try:
-        response = db.table("ruta")\
-            .select("*, usuario:usuario(nombre, apellido, foto_perfil)")\
-            .eq("activa", activa)\
-            .order("fecha_creacion", desc=True)\
-            .range(skip, skip + limit - 1)\
-            .execute()
+        query = db.table("ruta").select(COLUMNAS_RUTA).eq("activa", activa)
+        response = await paginar(query, ORDEN_RUTAS, limit, cursor, skip).execute()
+        set_next_cursor(http_response, response.data, ORDEN_RUTAS, limit)
         return response.data
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
 
 @router.get("/mis-rutas", response_model=MisRutas)
 async def get_mis_rutas(
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Obtener rutas del usuario (como conductor y pasajero)"""
     try:
         # Rutas como conductor
-        conductor_response = db.table("ruta")\
-            .select("*, usuario:usuario(nombre, apellido, foto_perfil)")\
+        conductor_response = await db.table("ruta")\
+            .select(COLUMNAS_RUTA)\
             .eq("id_user", current_user["id_user"])\
             .execute()
         
         # Rutas como pasajero
-        pasajero_response = db.table("pasajeroruta")\
-            .select("*, ruta:ruta(*), usuario:usuario(nombre, apellido, foto_perfil)")\
+        pasajero_response = await db.table("pasajeroruta")\
+            .select(COLUMNAS_PASAJERO_RUTA)\
             .eq("id_user", current_user["id_user"])\
             .execute()
         
@@ -91,13 +119,13 @@ async def get_mis_rutas(
 @router.get("/{id_ruta}", response_model=Ruta)
 async def get_ruta(
     id_ruta: str,
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Obtener una ruta por ID"""
     try:
-        response = db.table("ruta")\
-            .select("*, usuario:usuario(*), parada:parada(*)")\
+        response = await db.table("ruta")\
+            .select(COLUMNAS_RUTA_DETALLE)\
             .eq("id_ruta", id_ruta)\
             .execute()
         if not response.data:
@@ -113,20 +141,20 @@ async def get_ruta(
 async def update_ruta(
     id_ruta: str,
     ruta_data: RutaUpdate,
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Actualizar una ruta"""
     try:
         # Verificar que es del conductor
-        existing = db.table("ruta").select("*").eq("id_ruta", id_ruta).execute()
+        existing = await db.table("ruta").select("id_user").eq("id_ruta", id_ruta).execute()
         if not existing.data:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Ruta no encontrada")
         if existing.data[0]["id_user"] != current_user["id_user"]:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="No autorizado")
         
         update_data = ruta_data.dict(exclude_unset=True)
-        response = db.table("ruta").update(update_data).eq("id_ruta", id_ruta).execute()
+        response = await db.table("ruta").update(update_data).eq("id_ruta", id_ruta).execute()
         return response.data[0]
     except HTTPException:
         raise
@@ -137,19 +165,19 @@ async def update_ruta(
 @router.delete("/{id_ruta}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_ruta(
     id_ruta: str,
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """Eliminar una ruta (desactivarla)"""
     try:
-        existing = db.table("ruta").select("*").eq("id_ruta", id_ruta).execute()
+        existing = await db.table("ruta").select("id_user").eq("id_ruta", id_ruta).execute()
         if not existing.data:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Ruta no encontrada")
         if existing.data[0]["id_user"] != current_user["id_user"]:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="No autorizado")
         
         # Desactivar en lugar de eliminar
-        db.table("ruta").update({"activa": False}).eq("id_ruta", id_ruta).execute()
+        await db.table("ruta").update({"activa": False}).eq("id_ruta", id_ruta).execute()
         return None
     except HTTPException:
         raise
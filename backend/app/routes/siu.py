@@ -0,0 +1,48 @@
+"""
+Rutas para la sincronización con el SIU
+"""
+from fastapi import APIRouter, Depends, File, HTTPException, Path, Query, UploadFile, status
+from typing import Optional
+from postgrest import AsyncPostgrestClient
+
+from app.database import get_db
+from app.models.academico import ResultadoSincronizacion
+from app.utils.dependencies import require_admin
+from app.utils.importacion import bloques_upload, detectar_formato, leer_filas
+from app.utils.siu import ENTIDADES, sincronizar
+
+router = APIRouter(prefix="/siu")
+
+
+@router.post("/sincronizar/{entidad}", response_model=ResultadoSincronizacion)
+async def sincronizar_entidad(
+    entidad: str = Path(..., pattern=f"^({'|'.join(ENTIDADES)})$"),
+    archivo: UploadFile = File(..., description="Exportación completa del SIU: CSV (con encabezado), NDJSON o arreglo JSON"),
+    formato: Optional[str] = Query(None, pattern="^(csv|ndjson|json)$", description="Por defecto se deduce de la extensión"),
+    simular: bool = Query(False, description="Solo calcular las diferencias, sin escribir"),
+    permitir_eliminar: bool = Query(False, description="Eliminar aunque se supere SIU_SYNC_MAX_DELETE_RATIO"),
+    db: AsyncPostgrestClient = Depends(get_db),
+    current_user: dict = Depends(require_admin)
+):
+    """
+    Sincronizar materias, grupos_materias, horarios o notas con una exportación
+    del SIU (solo administradores)
+
+    Solo se escriben las filas del SIU que cambiaron; las filas MANUAL no se
+    modifican. Volver a enviar el mismo archivo no produce cambios. Las
+    eliminaciones masivas (más de SIU_SYNC_MAX_DELETE_RATIO) requieren
+    `permitir_eliminar`.
+    """
+    try:
+        formato = formato or detectar_formato(archivo.filename)
+        return await sincronizar(
+            db, entidad, leer_filas(bloques_upload(archivo), formato), simular,
+            permitir_eliminar=permitir_eliminar
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error al sincronizar {entidad}: {str(e)}"
+        )
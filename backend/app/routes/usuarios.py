@@ -1,40 +1,55 @@
 """
 Rutas para gestión de usuarios
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from typing import List, Optional
-from supabase import Client
+from postgrest import AsyncPostgrestClient
 from datetime import datetime
+import logging
 
 from app.database import get_db
 from app.models.usuario import (
     Usuario,
     UsuarioUpdate,
-    UsuarioInDB
+    UsuarioInDB,
+    UsuarioPublico
 )
 from app.utils.dependencies import (
     get_current_active_user,
-    require_admin
+    require_admin,
+    invalidate_user_cache
 )
-from app.utils.security import get_password_hash
+from app.utils.security import get_password_hash_async
+from app.utils.pagination import paginar, set_next_cursor
+from app.utils.busqueda import indice_usuarios
+from app.utils.proyeccion import columnas
 
 router = APIRouter(prefix="/usuarios")
 
+logger = logging.getLogger(__name__)
+
+ORDEN_USUARIOS = (("fecha_registro", True), ("id_user", True))
+
+# Columnas del modelo de respuesta: la contraseña nunca se lee
+COLUMNAS_USUARIO = columnas(Usuario)
+
 
 @router.get("", response_model=List[Usuario])
 async def get_usuarios(
-    skip: int = Query(0, ge=0),
+    http_response: Response,
+    cursor: Optional[str] = Query(None, description="Cursor de la página siguiente (encabezado X-Next-Cursor)"),
+    skip: int = Query(0, ge=0, deprecated=True),
     limit: int = Query(100, ge=1, le=100),
     rol: Optional[str] = None,
     activo: Optional[bool] = None,
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(require_admin)
 ):
     """
     Obtener lista de usuarios (solo administradores)
     """
     try:
-        query = db.table("usuario").select("*")
+        query = db.table("usuario").select(COLUMNAS_USUARIO)
         
         # Filtros opcionales
         if rol:
@@ -42,19 +57,14 @@ async def get_usuarios(
         if activo is not None:
             query = query.eq("activo", activo)
         
-        # Paginación
-        query = query.range(skip, skip + limit - 1)
+        # Paginación por cursor
+        response = await paginar(query, ORDEN_USUARIOS, limit, cursor, skip).execute()
+        set_next_cursor(http_response, response.data, ORDEN_USUARIOS, limit)
         
-        response = query.execute()
-        
-        # Remover contraseñas
-        usuarios = [
-            {k: v for k, v in user.items() if k != "contrasena"}
-            for user in response.data
-        ]
-        
-        return usuarios
+        return response.data
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -65,14 +75,14 @@ async def get_usuarios(
 @router.get("/{id_user}", response_model=Usuario)
 async def get_usuario(
     id_user: str,
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """
     Obtener un usuario por ID
     """
     try:
-        response = db.table("usuario").select("*").eq("id_user", id_user).execute()
+        response = await db.table("usuario").select(COLUMNAS_USUARIO).eq("id_user", id_user).execute()
         
         if not response.data:
             raise HTTPException(
@@ -92,9 +102,6 @@ async def get_usuario(
                 "rol": user["rol"],
                 "foto_perfil": user.get("foto_perfil")
             }
-        else:
-            # Remover contraseña
-            user = {k: v for k, v in user.items() if k != "contrasena"}
         
         return user
         
@@ -111,7 +118,7 @@ async def get_usuario(
 async def update_usuario(
     id_user: str,
     user_data: UsuarioUpdate,
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """
@@ -126,7 +133,7 @@ async def update_usuario(
     
     try:
         # Verificar que el usuario existe
-        existing = db.table("usuario").select("id_user").eq("id_user", id_user).execute()
+        existing = await db.table("usuario").select("id_user").eq("id_user", id_user).execute()
         
         if not existing.data:
             raise HTTPException(
@@ -139,11 +146,11 @@ async def update_usuario(
         
         # Si se actualiza la contraseña, hashearla
         if "contrasena" in update_data:
-            update_data["contrasena"] = get_password_hash(update_data["contrasena"])
+            update_data["contrasena"] = await get_password_hash_async(update_data["contrasena"])
         
         # Si se actualiza el correo, verificar que no exista
         if "correo" in update_data:
-            email_check = db.table("usuario").select("id_user").eq("correo", update_data["correo"]).neq("id_user", id_user).execute()
+            email_check = await db.table("usuario").select("id_user").eq("correo", update_data["correo"]).neq("id_user", id_user).execute()
             if email_check.data:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
@@ -151,7 +158,7 @@ async def update_usuario(
                 )
         
         # Actualizar
-        response = db.table("usuario").update(update_data).eq("id_user", id_user).execute()
+        response = await db.table("usuario").update(update_data).eq("id_user", id_user).execute()
         
         if not response.data:
             raise HTTPException(
@@ -160,6 +167,8 @@ async def update_usuario(
             )
         
         updated_user = response.data[0]
+        invalidate_user_cache(id_user)
+        indice_usuarios.registrar(updated_user)
         
         # Remover contraseña
         user_response = {k: v for k, v in updated_user.items() if k != "contrasena"}
@@ -178,7 +187,7 @@ async def update_usuario(
 @router.delete("/{id_user}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_usuario(
     id_user: str,
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(require_admin)
 ):
     """
@@ -187,7 +196,7 @@ async def delete_usuario(
     """
     try:
         # Verificar que existe
-        existing = db.table("usuario").select("id_user").eq("id_user", id_user).execute()
+        existing = await db.table("usuario").select("id_user").eq("id_user", id_user).execute()
         
         if not existing.data:
             raise HTTPException(
@@ -196,7 +205,9 @@ async def delete_usuario(
             )
         
         # Desactivar en lugar de eliminar
-        db.table("usuario").update({"activo": False}).eq("id_user", id_user).execute()
+        await db.table("usuario").update({"activo": False}).eq("id_user", id_user).execute()
+        invalidate_user_cache(id_user)
+        indice_usuarios.quitar(id_user)
         
         return None
         
@@ -213,20 +224,23 @@ async def delete_usuario(
 async def search_usuarios(
     q: str = Query(..., min_length=2),
     limit: int = Query(20, ge=1, le=100),
-    db: Client = Depends(get_db),
+    db: AsyncPostgrestClient = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
     """
     Buscar usuarios por nombre, apellido o correo
     """
     try:
-        # Buscar en nombre, apellido o correo
-        response = db.table("usuario").select("*").or_(
-            f"nombre.ilike.%{q}%,apellido.ilike.%{q}%,correo.ilike.%{q}%"
-        ).eq("activo", True).limit(limit).execute()
-        
-        if not response.data:
-            return []
+        try:
+            await indice_usuarios.asegurar(db)
+            resultados = indice_usuarios.buscar(q, limit)
+        except Exception as e:
+            # Sin índice: búsqueda directa en la base de datos
+            logger.warning(f"Índice de búsqueda no disponible, consultando la base de datos: {e}")
+            response = await db.table("usuario").select(COLUMNAS_USUARIO).or_(
+                f"nombre.ilike.%{q}%,apellido.ilike.%{q}%,correo.ilike.%{q}%"
+            ).eq("activo", True).limit(limit).execute()
+            resultados = response.data
             
         # Retornar solo información pública
         usuarios = [
@@ -237,10 +251,10 @@ async def search_usuarios(
                 "correo": user["correo"],
                 "rol": user["rol"],
                 "foto_perfil": user.get("foto_perfil", None),
-                "activo": user.get("activo", True),
-                "fecha_registro": user.get("fecha_registro", datetime.now().isoformat())
+                "activo": True,
+                "fecha_registro": user.get("fecha_registro") or datetime.now().isoformat()
             }
-            for user in response.data
+            for user in resultados
         ]
         
         return usuarios
@@ -250,3 +264,25 @@ async def search_usuarios(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error al buscar usuarios: {str(e)}"
         )
+
+
+@router.get("/search/typeahead", response_model=List[UsuarioPublico])
+async def typeahead_usuarios(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(10, ge=1, le=20),
+    db: AsyncPostgrestClient = Depends(get_db),
+    current_user: dict = Depends(get_current_active_user)
+):
+    """
+    Autocompletado de usuarios activos (solo datos públicos)
+
+    Pensado para consultarse en cada tecla: responde desde el índice en memoria.
+    """
+    try:
+        await indice_usuarios.asegurar(db)
+        return indice_usuarios.buscar(q, limit)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error al buscar usuarios: {str(e)}"
+        )
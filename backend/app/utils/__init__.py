@@ -12,7 +12,11 @@ from app.utils.dependencies import (
     get_current_user,
     get_current_active_user,
     require_role,
+    get_loaders,
+    invalidate_user_cache,
 )
+from app.utils.loaders import BatchLoader, DataLoaders
+from app.utils.cache import TTLCache, get_cache, cache_stats
 
 __all__ = [
     # Security
@@ -25,4 +29,13 @@ __all__ = [
     "get_current_user",
     "get_current_active_user",
     "require_role",
+    "get_loaders",
+    "invalidate_user_cache",
+    # Loaders
+    "BatchLoader",
+    "DataLoaders",
+    # Cache
+    "TTLCache",
+    "get_cache",
+    "cache_stats",
 ]
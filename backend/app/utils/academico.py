@@ -0,0 +1,123 @@
+"""
+Consultas académicas compartidas por las rutas: grupo del estudiante, materias
+y horarios de un grupo, y el horario semanal ya armado como grilla
+
+Todo se sirve desde la caché del catálogo (`app/utils/catalogo.py`); los
+horarios se invalidan por grupo cuando se crea, edita o elimina uno.
+"""
+from bisect import bisect_left
+from typing import Dict, List, Optional
+
+from postgrest import AsyncPostgrestClient
+
+from app.config import settings
+from app.models.academico import DiaSemanaEnum, Horario, Materia
+from app.utils.cache import get_cache
+from app.utils.catalogo import cache_catalogo
+from app.utils.proyeccion import columnas
+
+COLUMNAS_MATERIA = columnas(Materia, excluir=("docente",))
+COLUMNAS_HORARIO = columnas(Horario, excluir=("grupo",))
+
+# Días en el orden de la semana (no alfabético, como los ordena la base)
+DIAS_SEMANA = [dia.value for dia in DiaSemanaEnum]
+_POSICION_DIA = {dia: posicion for posicion, dia in enumerate(DIAS_SEMANA)}
+
+cache_materias_grupo = cache_catalogo("materias_grupo", ("grupomateria", "materia"))
+cache_horarios = cache_catalogo("horarios", ("horario",))
+cache_horario_semanal = cache_catalogo("horario_semanal", ("horario", "grupomateria", "materia"))
+
+# Grupo de cada estudiante (por id_user); None si no tiene grupo
+grupo_estudiante_cache = get_cache(
+    "grupo_estudiante",
+    maxsize=settings.AUTH_CACHE_MAX_SIZE,
+    ttl=settings.CATALOG_CACHE_TTL
+)
+_SIN_DATO = object()
+
+
+async def grupo_del_estudiante(db: AsyncPostgrestClient, id_user: str) -> Optional[str]:
+    """ID del grupo del estudiante, o None si no tiene"""
+    id_grupo = grupo_estudiante_cache.get(id_user, _SIN_DATO)
+    if id_grupo is _SIN_DATO:
+        response = await db.table("estudiante").select("id_grupo").eq("id_user", id_user).execute()
+        id_grupo = response.data[0].get("id_grupo") if response.data else None
+        grupo_estudiante_cache.set(id_user, id_grupo)
+    return id_grupo
+
+
+def invalidar_grupo_estudiante(id_user: str) -> None:
+    """Debe llamarse cuando cambia el grupo de un estudiante"""
+    grupo_estudiante_cache.delete(id_user)
+
+
+async def materias_del_grupo(db: AsyncPostgrestClient, id_grupo: str) -> List[dict]:
+    """Materias asignadas a un grupo"""
+    async def cargar():
+        response = await db.table("grupomateria").select(f"materia({COLUMNAS_MATERIA})").eq("id_grupo", id_grupo).execute()
+        return [item["materia"] for item in response.data if item.get("materia")]
+
+    return await cache_materias_grupo.obtener(id_grupo, cargar)
+
+
+async def horarios_del_grupo(db: AsyncPostgrestClient, id_grupo: str) -> List[dict]:
+    """Horarios de un grupo ordenados por día y hora"""
+    async def cargar():
+        response = await db.table("horario").select(COLUMNAS_HORARIO).eq("id_grupo", id_grupo).order("dia_semana, hora_inicio").execute()
+        return response.data
+
+    return await cache_horarios.obtener(id_grupo, cargar)
+
+
+def armar_horario_semanal(id_grupo: str, horarios: List[dict], materias: List[dict]) -> dict:
+    """
+    Arma la grilla días × franjas de un grupo
+
+    Las franjas son los intervalos entre horas de inicio/fin consecutivas de
+    todos los bloques del grupo, así cada bloque ocupa franjas completas. Cada
+    celda guarda los IDs de los horarios que ocupan esa franja ese día.
+    """
+    bloques = sorted(
+        (h for h in horarios if h["dia_semana"] in _POSICION_DIA),
+        key=lambda h: (_POSICION_DIA[h["dia_semana"]], h["hora_inicio"], h["hora_fin"])
+    )
+    # "HH:MM:SS" ordena igual como texto que como hora
+    limites = sorted({h["hora_inicio"] for h in bloques} | {h["hora_fin"] for h in bloques})
+    franjas = [
+        {"hora_inicio": inicio, "hora_fin": fin}
+        for inicio, fin in zip(limites, limites[1:])
+    ]
+
+    grilla: Dict[str, List[List[str]]] = {dia: [[] for _ in franjas] for dia in DIAS_SEMANA}
+    for bloque in bloques:
+        desde = bisect_left(limites, bloque["hora_inicio"])
+        hasta = bisect_left(limites, bloque["hora_fin"])
+        for celda in grilla[bloque["dia_semana"]][desde:hasta]:
+            celda.append(bloque["id_horario"])
+
+    return {
+        "id_grupo": id_grupo,
+        "franjas": franjas,
+        "grilla": grilla,
+        "bloques": bloques,
+        "materias": materias,
+    }
+
+
+async def horario_semanal(db: AsyncPostgrestClient, id_grupo: str) -> dict:
+    """Horario semanal de un grupo, armado una vez y servido desde la caché"""
+    async def cargar():
+        horarios = await horarios_del_grupo(db, id_grupo)
+        materias = await materias_del_grupo(db, id_grupo)
+        return armar_horario_semanal(id_grupo, horarios, materias)
+
+    return await cache_horario_semanal.obtener(id_grupo, cargar)
+
+
+async def invalidar_horarios_grupo(*ids_grupo: Optional[str]) -> None:
+    """Descarta los horarios en caché de los grupos indicados"""
+    for id_grupo in set(ids_grupo):
+        if id_grupo is None:
+            continue
+        await cache_horarios.invalidar(id_grupo)
+        await cache_horario_semanal.invalidar(id_grupo)
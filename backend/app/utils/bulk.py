@@ -0,0 +1,65 @@
+"""
+Inserciones masivas: una fila padre con sus filas hijas
+"""
+import logging
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from postgrest import AsyncPostgrestClient
+
+from app.database import rpc_no_disponible
+
+logger = logging.getLogger(__name__)
+
+
+async def insertar_con_hijos(
+    db: AsyncPostgrestClient,
+    funcion: str,
+    tabla: str,
+    padre: dict,
+    pk: str,
+    tabla_hijos: str,
+    hijos: List[dict]
+) -> dict:
+    """
+    Inserta una fila y sus filas hijas de forma atómica
+
+    Usa la función SQL `funcion(p_padre, p_hijos)`, que inserta todo en una sola
+    transacción y devuelve la fila padre. Si la función aún no existe, inserta
+    el padre y luego todas las hijas en un único INSERT masivo; si este falla,
+    elimina el padre para no dejar registros a medio crear.
+
+    Args:
+        db: Cliente de base de datos
+        funcion: Nombre de la función RPC
+        tabla: Tabla padre
+        padre: Fila padre
+        pk: Columna ID del padre (también la FK en las hijas)
+        tabla_hijos: Tabla de las filas hijas
+        hijos: Filas hijas, sin la FK al padre
+
+    Returns:
+        Fila padre creada
+    """
+    padre = jsonable_encoder(padre)
+    hijos = jsonable_encoder(hijos)
+
+    try:
+        response = await db.rpc(funcion, {"p_padre": padre, "p_hijos": hijos}).execute()
+        return response.data
+    except Exception as e:
+        if not rpc_no_disponible(e):
+            raise
+        logger.warning(f"Función {funcion} no disponible, usando inserción masiva sin transacción")
+
+    response = await db.table(tabla).insert(padre).execute()
+    creado = response.data[0]
+
+    if hijos:
+        try:
+            await db.table(tabla_hijos).insert([{**hijo, pk: creado[pk]} for hijo in hijos]).execute()
+        except Exception:
+            await db.table(tabla).delete().eq(pk, creado[pk]).execute()
+            raise
+
+    return creado
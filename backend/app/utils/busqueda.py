@@ -0,0 +1,304 @@
+"""
+Índice en memoria para la búsqueda de usuarios activos
+
+Cada usuario se indexa por las palabras de su nombre, apellido y correo,
+normalizadas (minúsculas y sin tildes). Las búsquedas resuelven primero por
+prefijo sobre una lista ordenada (bisect) y, si no alcanzan, por trigramas,
+que cubren subcadenas y errores de tipeo. El índice se carga una vez por
+proceso, las rutas de alta/edición/baja lo mantienen al día y se reconstruye
+en segundo plano cada `USER_SEARCH_INDEX_TTL` segundos para recoger cambios
+hechos fuera de este proceso.
+"""
+import asyncio
+import heapq
+import logging
+import re
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+from postgrest import AsyncPostgrestClient
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Columnas que guarda el índice (nunca la contraseña)
+CAMPOS_INDICE = ("id_user", "nombre", "apellido", "correo", "rol", "foto_perfil", "fecha_registro")
+
+# Filas por consulta al cargar el índice
+TAMANO_PAGINA = 1000
+
+# Proporción mínima de trigramas compartidos para aceptar una coincidencia aproximada
+SIMILITUD_MINIMA = 0.5
+
+_NO_ALFANUMERICO = re.compile(r"[^a-z0-9]+")
+
+
+def normalizar(texto: Optional[str]) -> str:
+    """Minúsculas, sin tildes ni signos: "José-Ñuñez" -> "jose nunez" """
+    if not texto:
+        return ""
+    sin_tildes = "".join(
+        c for c in unicodedata.normalize("NFKD", texto)
+        if not unicodedata.combining(c)
+    )
+    return _NO_ALFANUMERICO.sub(" ", sin_tildes.lower()).strip()
+
+
+def _trigramas(palabra: str) -> Set[str]:
+    return {palabra[i:i + 3] for i in range(len(palabra) - 2)}
+
+
+def _palabras(usuario: dict) -> List[str]:
+    """Palabras indexadas de un usuario: nombre, apellido y la parte local del correo"""
+    local = (usuario.get("correo") or "").split("@")[0]
+    palabras = (
+        normalizar(usuario.get("nombre")).split()
+        + normalizar(usuario.get("apellido")).split()
+        + normalizar(local).split()
+        + [normalizar(local).replace(" ", "")]
+    )
+    return list(dict.fromkeys(p for p in palabras if p))
+
+
+class IndiceUsuarios:
+    """
+    Índice de prefijos y trigramas sobre los usuarios activos
+
+    Todas las modificaciones ocurren en el event loop sin `await` intermedios,
+    así que no necesita bloqueos.
+    """
+
+    def __init__(self, ttl: float):
+        """
+        Args:
+            ttl: Segundos entre reconstrucciones completas (0 = nunca)
+        """
+        self.ttl = ttl
+        self._reiniciar()
+        self.cargado = False
+        self.cargado_en = 0.0
+        self._lock = asyncio.Lock()
+        self._recarga: Optional[asyncio.Task] = None
+        # Cambios recibidos mientras se carga una versión nueva (se reaplican al final)
+        self._pendientes: Optional[List[Tuple[str, object]]] = None
+
+    def _reiniciar(self) -> None:
+        self._usuarios: Dict[str, dict] = {}
+        self._palabras_de: Dict[str, List[str]] = {}
+        self._orden: Dict[str, Tuple[str, str]] = {}  # Desempate: apellido, nombre
+        self._prefijos: List[Tuple[str, str]] = []  # (palabra, id_user) ordenado
+        self._trigramas: Dict[str, Set[str]] = defaultdict(set)
+
+    # ----- mantenimiento -----
+
+    def registrar(self, usuario: dict) -> None:
+        """Agrega o actualiza un usuario; si está inactivo lo quita del índice"""
+        if self._pendientes is not None:
+            self._pendientes.append(("registrar", dict(usuario)))
+
+        id_user = usuario["id_user"]
+        if id_user in self._usuarios:
+            usuario = {**self._usuarios[id_user], **usuario}
+            self._quitar(id_user)
+        if usuario.get("activo", True) is False:
+            return
+        self._indexar(usuario, lambda entrada: insort(self._prefijos, entrada))
+
+    def _indexar(self, usuario: dict, agregar_prefijo) -> None:
+        id_user = usuario["id_user"]
+        palabras = _palabras(usuario)
+        self._usuarios[id_user] = {campo: usuario.get(campo) for campo in CAMPOS_INDICE}
+        self._palabras_de[id_user] = palabras
+        self._orden[id_user] = (normalizar(usuario.get("apellido")), normalizar(usuario.get("nombre")))
+        for palabra in palabras:
+            agregar_prefijo((palabra, id_user))
+            for trigrama in _trigramas(palabra):
+                self._trigramas[trigrama].add(id_user)
+
+    def quitar(self, id_user: str) -> None:
+        """Quita un usuario del índice (por ejemplo, al desactivarlo)"""
+        if self._pendientes is not None:
+            self._pendientes.append(("quitar", id_user))
+        self._quitar(id_user)
+
+    def _quitar(self, id_user: str) -> None:
+        if self._usuarios.pop(id_user, None) is None:
+            return
+        del self._orden[id_user]
+        for palabra in self._palabras_de.pop(id_user):
+            posicion = bisect_left(self._prefijos, (palabra, id_user))
+            if posicion < len(self._prefijos) and self._prefijos[posicion] == (palabra, id_user):
+                del self._prefijos[posicion]
+            for trigrama in _trigramas(palabra):
+                ids = self._trigramas.get(trigrama)
+                if ids is not None:
+                    ids.discard(id_user)
+                    if not ids:
+                        del self._trigramas[trigrama]
+
+    # ----- carga -----
+
+    @staticmethod
+    def _construir(filas: List[dict]) -> dict:
+        """Estructuras de un índice nuevo con `filas` (se ordena una sola vez al final)"""
+        nuevo = IndiceUsuarios.__new__(IndiceUsuarios)
+        nuevo._reiniciar()
+        for fila in filas:
+            nuevo._indexar(fila, nuevo._prefijos.append)
+        nuevo._prefijos.sort()
+        return {
+            "_usuarios": nuevo._usuarios,
+            "_palabras_de": nuevo._palabras_de,
+            "_orden": nuevo._orden,
+            "_prefijos": nuevo._prefijos,
+            "_trigramas": nuevo._trigramas,
+        }
+
+    async def cargar(self, db: AsyncPostgrestClient) -> None:
+        """Reconstruye el índice con todos los usuarios activos"""
+        self._pendientes = []
+        try:
+            filas: List[dict] = []
+            ultimo = None
+            while True:
+                query = db.table("usuario").select(", ".join(CAMPOS_INDICE)).eq("activo", True)
+                if ultimo is not None:
+                    query = query.gt("id_user", ultimo)
+                response = await query.order("id_user").limit(TAMANO_PAGINA).execute()
+                filas.extend(response.data)
+                if len(response.data) < TAMANO_PAGINA:
+                    break
+                ultimo = response.data[-1]["id_user"]
+
+            # La versión nueva se arma en un hilo para no bloquear el event loop
+            # y reemplaza a la actual de una sola vez
+            nuevo = await asyncio.to_thread(self._construir, filas)
+            pendientes = self._pendientes
+            self._pendientes = None
+            self.__dict__.update(nuevo)
+            for accion, dato in pendientes:
+                if accion == "registrar":
+                    self.registrar(dato)
+                else:
+                    self.quitar(dato)
+        finally:
+            self._pendientes = None
+
+        self.cargado = True
+        self.cargado_en = time.monotonic()
+        logger.info(f"Índice de búsqueda de usuarios cargado: {len(self._usuarios)} usuarios")
+
+    async def asegurar(self, db: AsyncPostgrestClient) -> None:
+        """
+        Carga el índice si aún no existe; si está vencido lo reconstruye en
+        segundo plano y mientras tanto sigue respondiendo con la versión actual
+        """
+        if not self.cargado:
+            async with self._lock:
+                if not self.cargado:
+                    await self.cargar(db)
+            return
+
+        vencido = self.ttl > 0 and time.monotonic() - self.cargado_en > self.ttl
+        if vencido and (self._recarga is None or self._recarga.done()):
+            self._recarga = asyncio.create_task(self._recargar(db))
+
+    async def _recargar(self, db: AsyncPostgrestClient) -> None:
+        try:
+            async with self._lock:
+                await self.cargar(db)
+        except Exception as e:
+            # Se reintenta en la próxima búsqueda; el índice anterior sigue en uso
+            self.cargado_en = time.monotonic()
+            logger.warning(f"No se pudo reconstruir el índice de búsqueda de usuarios: {e}")
+
+    # ----- consultas -----
+
+    def _por_prefijo(self, termino: str) -> Dict[str, float]:
+        puntajes: Dict[str, float] = {}
+        posicion = bisect_left(self._prefijos, (termino, ""))
+        while posicion < len(self._prefijos):
+            palabra, id_user = self._prefijos[posicion]
+            if not palabra.startswith(termino):
+                break
+            puntaje = 3.0 if palabra == termino else 2.0
+            if puntaje > puntajes.get(id_user, 0.0):
+                puntajes[id_user] = puntaje
+            posicion += 1
+        return puntajes
+
+    def _por_trigramas(self, termino: str) -> Dict[str, float]:
+        trigramas = _trigramas(termino)
+        if not trigramas:
+            return {}
+        comunes: Counter = Counter()
+        for trigrama in trigramas:
+            comunes.update(self._trigramas.get(trigrama, ()))
+
+        puntajes: Dict[str, float] = {}
+        for id_user, cantidad in comunes.items():
+            similitud = cantidad / len(trigramas)
+            if similitud < SIMILITUD_MINIMA:
+                continue
+            if similitud == 1.0 and any(termino in p for p in self._palabras_de[id_user]):
+                puntajes[id_user] = 1.0  # Subcadena exacta
+            else:
+                puntajes[id_user] = 0.8 * similitud
+        return puntajes
+
+    def buscar(self, q: str, limit: int = 20) -> List[dict]:
+        """
+        Usuarios que coinciden con todas las palabras de `q`, mejor puntuados primero
+
+        Por cada palabra: coincidencia exacta (3) > prefijo (2) > subcadena (1)
+        > aproximada por trigramas (< 1).
+        """
+        terminos = normalizar(q).split()
+        if not terminos:
+            return []
+
+        por_termino = [self._por_prefijo(t) for t in terminos]
+        total = self._combinar(por_termino)
+
+        if len(total) < limit:
+            for i, termino in enumerate(terminos):
+                for id_user, puntaje in self._por_trigramas(termino).items():
+                    if puntaje > por_termino[i].get(id_user, 0.0):
+                        por_termino[i][id_user] = puntaje
+            total = self._combinar(por_termino)
+
+        orden = self._orden
+        mejores = heapq.nsmallest(limit, total, key=lambda id_user: (-total[id_user], orden[id_user]))
+        return [dict(self._usuarios[id_user]) for id_user in mejores]
+
+    @staticmethod
+    def _combinar(por_termino: List[Dict[str, float]]) -> Dict[str, float]:
+        """Suma de puntajes de los usuarios que coinciden con todos los términos"""
+        if len(por_termino) == 1:
+            return por_termino[0]
+        por_termino_ordenado = sorted(por_termino, key=len)
+        total = por_termino_ordenado[0]
+        for puntajes in por_termino_ordenado[1:]:
+            total = {id_user: p + puntajes[id_user] for id_user, p in total.items() if id_user in puntajes}
+        return total
+
+    def __len__(self) -> int:
+        return len(self._usuarios)
+
+    def stats(self) -> dict:
+        """Estado del índice"""
+        return {
+            "cargado": self.cargado,
+            "usuarios": len(self._usuarios),
+            "palabras": len(self._prefijos),
+            "trigramas": len(self._trigramas),
+            "antiguedad_segundos": round(time.monotonic() - self.cargado_en, 1) if self.cargado else None,
+        }
+
+
+# Índice global del proceso
+indice_usuarios = IndiceUsuarios(ttl=settings.USER_SEARCH_INDEX_TTL)
@@ -0,0 +1,114 @@
+"""
+Caché en memoria con expiración (TTL) y desalojo LRU
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+# Valor centinela para distinguir "no está en caché" de un valor None
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Caché acotada por tamaño (LRU) y por tiempo de vida de cada entrada
+
+    Lleva contadores de aciertos, fallos y desalojos para poder medirla.
+    """
+
+    def __init__(self, name: str, maxsize: int = 1024, ttl: float = 60):
+        """
+        Args:
+            name: Nombre de la caché (para estadísticas)
+            maxsize: Número máximo de entradas
+            ttl: Tiempo de vida por defecto en segundos
+        """
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Obtiene un valor si existe y no ha expirado
+        """
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        Guarda un valor; `ttl` reemplaza el tiempo de vida por defecto
+        """
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: Hashable) -> None:
+        """Elimina una entrada (si existe)"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """Vacía la caché"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        """Estadísticas de uso de la caché"""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+# Registro global de cachés de la aplicación
+_caches: Dict[str, TTLCache] = {}
+
+
+def get_cache(name: str, maxsize: int = 1024, ttl: float = 60) -> TTLCache:
+    """
+    Obtiene (o crea) una caché con nombre
+    """
+    cache = _caches.get(name)
+    if cache is None:
+        cache = TTLCache(name, maxsize=maxsize, ttl=ttl)
+        _caches[name] = cache
+    return cache
+
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Estadísticas de todas las cachés registradas"""
+    return {name: cache.stats() for name, cache in _caches.items()}
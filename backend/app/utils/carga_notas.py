@@ -0,0 +1,219 @@
+"""
+Carga masiva de notas de una materia y un tipo de nota (un parcial, un final...)
+
+El archivo (CSV, NDJSON o arreglo JSON) se lee por bloques con los lectores de
+`app.utils.importacion`. Cada fila indica el estudiante (`id_user` o `ci_est`)
+y su `nota`; se valida con `NotaCreate` y se compara con la lista del grupo,
+que se lee una sola vez al empezar. Las filas válidas se escriben por lotes:
+un INSERT masivo para las notas nuevas y un UPSERT masivo (por `id_nota`)
+para reemplazar las que el estudiante ya tenía de ese tipo en la materia.
+"""
+import time
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from postgrest import AsyncPostgrestClient
+from pydantic import ValidationError
+
+from app.config import settings
+from app.models.academico import NotaCreate, OrigenEnum
+from app.utils.estadisticas import invalidar_estadisticas
+from app.utils.expediente import ajustar_expediente_lote
+from app.utils.importacion import FilaLeida, mensajes_validacion
+
+# Fila válida pendiente de escribir: (número de fila, nota validada, ci_est)
+FilaNota = Tuple[int, NotaCreate, Optional[str]]
+
+
+async def lista_del_grupo(
+    db: AsyncPostgrestClient,
+    id_materia: str,
+    id_grupo: Optional[str] = None
+) -> Dict[str, str]:
+    """
+    Estudiantes que pueden recibir notas en la materia: CI -> id_user
+
+    Con `id_grupo` solo los de ese grupo; si no, los de todos los grupos que
+    cursan la materia.
+    """
+    if id_grupo is not None:
+        ids_grupo = [id_grupo]
+    else:
+        grupos = await db.table("grupomateria").select("id_grupo").eq("id_materia", id_materia).execute()
+        ids_grupo = [fila["id_grupo"] for fila in grupos.data]
+    if not ids_grupo:
+        return {}
+
+    response = await db.table("estudiante").select("ci_est, id_user").in_("id_grupo", ids_grupo).execute()
+    return {fila["ci_est"]: fila["id_user"] for fila in response.data}
+
+
+async def _escribir_lote(
+    db: AsyncPostgrestClient,
+    id_materia: str,
+    tipo_nota: str,
+    lote: List[FilaNota],
+    resultado: dict
+) -> None:
+    """Inserta las notas nuevas y reemplaza las existentes de un lote"""
+    ids_user = [data.id_user for _, data, _ in lote]
+    existentes = await db.table("nota").select("id_nota, id_user, nota").eq(
+        "id_materia", id_materia
+    ).eq("tipo_nota", tipo_nota).in_("id_user", ids_user).execute()
+
+    anteriores: Dict[str, List[dict]] = {}
+    for fila in existentes.data:
+        anteriores.setdefault(fila["id_user"], []).append(fila)
+
+    nuevas: List[Tuple[FilaNota, dict]] = []
+    reemplazos: List[Tuple[FilaNota, dict, dict]] = []
+    for fila in lote:
+        numero, data, ci_est = fila
+        previas = anteriores.get(data.id_user, [])
+        if len(previas) > 1:
+            _rechazar(resultado, numero, data.id_user, ci_est, data.nota, [
+                f"El estudiante ya tiene {len(previas)} notas de tipo {tipo_nota}; edítelas una por una"
+            ])
+        elif previas:
+            reemplazos.append((fila, jsonable_encoder({**data.dict(), "id_nota": previas[0]["id_nota"]}), previas[0]))
+        else:
+            nuevas.append((fila, jsonable_encoder(data.dict())))
+
+    ajustes = []
+    if nuevas:
+        try:
+            await db.table("nota").insert([datos for _, datos in nuevas]).execute()
+        except Exception as e:
+            for (numero, data, ci_est), _ in nuevas:
+                _rechazar(resultado, numero, data.id_user, ci_est, data.nota, [f"Lote rechazado al crear notas: {e}"])
+        else:
+            for (numero, data, ci_est), _ in nuevas:
+                _aceptar(resultado, numero, data, ci_est, "creada")
+                ajustes.append({"id_user": data.id_user, "id_materia": id_materia, "evaluaciones": 1, "suma": data.nota})
+
+    if reemplazos:
+        try:
+            await db.table("nota").upsert([datos for _, datos, _ in reemplazos], on_conflict="id_nota").execute()
+        except Exception as e:
+            for (numero, data, ci_est), _, _ in reemplazos:
+                _rechazar(resultado, numero, data.id_user, ci_est, data.nota, [f"Lote rechazado al actualizar notas: {e}"])
+        else:
+            for (numero, data, ci_est), _, previa in reemplazos:
+                _aceptar(resultado, numero, data, ci_est, "actualizada")
+                diferencia = data.nota - float(previa["nota"])
+                if diferencia:
+                    ajustes.append({"id_user": data.id_user, "id_materia": id_materia, "evaluaciones": 0, "suma": diferencia})
+
+    await ajustar_expediente_lote(db, ajustes)
+
+
+def _aceptar(resultado: dict, numero: int, data: NotaCreate, ci_est: Optional[str], estado: str) -> None:
+    resultado["filas"].append({
+        "fila": numero,
+        "id_user": data.id_user,
+        "ci_est": ci_est,
+        "nota": data.nota,
+        "estado": estado,
+    })
+    resultado["creadas" if estado == "creada" else "actualizadas"] += 1
+
+
+def _rechazar(
+    resultado: dict,
+    numero: int,
+    id_user: Optional[str],
+    ci_est: Optional[str],
+    nota,
+    errores: List[str]
+) -> None:
+    resultado["filas"].append({
+        "fila": numero,
+        "id_user": id_user,
+        "ci_est": ci_est,
+        "nota": nota if isinstance(nota, (int, float)) else None,
+        "estado": "rechazada",
+        "errores": errores,
+    })
+
+
+async def cargar_notas(
+    db: AsyncPostgrestClient,
+    id_materia: str,
+    tipo_nota: str,
+    filas: AsyncIterator[FilaLeida],
+    id_grupo: Optional[str] = None,
+    tamano_lote: Optional[int] = None
+) -> dict:
+    """
+    Carga las notas de un tipo en una materia fila por fila, escribiendo por lotes
+
+    Args:
+        db: Cliente de base de datos
+        id_materia: Materia de todas las notas
+        tipo_nota: Tipo de todas las notas (por ejemplo "Parcial 1")
+        filas: Filas leídas con `leer_filas` (columnas `id_user` o `ci_est` y `nota`)
+        id_grupo: Grupo cuya lista se usa para verificar a los estudiantes
+        tamano_lote: Filas por lote de escritura (por defecto IMPORT_BATCH_SIZE)
+
+    Returns:
+        Resumen con el resultado de cada fila y la velocidad
+    """
+    tamano_lote = tamano_lote or settings.IMPORT_BATCH_SIZE
+    inicio = time.perf_counter()
+
+    lista = await lista_del_grupo(db, id_materia, id_grupo)
+    ids_lista = set(lista.values())
+
+    resultado: Dict = {"total_filas": 0, "creadas": 0, "actualizadas": 0, "filas": []}
+    vistos: set = set()
+    lote: List[FilaNota] = []
+
+    async for numero, fila, error in filas:
+        resultado["total_filas"] += 1
+        if error:
+            _rechazar(resultado, numero, None, None, None, [error])
+            continue
+
+        ci_est = fila.get("ci_est") or fila.get("ci")
+        id_user = fila.get("id_user") or lista.get(ci_est)
+        if id_user is None:
+            motivo = "El CI no pertenece a la lista del grupo" if ci_est else "Falta id_user o ci_est"
+            _rechazar(resultado, numero, None, ci_est, fila.get("nota"), [motivo])
+            continue
+
+        try:
+            data = NotaCreate(
+                nota=fila.get("nota"),
+                tipo_nota=tipo_nota,
+                id_user=id_user,
+                id_materia=id_materia,
+                origen=OrigenEnum.MANUAL
+            )
+        except ValidationError as e:
+            _rechazar(resultado, numero, id_user, ci_est, fila.get("nota"), mensajes_validacion(e))
+            continue
+
+        if data.id_user not in ids_lista:
+            _rechazar(resultado, numero, data.id_user, ci_est, data.nota, ["El estudiante no pertenece a la lista del grupo"])
+            continue
+        if data.id_user in vistos:
+            _rechazar(resultado, numero, data.id_user, ci_est, data.nota, ["Estudiante repetido en el archivo"])
+            continue
+        vistos.add(data.id_user)
+
+        lote.append((numero, data, ci_est))
+        if len(lote) >= tamano_lote:
+            await _escribir_lote(db, id_materia, tipo_nota, lote, resultado)
+            lote = []
+
+    if lote:
+        await _escribir_lote(db, id_materia, tipo_nota, lote, resultado)
+    if resultado["creadas"] or resultado["actualizadas"]:
+        await invalidar_estadisticas(id_materia)
+
+    duracion = time.perf_counter() - inicio
+    resultado["filas"].sort(key=lambda f: f["fila"])
+    resultado["rechazadas"] = sum(1 for f in resultado["filas"] if f["estado"] == "rechazada")
+    resultado["duracion_segundos"] = round(duracion, 3)
+    resultado["filas_por_segundo"] = round(resultado["total_filas"] / duracion, 1) if duracion else 0.0
+    return resultado
@@ -0,0 +1,315 @@
+"""
+Caché de lectura del catálogo académico
+
+Materias, grupos, grupo-materia, horarios y gestiones cambian pocas veces por
+semestre pero se leen en cada carga del panel (las estadísticas de notas, que
+se calculan a partir de la tabla nota, usan la misma caché). Cada lectura pasa por:
+
+1. Una caché local del proceso (`TTLCache`, LRU con tiempo de vida).
+2. Opcionalmente un almacén compartido entre procesos (`AlmacenCompartido`),
+   por ejemplo Redis; `AlmacenMemoria` lo reemplaza en desarrollo y pruebas.
+3. Supabase, solo si ninguna de las anteriores tiene el dato.
+
+Las rutas que crean, editan o eliminan filas llaman a `invalidar_catalogo(tabla)`.
+Cada tabla tiene un número de versión que forma parte de la clave: invalidar
+incrementa la versión, con lo que las entradas anteriores quedan inalcanzables
+en todos los procesos sin tener que buscarlas y borrarlas.
+
+Los valores guardados se comparten entre peticiones: no deben modificarse.
+"""
+import asyncio
+import logging
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from app.config import settings
+from app.utils.cache import get_cache
+
+logger = logging.getLogger(__name__)
+
+# Tablas del catálogo (las únicas que aceptan `invalidar_catalogo`)
+TABLAS_CATALOGO = ("materia", "grupo", "grupomateria", "horario", "gestionacademica", "nota")
+
+# Valor centinela para distinguir "no está en caché" de un valor None
+_FALTA = object()
+
+
+class AlmacenCompartido(ABC):
+    """
+    Almacén clave-valor compartido entre procesos
+
+    Los valores son estructuras JSON (listas, diccionarios, textos o números).
+    """
+
+    nombre = "compartido"
+
+    @abstractmethod
+    async def get(self, clave: str) -> Any:
+        """Valor guardado o None si no existe o expiró"""
+
+    @abstractmethod
+    async def set(self, clave: str, valor: Any, ttl: float) -> None:
+        """Guarda un valor por `ttl` segundos"""
+
+    @abstractmethod
+    async def eliminar(self, clave: str) -> None:
+        """Elimina una clave (si existe)"""
+
+    @abstractmethod
+    async def version(self, tabla: str) -> int:
+        """Versión actual de una tabla (0 si nunca se invalidó)"""
+
+    @abstractmethod
+    async def incrementar_version(self, tabla: str) -> int:
+        """Incrementa la versión de una tabla y devuelve la nueva"""
+
+
+class AlmacenMemoria(AlmacenCompartido):
+    """Almacén compartido en memoria, para desarrollo y pruebas (un solo proceso)"""
+
+    nombre = "memoria"
+
+    def __init__(self):
+        self._datos: Dict[str, Tuple[Any, float]] = {}
+        self._versiones: Dict[str, int] = {}
+
+    async def get(self, clave: str) -> Any:
+        entrada = self._datos.get(clave)
+        if entrada is None:
+            return None
+        valor, expira_en = entrada
+        if expira_en <= time.monotonic():
+            del self._datos[clave]
+            return None
+        return valor
+
+    async def set(self, clave: str, valor: Any, ttl: float) -> None:
+        self._datos[clave] = (valor, time.monotonic() + ttl)
+
+    async def eliminar(self, clave: str) -> None:
+        self._datos.pop(clave, None)
+
+    async def version(self, tabla: str) -> int:
+        return self._versiones.get(tabla, 0)
+
+    async def incrementar_version(self, tabla: str) -> int:
+        self._versiones[tabla] = self._versiones.get(tabla, 0) + 1
+        return self._versiones[tabla]
+
+
+# Almacenes disponibles para CATALOG_CACHE_BACKEND
+ALMACENES: Dict[str, Callable[[], AlmacenCompartido]] = {
+    "memoria": AlmacenMemoria,
+}
+
+
+class CacheCatalogo:
+    """
+    Caché de lectura de una consulta del catálogo que depende de una o más tablas
+
+    Las consultas concurrentes de una misma clave esperan una sola carga.
+    """
+
+    def __init__(self, nombre: str, tablas: Tuple[str, ...], ttl: float, maxsize: int):
+        """
+        Args:
+            nombre: Nombre de la caché (para estadísticas y claves compartidas)
+            tablas: Tablas cuyo cambio invalida esta caché
+            ttl: Tiempo de vida de cada entrada en segundos
+            maxsize: Entradas máximas en la caché local
+        """
+        self.nombre = nombre
+        self.tablas = tablas
+        self.ttl = ttl
+        self.local = get_cache(f"catalogo:{nombre}", maxsize=maxsize, ttl=ttl)
+        self._en_curso: Dict[Hashable, asyncio.Future] = {}
+        # Cambia con cada invalidación; una carga iniciada antes no se guarda
+        self._generacion = 0
+        self.cargas = 0
+        self.aciertos_compartidos = 0
+        self.invalidaciones = 0
+
+    def _clave_compartida(self, versiones: Tuple[int, ...], clave: Hashable) -> str:
+        return f"catalogo:{self.nombre}:{'.'.join(map(str, versiones))}:{clave!r}"
+
+    async def obtener(self, clave: Hashable, cargar: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Devuelve el valor de `clave`; si no está en caché lo obtiene con `cargar()`
+
+        Args:
+            clave: Identifica la consulta (por ejemplo el ID o los parámetros de la página)
+            cargar: Función que consulta la base de datos
+
+        Returns:
+            Valor en caché o recién cargado (no modificarlo)
+        """
+        valor = self.local.get(clave, _FALTA)
+        if valor is not _FALTA:
+            return valor
+
+        en_curso = self._en_curso.get(clave)
+        if en_curso is not None:
+            return await asyncio.shield(en_curso)
+
+        future = asyncio.get_running_loop().create_future()
+        self._en_curso[clave] = future
+        try:
+            valor = await self._obtener_compartido(clave, cargar)
+            future.set_result(valor)
+            return valor
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # Evita el aviso de excepción no recuperada si nadie esperaba
+            raise
+        finally:
+            del self._en_curso[clave]
+
+    async def _obtener_compartido(self, clave: Hashable, cargar: Callable[[], Awaitable[Any]]) -> Any:
+        generacion = self._generacion
+        almacen = _almacen
+        if almacen is None:
+            valor = await cargar()
+            self.cargas += 1
+        else:
+            valor = await self._leer_compartido(almacen, clave, cargar)
+
+        if generacion == self._generacion:
+            self.local.set(clave, valor)
+        return valor
+
+    async def _leer_compartido(
+        self,
+        almacen: AlmacenCompartido,
+        clave: Hashable,
+        cargar: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        versiones = tuple([await almacen.version(tabla) for tabla in self.tablas])
+        clave_compartida = self._clave_compartida(versiones, clave)
+        try:
+            # Los valores van envueltos en una lista para poder guardar None
+            guardado = await almacen.get(clave_compartida)
+        except Exception as e:
+            logger.warning(f"Almacén compartido no disponible ({self.nombre}): {e}")
+            guardado = None
+
+        if guardado is not None:
+            self.aciertos_compartidos += 1
+            return guardado[0]
+
+        valor = await cargar()
+        self.cargas += 1
+        try:
+            await almacen.set(clave_compartida, [valor], self.ttl)
+        except Exception as e:
+            logger.warning(f"No se pudo guardar en el almacén compartido ({self.nombre}): {e}")
+        return valor
+
+    async def invalidar(self, clave: Hashable) -> None:
+        """
+        Descarta una sola clave (por ejemplo, los horarios de un grupo) en la caché
+        local y en el almacén compartido
+        """
+        self._generacion += 1
+        self.local.delete(clave)
+        self.invalidaciones += 1
+        almacen = _almacen
+        if almacen is None:
+            return
+        try:
+            versiones = tuple([await almacen.version(tabla) for tabla in self.tablas])
+            await almacen.eliminar(self._clave_compartida(versiones, clave))
+        except Exception as e:
+            logger.warning(f"No se pudo invalidar {clave!r} en el almacén compartido ({self.nombre}): {e}")
+
+    def invalidar_local(self) -> None:
+        """Vacía la caché local de este proceso"""
+        self._generacion += 1
+        self.local.clear()
+        self.invalidaciones += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Estadísticas de la caché"""
+        # Aciertos y fallos de la caché local aparecen en `cache_stats()`
+        return {
+            "tablas": list(self.tablas),
+            "cargas": self.cargas,
+            "aciertos_compartidos": self.aciertos_compartidos,
+            "invalidaciones": self.invalidaciones,
+        }
+
+
+# Almacén compartido activo (None = solo caché local)
+_almacen: Optional[AlmacenCompartido] = None
+_caches_catalogo: Dict[str, CacheCatalogo] = {}
+
+
+def configurar_almacen(almacen: Optional[AlmacenCompartido]) -> None:
+    """
+    Cambia el almacén compartido (None para usar solo la caché local)
+
+    Vacía las cachés locales para no mezclar datos de almacenes distintos.
+    """
+    global _almacen
+    _almacen = almacen
+    for cache in _caches_catalogo.values():
+        cache.local.clear()
+
+
+def cache_catalogo(nombre: str, tablas: Tuple[str, ...]) -> CacheCatalogo:
+    """
+    Obtiene (o crea) la caché de catálogo `nombre`
+
+    Args:
+        nombre: Nombre de la caché
+        tablas: Tablas de `TABLAS_CATALOGO` de las que dependen sus valores
+    """
+    cache = _caches_catalogo.get(nombre)
+    if cache is None:
+        desconocidas = set(tablas) - set(TABLAS_CATALOGO)
+        if desconocidas:
+            raise ValueError(f"Tablas fuera del catálogo: {', '.join(sorted(desconocidas))}")
+        cache = CacheCatalogo(
+            nombre, tablas,
+            ttl=settings.CATALOG_CACHE_TTL,
+            maxsize=settings.CATALOG_CACHE_MAX_SIZE
+        )
+        _caches_catalogo[nombre] = cache
+    return cache
+
+
+async def invalidar_catalogo(*tablas: str) -> None:
+    """
+    Descarta lo guardado de las cachés que dependen de `tablas`
+
+    Debe llamarse después de cada alta, edición o baja en una tabla del catálogo.
+    Los demás procesos ven el cambio en la siguiente lectura que no encuentre
+    el dato en su caché local (como mucho `CATALOG_CACHE_TTL` segundos).
+    """
+    if _almacen is not None:
+        for tabla in tablas:
+            try:
+                await _almacen.incrementar_version(tabla)
+            except Exception as e:
+                logger.warning(f"No se pudo invalidar {tabla} en el almacén compartido: {e}")
+
+    for cache in _caches_catalogo.values():
+        if any(tabla in cache.tablas for tabla in tablas):
+            cache.invalidar_local()
+
+
+def catalogo_stats() -> Dict[str, Any]:
+    """Estadísticas de las cachés del catálogo"""
+    return {
+        "almacen": _almacen.nombre if _almacen is not None else None,
+        "caches": {nombre: cache.stats() for nombre, cache in _caches_catalogo.items()},
+    }
+
+
+if settings.CATALOG_CACHE_BACKEND:
+    if settings.CATALOG_CACHE_BACKEND not in ALMACENES:
+        raise ValueError(
+            f"CATALOG_CACHE_BACKEND desconocido: {settings.CATALOG_CACHE_BACKEND} "
+            f"(opciones: {', '.join(ALMACENES)})"
+        )
+    configurar_almacen(ALMACENES[settings.CATALOG_CACHE_BACKEND]())
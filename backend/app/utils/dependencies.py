@@ -4,21 +4,60 @@ Dependencias reutilizables para FastAPI
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from typing import Optional, List
+import hashlib
+import logging
+import time
+from app.config import settings
 from app.database import get_db
 from app.utils.security import verify_token
-from supabase import Client
+from app.utils.loaders import DataLoaders
+from app.utils.cache import get_cache
+from app.utils.proyeccion import columnas
+from app.models.usuario import Usuario
+from postgrest import AsyncPostgrestClient
+
+logger = logging.getLogger(__name__)
 
 # Esquema de seguridad Bearer
 security = HTTPBearer()
 
+# Cachés de autenticación: payloads verificados (por huella del token) y filas de usuario
+token_cache = get_cache(
+    "auth_tokens",
+    maxsize=settings.AUTH_CACHE_MAX_SIZE,
+    ttl=settings.AUTH_TOKEN_CACHE_TTL
+)
+user_cache = get_cache(
+    "auth_users",
+    maxsize=settings.AUTH_CACHE_MAX_SIZE,
+    ttl=settings.AUTH_USER_CACHE_TTL
+)
+
+
+def _token_digest(token: str) -> str:
+    """Huella del token para usarla como clave de caché sin guardar el token"""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def invalidate_user_cache(id_user: str) -> None:
+    """
+    Elimina el usuario de la caché de autenticación
+
+    Debe llamarse cada vez que se modifica o desactiva un usuario.
+    """
+    user_cache.delete(id_user)
+
 
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Client = Depends(get_db)
+    db: AsyncPostgrestClient = Depends(get_db)
 ) -> dict:
     """
     Obtiene el usuario actual desde el token JWT
     
+    El payload verificado del token y la fila del usuario se guardan en caché,
+    así las peticiones autenticadas no repiten la verificación ni la consulta.
+    
     Args:
         credentials: Credenciales de autorización (token)
         db: Cliente de base de datos
@@ -29,20 +68,30 @@ async def get_current_user(
     Raises:
         HTTPException: Si el token es inválido o el usuario no existe
     """
-    import logging
-    logger = logging.getLogger(__name__)
-    
     # Verificar token
     token = credentials.credentials
-    logger.debug(f"Token recibido: {token[:30]}...")
     
     # Asegurarse de que el token no tenga 'Bearer' incluido
     if token.startswith('Bearer '):
         token = token.replace('Bearer ', '')
         logger.warning("Se detectó 'Bearer' en el token, removiendo...")
     
-    payload = verify_token(token, token_type="access")
-    logger.info(f"Resultado de verificación: {payload}")
+    digest = _token_digest(token)
+    payload = token_cache.get(digest)
+    
+    if payload is None:
+        payload = verify_token(token, token_type="access")
+        logger.debug(f"Resultado de verificación: {payload}")
+        
+        if payload is not None and not isinstance(payload.get("exp"), (int, float)):
+            # Los tokens de la API siempre expiran; uno firmado sin `exp` no caducaría nunca
+            logger.warning("Token sin fecha de expiración")
+            payload = None
+
+        if payload is not None:
+            # La entrada nunca sobrevive a la expiración del token
+            remaining = payload["exp"] - time.time()
+            token_cache.set(digest, payload, ttl=min(remaining, settings.AUTH_TOKEN_CACHE_TTL))
     
     if payload is None:
         logger.warning("Token inválido o expirado")
@@ -61,9 +110,18 @@ async def get_current_user(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    # Obtener usuario de la base de datos
-    try:
-        response = db.table("usuario").select("*").eq("id_user", user_id).execute()
+    # Obtener usuario de la caché o de la base de datos
+    user = user_cache.get(user_id)
+    
+    if user is None:
+        try:
+            # Sin el hash de la contraseña: la fila queda en caché en memoria
+            response = await db.table("usuario").select(columnas(Usuario)).eq("id_user", user_id).execute()
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Error al obtener usuario: {str(e)}"
+            )
         
         if not response.data or len(response.data) == 0:
             raise HTTPException(
@@ -72,21 +130,17 @@ async def get_current_user(
             )
         
         user = response.data[0]
-        
-        # Verificar que el usuario esté activo
-        if not user.get("activo", True):
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Usuario inactivo"
-            )
-        
-        return user
-        
-    except Exception as e:
+        user_cache.set(user_id, user)
+    
+    # Verificar que el usuario esté activo
+    if not user.get("activo", True):
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error al obtener usuario: {str(e)}"
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Usuario inactivo"
         )
+    
+    # Copia para que las rutas no modifiquen la entrada en caché
+    return dict(user)
 
 
 async def get_current_active_user(
@@ -141,6 +195,18 @@ def require_role(allowed_roles: List[str]):
     return role_checker
 
 
+async def get_loaders(
+    db: AsyncPostgrestClient = Depends(get_db)
+) -> DataLoaders:
+    """
+    Cargadores por lotes con alcance de request
+
+    FastAPI resuelve la dependencia una vez por request, así que todas las
+    funciones que la usen comparten lotes y memoria.
+    """
+    return DataLoaders(db)
+
+
 # Dependencias pre-configuradas para roles comunes
 require_estudiante = require_role(["estudiante"])
 require_docente = require_role(["docente"])
@@ -0,0 +1,81 @@
+"""
+Contadores desnormalizados de interacción (comentarios y reacciones)
+
+Publicacion y Comentario guardan sus propios conteos para que el feed los lea
+en O(1). Las rutas de escritura los ajustan con `ajustar_contadores` y la
+función `reconciliar_engagement` corrige cualquier desviación acumulada.
+
+Uso como tarea programada:
+    python -m app.utils.engagement
+"""
+import asyncio
+import logging
+from typing import Optional
+
+from postgrest import AsyncPostgrestClient
+
+logger = logging.getLogger(__name__)
+
+
+async def ajustar_contadores(
+    db: AsyncPostgrestClient,
+    id_publicacion: Optional[str] = None,
+    id_comentario: Optional[str] = None,
+    comentarios: int = 0,
+    tipo_reac: Optional[str] = None,
+    reacciones: int = 0
+) -> None:
+    """
+    Suma (o resta) a los contadores de una publicación o comentario
+
+    La escritura principal ya se realizó, así que un fallo aquí no se propaga:
+    se registra y la reconciliación periódica corrige el conteo.
+
+    Args:
+        db: Cliente de base de datos
+        id_publicacion: Publicación a ajustar
+        id_comentario: Comentario a ajustar
+        comentarios: Variación de comentarios
+        tipo_reac: Tipo de reacción afectado
+        reacciones: Variación de reacciones
+    """
+    try:
+        await db.rpc("ajustar_engagement", {
+            "p_id_publicacion": id_publicacion,
+            "p_id_comentario": id_comentario,
+            "p_comentarios": comentarios,
+            "p_tipo_reac": tipo_reac,
+            "p_reacciones": reacciones,
+        }).execute()
+    except Exception as e:
+        logger.warning(f"No se pudieron ajustar los contadores de interacción: {e}")
+
+
+async def reconciliar_contadores(db: AsyncPostgrestClient) -> dict:
+    """
+    Recalcula los contadores desde Comentario y Reaccion
+
+    Returns:
+        Cantidad de publicaciones y comentarios cuyos contadores se corrigieron
+    """
+    response = await db.rpc("reconciliar_engagement", {}).execute()
+    fila = response.data[0] if isinstance(response.data, list) and response.data else response.data
+    return {
+        "publicaciones_corregidas": (fila or {}).get("publicaciones_corregidas", 0),
+        "comentarios_corregidos": (fila or {}).get("comentarios_corregidos", 0),
+    }
+
+
+async def _main() -> None:
+    from app.database import get_async_client, close_db
+
+    try:
+        resultado = await reconciliar_contadores(get_async_client())
+        logger.info(f"Reconciliación de contadores completada: {resultado}")
+    finally:
+        await close_db()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
@@ -0,0 +1,209 @@
+"""
+Estadísticas de notas por materia y por grupo
+
+Las notas de una materia se cargan una vez en arreglos de NumPy y todas las
+medidas (media, mediana, desviación, percentiles, aprobación e histograma) se
+calculan para cada `tipo_nota` a la vez: las filas se ordenan por
+(tipo, nota) y cada medida sale de una sola operación sobre el arreglo
+completo (`bincount` para sumas y conteos, índices calculados para los
+percentiles), sin recorrer las notas en Python.
+
+El resultado de cada materia (con el desglose por grupo) se guarda en la
+caché del catálogo y las rutas de notas lo invalidan al crear, editar o
+eliminar una nota de esa materia. El desglose por grupo usa el grupo actual
+de cada estudiante, por eso un cambio de grupo descarta las estadísticas de
+todas las materias.
+"""
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from postgrest import AsyncPostgrestClient
+
+from app.config import settings
+from app.utils.catalogo import cache_catalogo, invalidar_catalogo
+
+# Percentiles informados (el 50 es la mediana)
+PERCENTILES = (25, 50, 75, 90)
+
+# Histograma: cubetas de 10 puntos entre 0 y 100 (la última incluye el 100)
+ANCHO_CUBETA = 10
+NUMERO_CUBETAS = 10
+
+# Filas por consulta al cargar las notas de una materia
+TAMANO_PAGINA = 1000
+
+# Nota con el grupo actual del estudiante (estudiante tiene id_user único)
+COLUMNAS_NOTA_ESTADISTICA = "id_nota, nota, tipo_nota, usuario(estudiante(id_grupo))"
+
+cache_estadisticas = cache_catalogo("estadisticas_notas", ("nota",))
+
+
+def resumir(valores: np.ndarray, codigos: np.ndarray, cantidad_codigos: int, aprobacion: float) -> List[dict]:
+    """
+    Medidas de cada código (por ejemplo, cada tipo de nota) en una pasada
+
+    Args:
+        valores: Notas (float)
+        codigos: Código 0..cantidad_codigos-1 de cada nota
+        cantidad_codigos: Cantidad de códigos distintos (todos deben tener notas)
+        aprobacion: Nota mínima de aprobación
+
+    Returns:
+        Un diccionario de medidas por código, en orden de código
+    """
+    if not len(valores):
+        return []
+
+    orden = np.lexsort((valores, codigos))
+    ordenados = valores[orden]
+    codigos = codigos[orden]
+
+    cantidad = np.bincount(codigos, minlength=cantidad_codigos)
+    inicio = np.concatenate(([0], np.cumsum(cantidad)[:-1]))
+    media = np.bincount(codigos, weights=ordenados, minlength=cantidad_codigos) / cantidad
+    cuadrados = np.bincount(codigos, weights=ordenados * ordenados, minlength=cantidad_codigos) / cantidad
+    desviacion = np.sqrt(np.maximum(cuadrados - media * media, 0))
+    aprobados = np.bincount(codigos, weights=ordenados >= aprobacion, minlength=cantidad_codigos)
+
+    # Percentiles con interpolación lineal (igual que np.percentile) sobre cada tramo ordenado
+    fracciones = np.array(PERCENTILES) / 100
+    posicion = (cantidad - 1)[:, None] * fracciones[None, :]
+    abajo = np.floor(posicion).astype(int)
+    arriba = np.ceil(posicion).astype(int)
+    valor_abajo = ordenados[inicio[:, None] + abajo]
+    valor_arriba = ordenados[inicio[:, None] + arriba]
+    percentiles = valor_abajo + (valor_arriba - valor_abajo) * (posicion - abajo)
+
+    cubetas = np.minimum(ordenados // ANCHO_CUBETA, NUMERO_CUBETAS - 1).astype(int)
+    histograma = np.bincount(
+        codigos * NUMERO_CUBETAS + cubetas,
+        minlength=cantidad_codigos * NUMERO_CUBETAS
+    ).reshape(cantidad_codigos, NUMERO_CUBETAS)
+
+    minimo = ordenados[inicio]
+    maximo = ordenados[inicio + cantidad - 1]
+    limites = [(i * ANCHO_CUBETA, (i + 1) * ANCHO_CUBETA) for i in range(NUMERO_CUBETAS)]
+
+    return [
+        {
+            "cantidad": int(cantidad[i]),
+            "media": round(float(media[i]), 2),
+            "mediana": round(float(percentiles[i, PERCENTILES.index(50)]), 2),
+            "desviacion": round(float(desviacion[i]), 2),
+            "minimo": float(minimo[i]),
+            "maximo": float(maximo[i]),
+            "percentiles": {
+                f"p{p}": round(float(percentiles[i, j]), 2) for j, p in enumerate(PERCENTILES)
+            },
+            "tasa_aprobacion": round(float(aprobados[i] / cantidad[i]), 4),
+            "histograma": [
+                {"desde": desde, "hasta": hasta, "cantidad": int(histograma[i, k])}
+                for k, (desde, hasta) in enumerate(limites)
+            ],
+        }
+        for i in range(cantidad_codigos)
+    ]
+
+
+def estadisticas_por_tipo(valores: np.ndarray, tipos: np.ndarray, aprobacion: float) -> List[dict]:
+    """Medidas de cada `tipo_nota`, ordenadas por tipo"""
+    nombres, codigos = np.unique(tipos, return_inverse=True)
+    resumen = resumir(valores, codigos, len(nombres), aprobacion)
+    return [{"tipo_nota": str(nombre), **medidas} for nombre, medidas in zip(nombres, resumen)]
+
+
+def calcular_estadisticas(
+    filas: Sequence[dict],
+    aprobacion: Optional[float] = None
+) -> dict:
+    """
+    Estadísticas de un conjunto de notas, en total y por grupo
+
+    Args:
+        filas: Diccionarios con `nota`, `tipo_nota` e `id_grupo` (None si el
+            estudiante no tiene grupo)
+        aprobacion: Nota mínima de aprobación (por defecto `NOTA_APROBACION`)
+
+    Returns:
+        {"total", "nota_aprobacion", "por_tipo",
+         "por_grupo": {id_grupo: {"total", "por_tipo"}}}
+    """
+    if aprobacion is None:
+        aprobacion = settings.NOTA_APROBACION
+
+    valores = np.fromiter((float(f["nota"]) for f in filas), dtype=float, count=len(filas))
+    tipos = np.array([f["tipo_nota"] for f in filas], dtype=object).astype(str)
+    grupos = np.array([f.get("id_grupo") or "" for f in filas], dtype=object).astype(str)
+
+    resultado = {
+        "total": len(filas),
+        "nota_aprobacion": aprobacion,
+        "por_tipo": estadisticas_por_tipo(valores, tipos, aprobacion),
+        "por_grupo": {},
+    }
+    if not len(filas):
+        return resultado
+
+    # Grupo y tipo combinados en un solo código: una sola pasada para todos los grupos
+    nombres_grupo, codigo_grupo = np.unique(grupos, return_inverse=True)
+    nombres_tipo, codigo_tipo = np.unique(tipos, return_inverse=True)
+    combinados, codigos = np.unique(codigo_grupo * len(nombres_tipo) + codigo_tipo, return_inverse=True)
+    resumen = resumir(valores, codigos, len(combinados), aprobacion)
+
+    por_grupo: Dict[str, dict] = {}
+    for combinado, medidas in zip(combinados, resumen):
+        id_grupo = str(nombres_grupo[combinado // len(nombres_tipo)])
+        if not id_grupo:
+            continue  # Estudiantes sin grupo: solo cuentan en el total
+        grupo = por_grupo.setdefault(id_grupo, {"total": 0, "por_tipo": []})
+        grupo["total"] += medidas["cantidad"]
+        grupo["por_tipo"].append({"tipo_nota": str(nombres_tipo[combinado % len(nombres_tipo)]), **medidas})
+    resultado["por_grupo"] = por_grupo
+    return resultado
+
+
+def _grupo(fila: dict) -> Optional[str]:
+    """ID del grupo embebido en `usuario(estudiante(id_grupo))`"""
+    estudiante = (fila.get("usuario") or {}).get("estudiante")
+    if isinstance(estudiante, list):
+        estudiante = estudiante[0] if estudiante else None
+    return (estudiante or {}).get("id_grupo")
+
+
+async def cargar_notas_materia(db: AsyncPostgrestClient, id_materia: str) -> List[dict]:
+    """Notas de una materia con el grupo del estudiante, por páginas"""
+    filas: List[dict] = []
+    ultimo = None
+    while True:
+        query = db.table("nota").select(COLUMNAS_NOTA_ESTADISTICA).eq("id_materia", id_materia)
+        if ultimo is not None:
+            query = query.gt("id_nota", ultimo)
+        response = await query.order("id_nota").limit(TAMANO_PAGINA).execute()
+        filas.extend(
+            {"nota": fila["nota"], "tipo_nota": fila["tipo_nota"], "id_grupo": _grupo(fila)}
+            for fila in response.data
+        )
+        if len(response.data) < TAMANO_PAGINA:
+            return filas
+        ultimo = response.data[-1]["id_nota"]
+
+
+async def estadisticas_materia(db: AsyncPostgrestClient, id_materia: str) -> dict:
+    """Estadísticas de una materia (con desglose por grupo), desde la caché"""
+    async def cargar():
+        filas = await cargar_notas_materia(db, id_materia)
+        return {"id_materia": id_materia, **calcular_estadisticas(filas)}
+
+    return await cache_estadisticas.obtener(id_materia, cargar)
+
+
+async def invalidar_estadisticas(*ids_materia: Optional[str]) -> None:
+    """Descarta las estadísticas en caché de las materias indicadas"""
+    for id_materia in set(ids_materia):
+        if id_materia is not None:
+            await cache_estadisticas.invalidar(id_materia)
+
+
+async def invalidar_todas_las_estadisticas() -> None:
+    """Descarta las estadísticas de todas las materias (p. ej. al cambiar el grupo de un estudiante)"""
+    await invalidar_catalogo(*cache_estadisticas.tablas)
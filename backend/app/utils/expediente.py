@@ -0,0 +1,211 @@
+"""
+Expediente académico de cada estudiante (promedios por materia y generales)
+
+La tabla ResumenNota guarda por estudiante y materia la cantidad y la suma de
+sus notas, así el expediente se arma con una fila por materia sin leer todo
+el historial de notas. Las rutas de notas la ajustan con `ajustar_expediente`
+en cada alta, edición o baja y `reconciliar_resumen_notas` corrige cualquier
+desviación acumulada.
+
+Uso como tarea programada:
+    python -m app.utils.expediente
+"""
+import asyncio
+import logging
+from typing import List, Optional
+
+from postgrest import AsyncPostgrestClient
+
+from app.database import rpc_no_disponible
+
+logger = logging.getLogger(__name__)
+
+# Datos de la materia que acompañan a cada fila del expediente
+COLUMNAS_MATERIA_EXPEDIENTE = "id_materia, nombre_materia, codigo_materia"
+
+
+async def ajustar_expediente(
+    db: AsyncPostgrestClient,
+    id_user: str,
+    id_materia: str,
+    evaluaciones: int = 0,
+    suma: float = 0
+) -> None:
+    """
+    Suma (o resta) evaluaciones y puntos al resumen de un estudiante en una materia
+
+    Se llama después de guardar la nota y sigue la misma convención que
+    `app.utils.engagement.ajustar_contadores`: un error solo queda en el log y
+    `reconciliar_resumen_notas` recalcula el resumen.
+
+    Args:
+        db: Cliente de base de datos
+        id_user: Estudiante
+        id_materia: Materia
+        evaluaciones: Variación de la cantidad de notas
+        suma: Variación de la suma de notas
+    """
+    try:
+        await db.rpc("ajustar_resumen_nota", {
+            "p_id_user": id_user,
+            "p_id_materia": id_materia,
+            "p_evaluaciones": evaluaciones,
+            "p_suma": suma,
+        }).execute()
+    except Exception as e:
+        logger.warning(f"No se pudo ajustar el expediente de {id_user}: {e}")
+
+
+async def actualizar_nota(db: AsyncPostgrestClient, id_nota: str, cambios: dict) -> Optional[dict]:
+    """
+    Edita una nota y ajusta el resumen con la diferencia en una transacción
+
+    Usa la función `actualizar_nota` (sección 32), que bloquea la nota para
+    leer el valor que reemplaza. Sin ella se lee la nota, se actualiza y se
+    ajusta por separado: dos ediciones simultáneas restan el mismo valor
+    anterior y solo la reconciliación corrige esa desviación.
+
+    Returns:
+        La nota actualizada, o None si no existe
+    """
+    try:
+        response = await db.rpc("actualizar_nota", {
+            "p_id_nota": id_nota,
+            "p_nota": cambios.get("nota"),
+            "p_tipo_nota": cambios.get("tipo_nota"),
+        }).execute()
+        return response.data[0] if response.data else None
+    except Exception as e:
+        if not rpc_no_disponible(e):
+            raise
+        logger.warning("Función actualizar_nota no disponible, ajustando el expediente por separado")
+
+    existing = await db.table("nota").select("nota").eq("id_nota", id_nota).execute()
+    if not existing.data:
+        return None
+    response = await db.table("nota").update(cambios).eq("id_nota", id_nota).execute()
+    if not response.data:
+        return None
+    nota = response.data[0]
+    diferencia = float(nota["nota"]) - float(existing.data[0]["nota"])
+    if diferencia:
+        await ajustar_expediente(db, nota["id_user"], nota["id_materia"], 0, diferencia)
+    return nota
+
+
+async def ajustar_expediente_lote(db: AsyncPostgrestClient, ajustes: List[dict]) -> None:
+    """
+    Aplica los ajustes de un lote de notas en una sola llamada
+
+    Args:
+        db: Cliente de base de datos
+        ajustes: Diccionarios con id_user, id_materia, evaluaciones y suma
+    """
+    if not ajustes:
+        return
+    try:
+        await db.rpc("ajustar_resumen_notas_lote", {"p_ajustes": ajustes}).execute()
+    except Exception as e:
+        if not rpc_no_disponible(e):
+            logger.warning(f"No se pudo ajustar el expediente de un lote de notas: {e}")
+            return
+        logger.warning("Función ajustar_resumen_notas_lote no disponible, ajustando nota por nota")
+        await asyncio.gather(*(
+            ajustar_expediente(db, a["id_user"], a["id_materia"], a["evaluaciones"], a["suma"])
+            for a in ajustes
+        ))
+
+
+def armar_expediente(id_user: str, filas: List[dict]) -> dict:
+    """
+    Expediente a partir de los resúmenes por materia
+
+    `promedio_general` da el mismo peso a cada materia; `promedio_ponderado`
+    pondera cada materia por su cantidad de evaluaciones (la base no guarda
+    créditos por materia).
+    """
+    materias = []
+    evaluaciones = 0
+    suma_total = 0.0
+    for fila in filas:
+        cantidad = int(fila["evaluaciones"])
+        if cantidad <= 0:
+            continue
+        suma = float(fila["suma_notas"])
+        evaluaciones += cantidad
+        suma_total += suma
+        materias.append({
+            "id_materia": fila["id_materia"],
+            "materia": fila.get("materia"),
+            "evaluaciones": cantidad,
+            "promedio": round(suma / cantidad, 2),
+        })
+
+    return {
+        "id_user": id_user,
+        "materias": materias,
+        "evaluaciones": evaluaciones,
+        "promedio_general": (
+            round(sum(m["promedio"] for m in materias) / len(materias), 2) if materias else None
+        ),
+        "promedio_ponderado": round(suma_total / evaluaciones, 2) if evaluaciones else None,
+    }
+
+
+async def _resumen_desde_notas(db: AsyncPostgrestClient, id_user: str) -> List[dict]:
+    """Resumen por materia calculado desde Nota (si aún no existe la sección 30)"""
+    response = await db.table("nota").select(
+        f"id_materia, nota, materia({COLUMNAS_MATERIA_EXPEDIENTE})"
+    ).eq("id_user", id_user).execute()
+
+    resumen = {}
+    for nota in response.data:
+        fila = resumen.setdefault(nota["id_materia"], {
+            "id_materia": nota["id_materia"],
+            "materia": nota.get("materia"),
+            "evaluaciones": 0,
+            "suma_notas": 0.0,
+        })
+        fila["evaluaciones"] += 1
+        fila["suma_notas"] += float(nota["nota"])
+    return sorted(resumen.values(), key=lambda f: ((f["materia"] or {}).get("nombre_materia") or "", f["id_materia"]))
+
+
+async def expediente_estudiante(db: AsyncPostgrestClient, id_user: str) -> dict:
+    """Expediente de un estudiante leído del resumen por materia"""
+    try:
+        response = await db.rpc("expediente_estudiante", {"p_id_user": id_user}).execute()
+        filas = response.data or []
+    except Exception as e:
+        if not rpc_no_disponible(e):
+            raise
+        logger.warning("Función expediente_estudiante no disponible, calculando desde las notas")
+        filas = await _resumen_desde_notas(db, id_user)
+    return armar_expediente(id_user, filas)
+
+
+async def reconciliar_expediente(db: AsyncPostgrestClient) -> dict:
+    """
+    Recalcula ResumenNota desde Nota
+
+    Returns:
+        Cantidad de resúmenes corregidos
+    """
+    response = await db.rpc("reconciliar_resumen_notas", {}).execute()
+    corregidos = response.data[0] if isinstance(response.data, list) and response.data else response.data
+    return {"resumenes_corregidos": corregidos or 0}
+
+
+async def _main() -> None:
+    from app.database import get_async_client, close_db
+
+    try:
+        resultado = await reconciliar_expediente(get_async_client())
+        logger.info(f"Reconciliación del expediente completada: {resultado}")
+    finally:
+        await close_db()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
@@ -0,0 +1,287 @@
+"""
+Exportación de listas completas (estudiantes, notas, horarios) en CSV o XLSX
+
+La tabla se recorre por páginas con el cursor keyset de `app.utils.pagination`
+y cada página se escribe en la respuesta apenas llega, así que la descarga
+empieza de inmediato y la memoria usada no depende del tamaño de la lista.
+
+El XLSX se arma sin dependencias: `zipfile` admite escribir sobre un destino
+que no permite `seek` (agrega un descriptor de datos después de cada archivo),
+de modo que la hoja se comprime y se envía por partes a medida que se escribe.
+Las celdas de texto van como `inlineStr` para no tener que juntar todas las
+cadenas en una tabla compartida antes de terminar.
+"""
+import csv
+import io
+import logging
+import re
+import zipfile
+from typing import Any, AsyncIterator, Callable, List, Optional, Sequence, Tuple
+from xml.sax.saxutils import escape
+
+from fastapi.responses import StreamingResponse
+
+from app.utils.pagination import Orden, encode_cursor, paginar
+
+logger = logging.getLogger(__name__)
+
+# Filas por consulta al recorrer la tabla
+TAMANO_PAGINA = 1000
+
+FORMATOS_EXPORTACION = ("csv", "xlsx")
+
+TIPOS_CONTENIDO = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+# Columna exportada: (encabezado, ruta dentro de la fila, por ejemplo "usuario.nombre")
+Columna = Tuple[str, str]
+
+# Caracteres de control que XML no admite
+_CARACTERES_INVALIDOS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+
+_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{hoja}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+
+_INICIO_HOJA = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+
+_FIN_HOJA = '</sheetData></worksheet>'
+
+
+def valor_columna(fila: dict, ruta: str) -> Any:
+    """
+    Valor de una ruta con puntos dentro de una fila con relaciones embebidas
+
+    Si una relación viene como lista (uno a muchos) se toma su primer elemento.
+    """
+    valor: Any = fila
+    for parte in ruta.split("."):
+        if isinstance(valor, list):
+            valor = valor[0] if valor else None
+        if not isinstance(valor, dict):
+            return None
+        valor = valor.get(parte)
+    return valor
+
+
+async def recorrer(
+    consulta: Callable[[], Any],
+    orden: Orden,
+    tamano_pagina: int = TAMANO_PAGINA
+) -> AsyncIterator[List[dict]]:
+    """
+    Páginas de una consulta, en orden estable, hasta agotar la tabla
+
+    Args:
+        consulta: Devuelve una consulta de selección nueva (con sus filtros)
+        orden: Columnas de orden; la última debe identificar la fila
+        tamano_pagina: Filas por consulta
+    """
+    cursor = None
+    while True:
+        response = await paginar(consulta(), orden, tamano_pagina, cursor).execute()
+        if response.data:
+            yield response.data
+        if len(response.data) < tamano_pagina:
+            return
+        ultima = response.data[-1]
+        cursor = encode_cursor([ultima.get(columna) for columna, _ in orden])
+
+
+# Inicios con los que Excel interpreta una celda de texto como fórmula
+_INICIO_FORMULA = ("=", "+", "-", "@", "\t", "\r")
+
+
+def _texto_csv(valor: Any) -> Any:
+    """
+    Valor de una celda CSV; el texto que Excel tomaría como fórmula se
+    antepone con `'` (nombres y tipos de nota los escriben los usuarios)
+    """
+    valor = getattr(valor, "value", valor)
+    if valor is None:
+        return ""
+    if isinstance(valor, str) and valor.startswith(_INICIO_FORMULA):
+        return "'" + valor
+    return valor
+
+
+async def _csv(paginas: AsyncIterator[List[dict]], columnas: Sequence[Columna]) -> AsyncIterator[bytes]:
+    """CSV en UTF-8 con BOM (para que Excel reconozca los acentos), una parte por página"""
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    buffer.write("\ufeff")
+    escritor.writerow([encabezado for encabezado, _ in columnas])
+    async for pagina in paginas:
+        for fila in pagina:
+            escritor.writerow([_texto_csv(valor_columna(fila, ruta)) for _, ruta in columnas])
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+class _Salida:
+    """Destino de escritura sin `seek`: acumula lo escrito hasta que se vacía"""
+
+    def __init__(self):
+        self._partes: List[bytes] = []
+
+    def write(self, datos: bytes) -> int:
+        self._partes.append(bytes(datos))
+        return len(datos)
+
+    def flush(self) -> None:
+        pass
+
+    def vaciar(self) -> bytes:
+        datos = b"".join(self._partes)
+        self._partes.clear()
+        return datos
+
+
+def _letra_columna(indice: int) -> str:
+    """0 -> A, 25 -> Z, 26 -> AA"""
+    letras = ""
+    indice += 1
+    while indice:
+        indice, resto = divmod(indice - 1, 26)
+        letras = chr(ord("A") + resto) + letras
+    return letras
+
+
+def _celda(referencia: str, valor: Any) -> str:
+    valor = getattr(valor, "value", valor)
+    if valor is None:
+        return ""
+    if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        return f'<c r="{referencia}"><v>{valor}</v></c>'
+    texto = escape(_CARACTERES_INVALIDOS.sub("", str(valor)))
+    return f'<c r="{referencia}" t="inlineStr"><is><t xml:space="preserve">{texto}</t></is></c>'
+
+
+def _fila_xlsx(numero: int, letras: Sequence[str], valores: Sequence[Any]) -> str:
+    celdas = "".join(_celda(f"{letra}{numero}", valor) for letra, valor in zip(letras, valores))
+    return f'<row r="{numero}">{celdas}</row>'
+
+
+async def _xlsx(
+    paginas: AsyncIterator[List[dict]],
+    columnas: Sequence[Columna],
+    hoja: str
+) -> AsyncIterator[bytes]:
+    """Libro XLSX de una hoja, comprimido y enviado por partes, una por página"""
+    salida = _Salida()
+    letras = [_letra_columna(i) for i in range(len(columnas))]
+    with zipfile.ZipFile(salida, "w", compression=zipfile.ZIP_DEFLATED) as libro:
+        libro.writestr("[Content_Types].xml", _CONTENT_TYPES)
+        libro.writestr("_rels/.rels", _RELS)
+        libro.writestr("xl/workbook.xml", _WORKBOOK.format(hoja=escape(hoja, {'"': "&quot;"})))
+        libro.writestr("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS)
+
+        with libro.open("xl/worksheets/sheet1.xml", "w") as sheet:
+            sheet.write(_INICIO_HOJA.encode())
+            sheet.write(_fila_xlsx(1, letras, [encabezado for encabezado, _ in columnas]).encode("utf-8"))
+            numero = 1
+            async for pagina in paginas:
+                filas = []
+                for fila in pagina:
+                    numero += 1
+                    filas.append(_fila_xlsx(numero, letras, [valor_columna(fila, ruta) for _, ruta in columnas]))
+                sheet.write("".join(filas).encode("utf-8"))
+                datos = salida.vaciar()
+                if datos:  # zlib puede retener una página entera en su buffer
+                    yield datos
+            sheet.write(_FIN_HOJA.encode())
+    yield salida.vaciar()
+
+
+async def _continuar(primera: List[dict], resto: AsyncIterator[List[dict]], nombre: str) -> AsyncIterator[List[dict]]:
+    """Vuelve a entregar la primera página ya leída y sigue con las demás"""
+    if primera:
+        yield primera
+    try:
+        async for pagina in resto:
+            yield pagina
+    except Exception as e:
+        # La respuesta ya empezó: solo queda cortar la descarga y registrarlo
+        logger.error(f"Exportación de {nombre} interrumpida: {e}")
+        raise
+
+
+async def exportar(
+    consulta: Callable[[], Any],
+    orden: Orden,
+    columnas: Sequence[Columna],
+    formato: str,
+    nombre: str,
+    hoja: Optional[str] = None
+) -> StreamingResponse:
+    """
+    Respuesta que descarga toda la consulta como CSV o XLSX
+
+    La primera página se lee antes de responder, así un error de la consulta
+    (filtro inválido, tabla inexistente) llega como un error HTTP normal y no
+    como un archivo cortado.
+
+    Args:
+        consulta: Devuelve una consulta de selección nueva (con sus filtros)
+        orden: Columnas de orden keyset; la última debe identificar la fila
+        columnas: Encabezado y ruta de cada columna del archivo
+        formato: "csv" o "xlsx"
+        nombre: Nombre del archivo descargado, sin extensión
+        hoja: Nombre de la hoja del XLSX (por defecto `nombre`)
+    """
+    paginas = recorrer(consulta, orden)
+    primera = await anext(paginas, [])
+    continuar = _continuar(primera, paginas, nombre)
+
+    if formato == "xlsx":
+        cuerpo = _xlsx(continuar, columnas, (hoja or nombre)[:31])
+    else:
+        cuerpo = _csv(continuar, columnas)
+
+    return StreamingResponse(
+        cuerpo,
+        media_type=TIPOS_CONTENIDO[formato],
+        headers={"Content-Disposition": f'attachment; filename="{nombre}.{formato}"'}
+    )
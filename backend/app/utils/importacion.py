@@ -0,0 +1,414 @@
+"""
+Importación masiva de estudiantes y docentes desde CSV, NDJSON o JSON
+
+El archivo se lee por bloques y se procesa en lotes: cada fila se valida con
+`EstudianteCreate`/`DocenteCreate`, los CI y correos repetidos se descartan en
+memoria, las contraseñas se hashean en paralelo en el pool de bcrypt y cada
+lote se inserta con dos INSERT masivos (usuarios y filas de rol).
+
+Uso desde la línea de comandos:
+    python -m app.utils.importacion estudiantes alumnos.csv [--lote 200]
+"""
+import argparse
+import asyncio
+import codecs
+import csv
+import io
+import json
+import logging
+import time
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, UploadFile, status
+from fastapi.encoders import jsonable_encoder
+from postgrest import AsyncPostgrestClient
+from pydantic import ValidationError
+
+from app.config import settings
+from app.models.usuario import EstudianteCreate, DocenteCreate
+from app.utils.busqueda import indice_usuarios
+from app.utils.provision import datos_estudiante, datos_docente
+from app.utils.security import get_password_hash_async
+
+logger = logging.getLogger(__name__)
+
+# Tamaño de los bloques leídos del archivo
+TAMANO_BLOQUE = 64 * 1024
+
+FORMATOS = ("csv", "ndjson", "json")
+
+# Modelo de validación, armado de filas, tabla y columna de CI por tipo
+TIPOS = {
+    "estudiantes": (EstudianteCreate, datos_estudiante, "estudiante", "ci_est"),
+    "docentes": (DocenteCreate, datos_docente, "docente", "ci_doc"),
+}
+
+# (número de fila, datos o None, error de lectura o None)
+FilaLeida = Tuple[int, Optional[dict], Optional[str]]
+
+
+def detectar_formato(nombre_archivo: Optional[str]) -> str:
+    """
+    Deduce el formato a partir de la extensión del archivo
+
+    Raises:
+        HTTPException: Si la extensión no es .csv, .ndjson, .jsonl o .json
+    """
+    nombre = (nombre_archivo or "").lower()
+    if nombre.endswith(".csv"):
+        return "csv"
+    if nombre.endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    if nombre.endswith(".json"):
+        return "json"
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Formato no reconocido; use un archivo .csv, .ndjson o .json o indique `formato`"
+    )
+
+
+async def bloques_upload(archivo: UploadFile) -> AsyncIterator[bytes]:
+    """Lee un archivo subido por bloques"""
+    while True:
+        bloque = await archivo.read(TAMANO_BLOQUE)
+        if not bloque:
+            break
+        yield bloque
+
+
+async def bloques_archivo(ruta: str) -> AsyncIterator[bytes]:
+    """Lee un archivo local por bloques"""
+    with open(ruta, "rb") as f:
+        while True:
+            bloque = f.read(TAMANO_BLOQUE)
+            if not bloque:
+                break
+            yield bloque
+
+
+async def _lineas(bloques: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Decodifica los bloques (UTF-8, con o sin BOM) y los separa en líneas"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pendiente = ""
+    async for bloque in bloques:
+        pendiente += decoder.decode(bloque)
+        *lineas, pendiente = pendiente.split("\n")
+        for linea in lineas:
+            yield linea.rstrip("\r")
+    pendiente += decoder.decode(b"", final=True)
+    if pendiente:
+        yield pendiente.rstrip("\r")
+
+
+async def _elementos_json(bloques: AsyncIterator[bytes]) -> AsyncIterator[Tuple[object, Optional[str]]]:
+    """
+    Elementos de un arreglo JSON a medida que se completan en los bloques
+
+    Devuelve (elemento, None) por cada elemento y (None, error) si el archivo
+    no es un arreglo válido; después de un error no se lee nada más.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    lector = json.JSONDecoder()
+    texto = ""
+    abierto = False
+    final = False
+    iterador = bloques.__aiter__()
+
+    while True:
+        # Elementos completos en el texto ya leído
+        posicion = 0
+        while True:
+            while posicion < len(texto) and (texto[posicion].isspace() or (abierto and texto[posicion] == ",")):
+                posicion += 1
+            if posicion == len(texto):
+                break
+            if not abierto:
+                if texto[posicion] != "[":
+                    yield None, "El archivo debe contener un arreglo JSON"
+                    return
+                abierto = True
+                posicion += 1
+                continue
+            if texto[posicion] == "]":
+                return
+            try:
+                elemento, fin = lector.raw_decode(texto, posicion)
+            except ValueError as e:
+                if final:
+                    yield None, f"JSON inválido: {e}"
+                    return
+                break  # Elemento incompleto: falta leer más
+            if fin == len(texto) and not final:
+                break  # Un número al final del bloque puede continuar en el siguiente
+            posicion = fin
+            yield elemento, None
+        texto = texto[posicion:]
+
+        if final:
+            yield None, "Arreglo JSON sin cerrar al final del archivo"
+            return
+        try:
+            texto += decoder.decode(await iterador.__anext__())
+        except StopAsyncIteration:
+            texto += decoder.decode(b"", final=True)
+            final = True
+
+
+def _limpiar(fila: dict) -> dict:
+    """Recorta espacios y convierte celdas vacías en None"""
+    limpia = {}
+    for clave, valor in fila.items():
+        if clave is None:
+            continue
+        if isinstance(valor, str):
+            valor = valor.strip() or None
+        limpia[clave.strip().lower()] = valor
+    return limpia
+
+
+async def leer_filas(bloques: AsyncIterator[bytes], formato: str) -> AsyncIterator[FilaLeida]:
+    """
+    Convierte el archivo en filas a medida que llegan los bloques
+
+    En CSV la primera fila es el encabezado y un campo entre comillas puede
+    ocupar varias líneas; en NDJSON cada línea es un objeto JSON y en JSON el
+    archivo es un arreglo de objetos.
+    """
+    numero = 0
+
+    if formato == "json":
+        async for elemento, error in _elementos_json(bloques):
+            numero += 1
+            if error:
+                yield numero, None, error
+            elif not isinstance(elemento, dict):
+                yield numero, None, "Cada elemento del arreglo debe ser un objeto JSON"
+            else:
+                yield numero, _limpiar(elemento), None
+        return
+
+    if formato == "ndjson":
+        async for linea in _lineas(bloques):
+            if not linea.strip():
+                continue
+            numero += 1
+            try:
+                fila = json.loads(linea)
+            except ValueError as e:
+                yield numero, None, f"JSON inválido: {e}"
+                continue
+            if not isinstance(fila, dict):
+                yield numero, None, "Cada línea debe ser un objeto JSON"
+                continue
+            yield numero, _limpiar(fila), None
+        return
+
+    encabezado: Optional[List[str]] = None
+    registro = ""
+    async for linea in _lineas(bloques):
+        registro = f"{registro}\n{linea}" if registro else linea
+        # Un número impar de comillas indica un campo que continúa en la línea siguiente
+        if registro.count('"') % 2:
+            continue
+        texto, registro = registro, ""
+        if not texto.strip():
+            continue
+
+        valores = next(csv.reader(io.StringIO(texto)))
+        if encabezado is None:
+            encabezado = valores
+            continue
+
+        numero += 1
+        if len(valores) != len(encabezado):
+            yield numero, None, f"Se esperaban {len(encabezado)} columnas y hay {len(valores)}"
+            continue
+        yield numero, _limpiar(dict(zip(encabezado, valores))), None
+
+    if registro:
+        yield numero + 1, None, "Campo entre comillas sin cerrar al final del archivo"
+
+
+def mensajes_validacion(error: ValidationError) -> List[str]:
+    """Errores de validación de Pydantic como "campo: mensaje" """
+    return [
+        f"{'.'.join(str(parte) for parte in err['loc'])}: {err['msg']}"
+        for err in error.errors()
+    ]
+
+
+async def _procesar_lote(
+    db: AsyncPostgrestClient,
+    tipo: str,
+    lote: List[Tuple[int, object]],
+    resultado: dict
+) -> None:
+    """Verifica duplicados en la base, hashea e inserta un lote de filas válidas"""
+    _, armar, tabla, columna_ci = TIPOS[tipo]
+
+    def rechazar(numero: int, data, mensaje: str) -> None:
+        resultado["errores"].append({
+            "fila": numero,
+            "ci": getattr(data, columna_ci),
+            "correo": data.correo,
+            "errores": [mensaje]
+        })
+
+    # CI y correos que ya existen en la base (una consulta por columna)
+    cis = [getattr(data, columna_ci) for _, data in lote]
+    correos = [data.correo for _, data in lote]
+    ci_existentes, correo_existentes = await asyncio.gather(
+        db.table(tabla).select(columna_ci).in_(columna_ci, cis).execute(),
+        db.table("usuario").select("correo").in_("correo", correos).execute()
+    )
+    ci_existentes = {fila[columna_ci] for fila in ci_existentes.data}
+    correo_existentes = {fila["correo"].lower() for fila in correo_existentes.data}
+
+    pendientes = []
+    for numero, data in lote:
+        if getattr(data, columna_ci) in ci_existentes:
+            rechazar(numero, data, "El CI ya está registrado")
+        elif data.correo.lower() in correo_existentes:
+            rechazar(numero, data, "El correo ya está registrado")
+        else:
+            pendientes.append((numero, data))
+
+    if not pendientes:
+        return
+
+    # Las contraseñas se hashean en paralelo en el pool acotado de bcrypt
+    hashes = await asyncio.gather(*(get_password_hash_async(data.contrasena) for _, data in pendientes))
+    filas = [armar(data, contrasena_hash) for (_, data), contrasena_hash in zip(pendientes, hashes)]
+
+    try:
+        usuarios = await db.table("usuario").insert(jsonable_encoder([usuario for usuario, _ in filas])).execute()
+    except Exception as e:
+        for numero, data in pendientes:
+            rechazar(numero, data, f"Lote rechazado al crear usuarios: {e}")
+        return
+
+    ids_por_correo = {u["correo"].lower(): u["id_user"] for u in usuarios.data}
+    filas_rol = [
+        {**datos_rol, "id_user": ids_por_correo[usuario["correo"].lower()]}
+        for usuario, datos_rol in filas
+    ]
+
+    try:
+        await db.table(tabla).insert(jsonable_encoder(filas_rol)).execute()
+    except Exception as e:
+        # Sin la fila de rol los usuarios quedarían huérfanos
+        await db.table("usuario").delete().in_("id_user", list(ids_por_correo.values())).execute()
+        for numero, data in pendientes:
+            rechazar(numero, data, f"Lote rechazado al crear {tabla}s: {e}")
+        return
+
+    for usuario in usuarios.data:
+        indice_usuarios.registrar(usuario)
+    resultado["creados"] += len(pendientes)
+
+
+async def importar_usuarios(
+    db: AsyncPostgrestClient,
+    tipo: str,
+    filas: AsyncIterator[FilaLeida],
+    tamano_lote: Optional[int] = None
+) -> dict:
+    """
+    Importa estudiantes o docentes fila por fila, insertando por lotes
+
+    Args:
+        db: Cliente de base de datos
+        tipo: "estudiantes" o "docentes"
+        filas: Filas leídas con `leer_filas`
+        tamano_lote: Filas por lote de inserción (por defecto IMPORT_BATCH_SIZE)
+
+    Returns:
+        Resumen con creados, rechazados, errores por fila y velocidad
+    """
+    modelo, _, _, columna_ci = TIPOS[tipo]
+    tamano_lote = tamano_lote or settings.IMPORT_BATCH_SIZE
+    inicio = time.perf_counter()
+
+    resultado: Dict = {"total_filas": 0, "creados": 0, "errores": []}
+    vistos_ci: set = set()
+    vistos_correo: set = set()
+    lote: List[Tuple[int, object]] = []
+
+    async for numero, fila, error in filas:
+        resultado["total_filas"] += 1
+        if error:
+            resultado["errores"].append({"fila": numero, "errores": [error]})
+            continue
+
+        try:
+            data = modelo(**fila)
+        except ValidationError as e:
+            resultado["errores"].append({
+                "fila": numero,
+                "ci": fila.get(columna_ci),
+                "correo": fila.get("correo"),
+                "errores": mensajes_validacion(e)
+            })
+            continue
+
+        ci = getattr(data, columna_ci)
+        correo = data.correo.lower()
+        if ci in vistos_ci or correo in vistos_correo:
+            campo = "CI" if ci in vistos_ci else "correo"
+            resultado["errores"].append({
+                "fila": numero,
+                "ci": ci,
+                "correo": data.correo,
+                "errores": [f"{campo} repetido en el archivo"]
+            })
+            continue
+        vistos_ci.add(ci)
+        vistos_correo.add(correo)
+
+        lote.append((numero, data))
+        if len(lote) >= tamano_lote:
+            await _procesar_lote(db, tipo, lote, resultado)
+            lote = []
+
+    if lote:
+        await _procesar_lote(db, tipo, lote, resultado)
+
+    duracion = time.perf_counter() - inicio
+    resultado["errores"].sort(key=lambda err: err["fila"])
+    resultado["rechazados"] = len(resultado["errores"])
+    resultado["duracion_segundos"] = round(duracion, 3)
+    resultado["filas_por_segundo"] = round(resultado["total_filas"] / duracion, 1) if duracion else 0.0
+
+    logger.info(
+        f"Importación de {tipo}: {resultado['creados']} creados, "
+        f"{resultado['rechazados']} rechazados en {resultado['duracion_segundos']}s"
+    )
+    return resultado
+
+
+async def _main(tipo: str, ruta: str, formato: Optional[str], tamano_lote: Optional[int]) -> None:
+    from app.database import get_async_client, close_db
+    from app.utils.security import hash_pool
+
+    try:
+        formato = formato or detectar_formato(ruta)
+        resultado = await importar_usuarios(
+            get_async_client(), tipo,
+            leer_filas(bloques_archivo(ruta), formato),
+            tamano_lote
+        )
+        print(json.dumps(resultado, ensure_ascii=False, indent=2))
+    finally:
+        await close_db()
+        hash_pool.shutdown()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Importación masiva de estudiantes o docentes")
+    parser.add_argument("tipo", choices=sorted(TIPOS))
+    parser.add_argument("archivo")
+    parser.add_argument("--formato", choices=FORMATOS)
+    parser.add_argument("--lote", type=int, default=None, help="Filas por lote de inserción")
+    args = parser.parse_args()
+    asyncio.run(_main(args.tipo, args.archivo, args.formato, args.lote))
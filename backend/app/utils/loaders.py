@@ -0,0 +1,152 @@
+"""
+Cargadores por lotes (estilo DataLoader) para evitar consultas N+1
+"""
+import asyncio
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+from postgrest import AsyncPostgrestClient
+
+
+class BatchLoader:
+    """
+    Agrupa las claves pedidas durante el mismo tick del event loop y las
+    resuelve con una sola consulta `.in_()` sobre `tabla.columna`.
+
+    Los resultados se memorizan, por lo que pedir dos veces la misma clave
+    dentro del request no genera otra consulta.
+    """
+
+    def __init__(
+        self,
+        db: AsyncPostgrestClient,
+        table: str,
+        column: str,
+        select: str = "*",
+        many: bool = False,
+        filters: Tuple[Tuple[Any, ...], ...] = (),
+    ):
+        """
+        Args:
+            db: Cliente de base de datos
+            table: Tabla a consultar
+            column: Columna por la que se agrupan las claves
+            select: Columnas a seleccionar (debe incluir `column`)
+            many: Si True cada clave resuelve a una lista de filas
+            filters: Filtros extra como tuplas (método, *args), ej. ("eq", "leido", False)
+        """
+        self.db = db
+        self.table = table
+        self.column = column
+        self.select = select
+        self.many = many
+        self.filters = filters
+        self._cache: Dict[Hashable, asyncio.Future] = {}
+        self._pending: Dict[Hashable, asyncio.Future] = {}
+        # Referencias a los despachos en curso: el event loop solo guarda
+        # referencias débiles a las tareas y una tarea recolectada dejaría
+        # colgados a todos los `load()` que esperan su lote
+        self._tasks: Set[asyncio.Task] = set()
+        self.queries = 0
+
+    async def load(self, key: Hashable) -> Any:
+        """
+        Obtiene la fila (o lista de filas si `many`) asociada a una clave
+        """
+        if key in self._cache:
+            return await self._cache[key]
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._cache[key] = future
+        self._pending[key] = future
+
+        # El primer pedido del tick programa el despacho del lote
+        if len(self._pending) == 1:
+            loop.call_soon(self._schedule_dispatch, loop)
+
+        return await future
+
+    def _schedule_dispatch(self, loop: asyncio.AbstractEventLoop) -> None:
+        task = loop.create_task(self._dispatch())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def load_many(self, keys: Iterable[Hashable]) -> List[Any]:
+        """
+        Obtiene los resultados de varias claves en una sola consulta
+        """
+        return list(await asyncio.gather(*(self.load(key) for key in keys)))
+
+    async def _dispatch(self) -> None:
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+
+        try:
+            query = self.db.table(self.table).select(self.select).in_(self.column, list(pending))
+            for method, *args in self.filters:
+                query = getattr(query, method)(*args)
+            self.queries += 1
+            response = await query.execute()
+        except Exception as e:
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(e)
+            # Permitir reintentos en lugar de memorizar el error
+            for key in pending:
+                self._cache.pop(key, None)
+            return
+
+        grouped: Dict[Hashable, List[dict]] = {}
+        for row in response.data or []:
+            grouped.setdefault(row.get(self.column), []).append(row)
+
+        for key, future in pending.items():
+            if future.done():
+                continue
+            rows = grouped.get(key, [])
+            if self.many:
+                future.set_result(rows)
+            else:
+                future.set_result(rows[0] if rows else None)
+
+
+class DataLoaders:
+    """
+    Registro de cargadores por request, indexado por tabla + columna
+    """
+
+    def __init__(self, db: AsyncPostgrestClient):
+        self.db = db
+        self._loaders: Dict[Tuple, BatchLoader] = {}
+
+    def get(
+        self,
+        table: str,
+        column: str,
+        select: str = "*",
+        many: bool = False,
+        filters: Tuple[Tuple[Any, ...], ...] = (),
+    ) -> BatchLoader:
+        """
+        Obtiene (o crea) el cargador para una combinación tabla/columna/selección
+        """
+        key = (table, column, select, many, filters)
+        loader = self._loaders.get(key)
+        if loader is None:
+            loader = BatchLoader(self.db, table, column, select=select, many=many, filters=filters)
+            self._loaders[key] = loader
+        return loader
+
+    async def load(self, table: str, column: str, key: Hashable, **kwargs) -> Optional[Any]:
+        """Atajo para `get(table, column, ...).load(key)`"""
+        return await self.get(table, column, **kwargs).load(key)
+
+    async def load_many(self, table: str, column: str, keys: Iterable[Hashable], **kwargs) -> List[Any]:
+        """Atajo para `get(table, column, ...).load_many(keys)`"""
+        return await self.get(table, column, **kwargs).load_many(keys)
+
+    @property
+    def queries(self) -> int:
+        """Número de consultas realizadas por todos los cargadores del request"""
+        return sum(loader.queries for loader in self._loaders.values())
@@ -0,0 +1,390 @@
+"""
+Índice en memoria de la ocupación de aulas y grupos según los horarios
+
+Por cada (aula, día) y (grupo, día) se guardan los bloques ordenados por hora
+de inicio. Un bloque nuevo solo puede superponerse con los que empiezan antes
+de que termine y después de `inicio - duración máxima` de esa lista, así que
+la verificación busca esa ventana con bisect y cuesta O(log n + k) en lugar
+de recorrer todos los horarios.
+
+Además, cada aula tiene por día una máscara de bits con las franjas de
+`MINUTOS_FRANJA` minutos que ocupa: "¿está libre entre X e Y?" es un AND entre
+enteros, y buscar aulas libres cuesta una operación por aula.
+
+El índice se carga una vez por proceso, las rutas de horarios lo mantienen al
+día y se reconstruye en segundo plano cada `CATALOG_CACHE_TTL` segundos para
+recoger cambios hechos por otros procesos.
+"""
+import asyncio
+import logging
+import time
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from postgrest import AsyncPostgrestClient
+
+from app.config import settings
+from app.models.academico import DiaSemanaEnum
+
+logger = logging.getLogger(__name__)
+
+# Columnas que guarda el índice
+CAMPOS_HORARIO = ("id_horario", "dia_semana", "hora_inicio", "hora_fin", "aula", "id_grupo", "origen")
+
+# Resolución de las máscaras de ocupación (un bit por franja)
+MINUTOS_FRANJA = 5
+_SEGUNDOS_FRANJA = MINUTOS_FRANJA * 60
+
+# Filas por consulta al cargar el índice
+TAMANO_PAGINA = 1000
+
+# (inicio en segundos, fin en segundos, id_horario)
+Intervalo = Tuple[int, int, str]
+# ("aula" | "grupo", aula normalizada o id_grupo, día)
+Clave = Tuple[str, str, str]
+
+
+def a_segundos(hora: str) -> int:
+    """Segundos desde medianoche de una hora "HH:MM" o "HH:MM:SS" """
+    partes = [int(parte) for parte in str(hora).split(":")[:3]]
+    partes += [0] * (3 - len(partes))
+    return partes[0] * 3600 + partes[1] * 60 + partes[2]
+
+
+def mascara(inicio: int, fin: int) -> int:
+    """
+    Bits de las franjas que toca [inicio, fin) (en segundos)
+
+    Las horas que no caen en el borde de una franja ocupan la franja entera,
+    así un aula nunca se informa libre cuando no lo está.
+    """
+    if fin <= inicio:
+        return 0
+    desde = inicio // _SEGUNDOS_FRANJA
+    hasta = -(-fin // _SEGUNDOS_FRANJA)
+    return ((1 << (hasta - desde)) - 1) << desde
+
+
+def _zona_horaria() -> Optional[ZoneInfo]:
+    try:
+        return ZoneInfo(settings.TIMEZONE)
+    except (ZoneInfoNotFoundError, ValueError):
+        logger.warning(f"Zona horaria desconocida: {settings.TIMEZONE}; se usa la hora local del servidor")
+        return None
+
+
+_ZONA_HORARIA = _zona_horaria()
+# datetime.weekday() -> día del horario (el domingo no tiene clases)
+_DIAS_POR_NUMERO = list(DiaSemanaEnum)
+
+
+def ahora() -> Tuple[Optional[str], str]:
+    """Día de clases ("Lunes"... o None el domingo) y hora "HH:MM:SS" actuales en `TIMEZONE`"""
+    momento = datetime.now(_ZONA_HORARIA)
+    numero = momento.weekday()
+    dia = _DIAS_POR_NUMERO[numero].value if numero < len(_DIAS_POR_NUMERO) else None
+    return dia, momento.strftime("%H:%M:%S")
+
+
+def normalizar_aula(aula: str) -> str:
+    """Aula sin espacios sobrantes ni mayúsculas ("  Lab 1 " -> "lab 1")"""
+    return " ".join(str(aula).split()).lower()
+
+
+def _dia(valor) -> str:
+    """Nombre del día como texto (acepta DiaSemanaEnum)"""
+    return getattr(valor, "value", valor)
+
+
+def _claves(horario: dict) -> Tuple[Clave, Clave]:
+    dia = _dia(horario["dia_semana"])
+    return (
+        ("aula", normalizar_aula(horario["aula"]), dia),
+        ("grupo", horario["id_grupo"], dia),
+    )
+
+
+class _Intervalos:
+    """Bloques de una misma aula o grupo en un día, ordenados por inicio"""
+
+    __slots__ = ("items", "max_duracion")
+
+    def __init__(self):
+        self.items: List[Intervalo] = []
+        # Cota superior de la duración de los bloques (no baja al quitar)
+        self.max_duracion = 0
+
+    def agregar(self, intervalo: Intervalo) -> None:
+        insort(self.items, intervalo)
+        self.max_duracion = max(self.max_duracion, intervalo[1] - intervalo[0])
+
+    def quitar(self, intervalo: Intervalo) -> None:
+        posicion = bisect_left(self.items, intervalo)
+        if posicion < len(self.items) and self.items[posicion] == intervalo:
+            del self.items[posicion]
+
+    def solapados(self, inicio: int, fin: int) -> List[str]:
+        """IDs de los bloques que se superponen con [inicio, fin)"""
+        desde = bisect_left(self.items, (inicio - self.max_duracion + 1,))
+        hasta = bisect_left(self.items, (fin,))
+        return [id_horario for _, fin_otro, id_horario in self.items[desde:hasta] if fin_otro > inicio]
+
+
+class IndiceHorarios:
+    """
+    Índice de intervalos de los horarios por aula y por grupo
+
+    Todas las modificaciones ocurren en el event loop sin `await` intermedios,
+    así que no necesita bloqueos. `escritura` serializa la verificación y la
+    escritura de horarios en este proceso para que dos altas simultáneas no
+    ocupen la misma aula.
+    """
+
+    def __init__(self, ttl: float):
+        """
+        Args:
+            ttl: Segundos entre reconstrucciones completas (0 = nunca)
+        """
+        self.ttl = ttl
+        self._reiniciar()
+        self.cargado = False
+        self.cargado_en = 0.0
+        self._lock = asyncio.Lock()
+        self.escritura = asyncio.Lock()
+        self._recarga: Optional[asyncio.Task] = None
+        # Cambios recibidos mientras se carga una versión nueva (se reaplican al final)
+        self._pendientes: Optional[List[Tuple[str, object]]] = None
+
+    def _reiniciar(self) -> None:
+        self._horarios: Dict[str, dict] = {}
+        self._intervalos: Dict[Clave, _Intervalos] = defaultdict(_Intervalos)
+        # (día, aula normalizada) -> máscara de franjas ocupadas
+        self._ocupacion: Dict[Tuple[str, str], int] = defaultdict(int)
+        # Aula normalizada -> nombre a mostrar y cantidad de horarios que la usan
+        self._nombres_aula: Dict[str, str] = {}
+        self._usos_aula: Counter = Counter()
+
+    # ----- mantenimiento -----
+
+    def registrar(self, horario: dict) -> None:
+        """Agrega o actualiza un horario"""
+        if self._pendientes is not None:
+            self._pendientes.append(("registrar", dict(horario)))
+        self._quitar(horario["id_horario"])
+        self._agregar(horario)
+
+    def _agregar(self, horario: dict) -> None:
+        horario = {campo: horario.get(campo) for campo in CAMPOS_HORARIO}
+        horario["dia_semana"] = _dia(horario["dia_semana"])
+        intervalo = (a_segundos(horario["hora_inicio"]), a_segundos(horario["hora_fin"]), horario["id_horario"])
+        self._horarios[horario["id_horario"]] = horario
+        for clave in _claves(horario):
+            self._intervalos[clave].agregar(intervalo)
+
+        aula = normalizar_aula(horario["aula"])
+        self._nombres_aula.setdefault(aula, " ".join(str(horario["aula"]).split()))
+        self._usos_aula[aula] += 1
+        self._ocupacion[(horario["dia_semana"], aula)] |= mascara(intervalo[0], intervalo[1])
+
+    def quitar(self, id_horario: str) -> None:
+        """Quita un horario del índice"""
+        if self._pendientes is not None:
+            self._pendientes.append(("quitar", id_horario))
+        self._quitar(id_horario)
+
+    def _quitar(self, id_horario: str) -> None:
+        horario = self._horarios.pop(id_horario, None)
+        if horario is None:
+            return
+        intervalo = (a_segundos(horario["hora_inicio"]), a_segundos(horario["hora_fin"]), id_horario)
+        for clave in _claves(horario):
+            intervalos = self._intervalos.get(clave)
+            if intervalos is not None:
+                intervalos.quitar(intervalo)
+                if not intervalos.items:
+                    del self._intervalos[clave]
+
+        # Otros bloques pueden compartir franjas: la máscara se rehace con los que quedan
+        aula = normalizar_aula(horario["aula"])
+        dia = horario["dia_semana"]
+        restantes = self._intervalos.get(("aula", aula, dia))
+        ocupacion = 0
+        for inicio, fin, _ in restantes.items if restantes else ():
+            ocupacion |= mascara(inicio, fin)
+        if ocupacion:
+            self._ocupacion[(dia, aula)] = ocupacion
+        else:
+            self._ocupacion.pop((dia, aula), None)
+
+        self._usos_aula[aula] -= 1
+        if self._usos_aula[aula] <= 0:
+            del self._usos_aula[aula]
+            del self._nombres_aula[aula]
+
+    # ----- carga -----
+
+    async def cargar(self, db: AsyncPostgrestClient) -> None:
+        """Reconstruye el índice con todos los horarios"""
+        self._pendientes = []
+        try:
+            filas: List[dict] = []
+            ultimo = None
+            while True:
+                query = db.table("horario").select(", ".join(CAMPOS_HORARIO))
+                if ultimo is not None:
+                    query = query.gt("id_horario", ultimo)
+                response = await query.order("id_horario").limit(TAMANO_PAGINA).execute()
+                filas.extend(response.data)
+                if len(response.data) < TAMANO_PAGINA:
+                    break
+                ultimo = response.data[-1]["id_horario"]
+
+            pendientes = self._pendientes
+            self._pendientes = None
+            self._reiniciar()
+            for fila in filas:
+                self._agregar(fila)
+            for accion, dato in pendientes:
+                if accion == "registrar":
+                    self.registrar(dato)
+                else:
+                    self.quitar(dato)
+        finally:
+            self._pendientes = None
+
+        self.cargado = True
+        self.cargado_en = time.monotonic()
+        logger.info(f"Índice de horarios cargado: {len(self._horarios)} horarios")
+
+    async def asegurar(self, db: AsyncPostgrestClient) -> None:
+        """
+        Carga el índice si aún no existe; si está vencido lo reconstruye en
+        segundo plano y mientras tanto sigue respondiendo con la versión actual
+        """
+        if not self.cargado:
+            async with self._lock:
+                if not self.cargado:
+                    await self.cargar(db)
+            return
+
+        vencido = self.ttl > 0 and time.monotonic() - self.cargado_en > self.ttl
+        if vencido and (self._recarga is None or self._recarga.done()):
+            self._recarga = asyncio.create_task(self._recargar(db))
+
+    async def _recargar(self, db: AsyncPostgrestClient) -> None:
+        try:
+            async with self._lock:
+                await self.cargar(db)
+        except Exception as e:
+            # Se reintenta en la próxima consulta; el índice anterior sigue en uso
+            self.cargado_en = time.monotonic()
+            logger.warning(f"No se pudo reconstruir el índice de horarios: {e}")
+
+    # ----- consultas -----
+
+    def conflictos(self, horario: dict, ignorar: Optional[str] = None) -> List[dict]:
+        """
+        Horarios que chocan con `horario` en la misma aula o el mismo grupo y día
+
+        Args:
+            horario: Datos del bloque (dia_semana, hora_inicio, hora_fin, aula, id_grupo)
+            ignorar: ID del horario que se está editando (no choca consigo mismo)
+
+        Returns:
+            Un elemento por choque con `tipo` ("aula" o "grupo") y los datos del otro horario
+        """
+        inicio = a_segundos(horario["hora_inicio"])
+        fin = a_segundos(horario["hora_fin"])
+        encontrados = []
+        for clave in _claves(horario):
+            intervalos = self._intervalos.get(clave)
+            if intervalos is None:
+                continue
+            for id_horario in intervalos.solapados(inicio, fin):
+                if id_horario != ignorar:
+                    encontrados.append({"tipo": clave[0], **self._horarios[id_horario]})
+        return encontrados
+
+    def aulas_libres(self, dia: str, desde: str, hasta: str) -> List[str]:
+        """
+        Aulas sin ningún bloque entre `desde` y `hasta` el día `dia`
+
+        Solo se conocen las aulas que aparecen en algún horario.
+        """
+        ocupadas = mascara(a_segundos(desde), a_segundos(hasta))
+        dia = _dia(dia)
+        return sorted(
+            nombre for aula, nombre in self._nombres_aula.items()
+            if not self._ocupacion.get((dia, aula), 0) & ocupadas
+        )
+
+    def en_curso(self, id_grupo: str, dia: str, hora: str) -> List[dict]:
+        """Bloques del grupo que están en curso a la hora indicada"""
+        intervalos = self._intervalos.get(("grupo", id_grupo, _dia(dia)))
+        if intervalos is None:
+            return []
+        segundo = a_segundos(hora)
+        return [self._horarios[id_horario] for id_horario in intervalos.solapados(segundo, segundo + 1)]
+
+    def copia(self, excluir: Iterable[str] = ()) -> "IndiceHorarios":
+        """Índice independiente con los mismos horarios (menos los de `excluir`)"""
+        excluir = set(excluir)
+        nuevo = IndiceHorarios(ttl=0)
+        for id_horario, horario in self._horarios.items():
+            if id_horario not in excluir:
+                nuevo._agregar(horario)
+        nuevo.cargado = True
+        return nuevo
+
+    def __len__(self) -> int:
+        return len(self._horarios)
+
+    def stats(self) -> dict:
+        """Estado del índice"""
+        return {
+            "cargado": self.cargado,
+            "horarios": len(self._horarios),
+            "listas": len(self._intervalos),
+            "aulas": len(self._nombres_aula),
+            "antiguedad_segundos": round(time.monotonic() - self.cargado_en, 1) if self.cargado else None,
+        }
+
+
+def validar_horarios(filas: List[dict], base: Optional[IndiceHorarios] = None) -> List[dict]:
+    """
+    Valida un lote completo (por ejemplo, el semestre importado del SIU)
+
+    Cada fila se compara con los horarios de `base` (si se indica) y con las
+    filas anteriores del lote; cada choque se informa una sola vez, en la fila
+    posterior. Las filas con `id_horario` reemplazan a ese horario de `base`.
+
+    Returns:
+        Filas con choques: {"fila": n (desde 1), "conflictos": [...]}; las filas
+        del lote aparecen en los conflictos con `fila` y sin `id_horario`
+    """
+    ids_lote = [fila.get("id_horario") for fila in filas]
+    indice = base.copia(excluir=[i for i in ids_lote if i]) if base else IndiceHorarios(ttl=0)
+    filas_por_id: Dict[str, int] = {}
+
+    resultado = []
+    for numero, fila in enumerate(filas, start=1):
+        id_temporal = f"fila:{numero}"
+        conflictos = []
+        for conflicto in indice.conflictos(fila):
+            if conflicto["id_horario"] in filas_por_id:
+                conflicto = {**conflicto, "fila": filas_por_id[conflicto["id_horario"]]}
+                conflicto["id_horario"] = ids_lote[conflicto["fila"] - 1]
+            conflictos.append(conflicto)
+        if conflictos:
+            resultado.append({"fila": numero, "conflictos": conflictos})
+
+        filas_por_id[id_temporal] = numero
+        indice._agregar({**fila, "id_horario": id_temporal})
+    return resultado
+
+
+# Índice global del proceso
+indice_horarios = IndiceHorarios(ttl=settings.CATALOG_CACHE_TTL)
@@ -0,0 +1,134 @@
+"""
+Paginación por cursor (keyset) para los endpoints de listas
+
+En lugar de `OFFSET`, cada página continúa a partir de los valores de orden
+de la última fila devuelta, por lo que el costo de una página es O(limit)
+sin importar qué tan profundo se navegue, y las filas nuevas no provocan
+duplicados ni saltos entre páginas.
+"""
+import base64
+import json
+from typing import Any, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Response, status
+
+# Encabezado con el cursor de la página siguiente
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# Columnas de orden: (columna, descendente). La última debe ser única (la PK)
+Orden = Sequence[Tuple[str, bool]]
+
+
+def encode_cursor(valores: Sequence[Any]) -> str:
+    """
+    Codifica los valores de orden de una fila como cursor opaco
+    """
+    data = json.dumps(list(valores), separators=(",", ":"), default=str)
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, orden: Orden) -> List[Any]:
+    """
+    Decodifica un cursor generado por `encode_cursor`
+
+    Raises:
+        HTTPException: Si el cursor no es válido para este endpoint
+    """
+    try:
+        padding = "=" * (-len(cursor) % 4)
+        valores = json.loads(base64.urlsafe_b64decode(cursor + padding))
+    except (ValueError, TypeError):
+        valores = None
+
+    if not isinstance(valores, list) or len(valores) != len(orden):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cursor de paginación inválido"
+        )
+    return valores
+
+
+def _literal(valor: Any) -> str:
+    """Valor entre comillas para los filtros lógicos de PostgREST"""
+    texto = str(valor).replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{texto}"'
+
+
+def _igual(columna: str, valor: Any) -> str:
+    """Condición "misma posición que el cursor" para una columna"""
+    return f"{columna}.is.null" if valor is None else f"{columna}.eq.{_literal(valor)}"
+
+
+def _posterior(columna: str, desc: bool, valor: Any) -> Optional[str]:
+    """
+    Condición "después del cursor" para una columna, o None si no hay valores después
+
+    Sigue el orden por defecto de PostgreSQL (el mismo de los índices
+    `... DESC` de baseDeDatos.md): NULL va al final en orden ascendente y al
+    principio en orden descendente.
+    """
+    if valor is None:
+        return None if not desc else f"{columna}.not.is.null"
+    condicion = f"{columna}.{'lt' if desc else 'gt'}.{_literal(valor)}"
+    return condicion if desc else f"or({condicion},{columna}.is.null)"
+
+
+def _filtro_keyset(orden: Orden, valores: List[Any]) -> str:
+    """
+    Construye la condición "fila posterior al cursor" en sintaxis de PostgREST
+
+    Para (a desc, b desc) genera: a.lt.x,and(a.eq.x,b.lt.y); un valor NULL
+    del cursor se compara con `is.null` en lugar de `eq`.
+    """
+    condiciones = []
+    for i, (columna, desc) in enumerate(orden):
+        posterior = _posterior(columna, desc, valores[i])
+        if posterior is None:
+            continue
+        partes = [_igual(c, v) for (c, _), v in zip(orden[:i], valores[:i])] + [posterior]
+        condiciones.append(partes[0] if len(partes) == 1 else f"and({','.join(partes)})")
+    return ",".join(condiciones)
+
+
+def paginar(query, orden: Orden, limit: int, cursor: Optional[str] = None, skip: int = 0):
+    """
+    Aplica orden estable y paginación a una consulta de PostgREST
+
+    Args:
+        query: Consulta de selección (antes de `execute`)
+        orden: Columnas de orden; la última debe identificar la fila
+        limit: Tamaño de página
+        cursor: Cursor de la página anterior (`X-Next-Cursor`)
+        skip: Desplazamiento (obsoleto, solo si no se envía cursor)
+    """
+    for columna, desc in orden:
+        query = query.order(columna, desc=desc)
+
+    if cursor:
+        valores = decode_cursor(cursor, orden)
+        if valores[-1] is None:
+            # La última columna identifica la fila: nunca es NULL en un cursor válido
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Cursor de paginación inválido"
+            )
+        if len(orden) == 1:
+            columna, desc = orden[0]
+            query = query.lt(columna, valores[0]) if desc else query.gt(columna, valores[0])
+        else:
+            query = query.or_(_filtro_keyset(orden, valores))
+        return query.limit(limit)
+
+    if skip:
+        return query.range(skip, skip + limit - 1)
+    return query.limit(limit)
+
+
+def set_next_cursor(response: Response, filas: List[dict], orden: Orden, limit: int) -> None:
+    """
+    Publica el cursor de la página siguiente si la página vino completa
+    """
+    if len(filas) < limit:
+        return
+    ultima = filas[-1]
+    response.headers[NEXT_CURSOR_HEADER] = encode_cursor([ultima.get(c) for c, _ in orden])
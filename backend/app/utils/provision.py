@@ -0,0 +1,123 @@
+"""
+Alta de usuarios con su rol (estudiante o docente) en una sola operación
+"""
+import logging
+from typing import Tuple
+
+from fastapi import HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from postgrest import AsyncPostgrestClient
+from postgrest.exceptions import APIError
+
+from app.database import rpc_no_disponible
+from app.models.usuario import EstudianteCreate, DocenteCreate
+from app.utils.busqueda import indice_usuarios
+
+logger = logging.getLogger(__name__)
+
+# Código de Postgres para violación de restricción UNIQUE
+VIOLACION_UNICA = "23505"
+
+# Tabla y columna de CI según el rol
+TABLAS_ROL = {
+    "estudiante": ("estudiante", "ci_est"),
+    "docente": ("docente", "ci_doc"),
+}
+
+
+def datos_estudiante(data: EstudianteCreate, contrasena_hash: str) -> Tuple[dict, dict]:
+    """Filas de Usuario y Estudiante a partir de los datos de alta"""
+    usuario = {
+        "nombre": data.nombre,
+        "apellido": data.apellido,
+        "correo": data.correo,
+        "contrasena": contrasena_hash,
+        "rol": "estudiante",
+        "activo": True
+    }
+    estudiante = {
+        "ci_est": data.ci_est,
+        "carrera": data.carrera,
+        "semestre": data.semestre,
+        "id_grupo": data.id_grupo
+    }
+    return usuario, estudiante
+
+
+def datos_docente(data: DocenteCreate, contrasena_hash: str) -> Tuple[dict, dict]:
+    """Filas de Usuario y Docente a partir de los datos de alta"""
+    usuario = {
+        "nombre": data.nombre,
+        "apellido": data.apellido,
+        "correo": data.correo,
+        "contrasena": contrasena_hash,
+        "rol": "docente",
+        "activo": True
+    }
+    docente = {
+        "ci_doc": data.ci_doc,
+        "especialidad_doc": data.especialidad_doc
+    }
+    return usuario, docente
+
+
+def _sin_contrasena(usuario: dict) -> dict:
+    return {k: v for k, v in usuario.items() if k != "contrasena"}
+
+
+async def provisionar_usuario(db: AsyncPostgrestClient, usuario: dict, datos_rol: dict) -> dict:
+    """
+    Crea un usuario y su fila de rol de forma atómica
+
+    Usa la función SQL `provisionar_usuario`, que verifica CI y correo, inserta
+    ambas filas en una transacción y devuelve la fila de rol con su `usuario`.
+    Si la función aún no existe se hace con consultas separadas y, si falla la
+    fila de rol, se elimina el usuario para no dejarlo huérfano.
+
+    Args:
+        db: Cliente de base de datos
+        usuario: Fila de Usuario (con la contraseña ya hasheada y `rol`)
+        datos_rol: Fila de Estudiante o Docente, sin `id_user`
+
+    Returns:
+        Fila de rol con el usuario (sin contraseña) en `usuario`
+
+    Raises:
+        HTTPException: 400 si el CI o el correo ya están registrados
+    """
+    tabla, columna_ci = TABLAS_ROL[usuario["rol"]]
+    usuario = jsonable_encoder(usuario)
+    datos_rol = jsonable_encoder(datos_rol)
+
+    try:
+        response = await db.rpc("provisionar_usuario", {"p_usuario": usuario, "p_rol": datos_rol}).execute()
+        indice_usuarios.registrar(response.data["usuario"])
+        return response.data
+    except APIError as e:
+        if e.code == VIOLACION_UNICA:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=e.message)
+        if not rpc_no_disponible(e):
+            raise
+        logger.warning("Función provisionar_usuario no disponible, usando consultas separadas")
+
+    # Verificar que el CI no existe
+    existing_ci = await db.table(tabla).select(columna_ci).eq(columna_ci, datos_rol[columna_ci]).execute()
+    if existing_ci.data:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="El CI ya está registrado")
+
+    # Verificar que el correo no existe
+    existing_email = await db.table("usuario").select("id_user").eq("correo", usuario["correo"]).execute()
+    if existing_email.data:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="El correo ya está registrado")
+
+    user_response = await db.table("usuario").insert(usuario).execute()
+    user = user_response.data[0]
+
+    try:
+        rol_response = await db.table(tabla).insert({**datos_rol, "id_user": user["id_user"]}).execute()
+    except Exception:
+        await db.table("usuario").delete().eq("id_user", user["id_user"]).execute()
+        raise
+
+    indice_usuarios.registrar(user)
+    return {**rol_response.data[0], "usuario": _sin_contrasena(user)}
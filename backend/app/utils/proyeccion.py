@@ -0,0 +1,132 @@
+"""
+Proyección de columnas a partir de los modelos de respuesta
+
+En lugar de `select("*")` y quitar campos en Python, las rutas piden a
+PostgREST solo las columnas que declara su `response_model`:
+
+    COLUMNAS_USUARIO = columnas(Usuario)
+    # "nombre,apellido,correo,rol,id_user,fecha_registro,activo,foto_perfil"
+
+    columnas(Comentario, usuario=UsuarioPublico)
+    # "contenido,...,usuario(id_user,nombre,apellido,rol,foto_perfil)"
+
+Reglas:
+- Un campo cuyo tipo es otro modelo (o lista de modelos) se embebe con sus
+  propias columnas.
+- Un campo `dict` o `List[dict]` es una relación sin esquema: debe indicarse
+  en `relaciones` (modelo, columnas en texto o `(tabla, modelo)` si la tabla
+  no se llama como el campo) o en `excluir`. Si no, se lanza `ValueError`
+  al importar la ruta, no en la primera petición.
+- `excluir` quita campos que la API calcula y no existen como columna.
+"""
+from functools import lru_cache
+from typing import Callable, Iterable, List, Type, Union, get_args, get_origin
+
+from postgrest import AsyncPostgrestClient
+from postgrest.exceptions import APIError
+from pydantic import BaseModel
+
+from app.database import COLUMNA_NO_EXISTE
+
+Relacion = Union[Type[BaseModel], str, tuple]
+
+
+def _sin_opcional(anotacion):
+    """Quita Optional[...] de una anotación"""
+    if get_origin(anotacion) is Union:
+        args = [a for a in get_args(anotacion) if a is not type(None)]
+        if len(args) == 1:
+            return args[0]
+    return anotacion
+
+
+def _elemento(anotacion):
+    """Tipo de los elementos si la anotación es una lista; si no, la misma anotación"""
+    anotacion = _sin_opcional(anotacion)
+    if get_origin(anotacion) in (list, List):
+        args = get_args(anotacion)
+        return _sin_opcional(args[0]) if args else dict
+    return anotacion
+
+
+def _es_modelo(tipo) -> bool:
+    return isinstance(tipo, type) and issubclass(tipo, BaseModel)
+
+
+def _embebido(campo: str, relacion: Relacion) -> str:
+    tabla = campo
+    if isinstance(relacion, tuple):
+        tabla, relacion = relacion
+    seleccion = columnas(relacion) if _es_modelo(relacion) else relacion
+    if tabla != campo:
+        return f"{campo}:{tabla}({seleccion})"
+    return f"{campo}({seleccion})"
+
+
+@lru_cache(maxsize=None)
+def _columnas(modelo: Type[BaseModel], excluir: tuple, relaciones: tuple) -> str:
+    relaciones = dict(relaciones)
+    partes = []
+    for campo, info in modelo.model_fields.items():
+        if campo in excluir:
+            continue
+        if campo in relaciones:
+            partes.append(_embebido(campo, relaciones[campo]))
+            continue
+
+        tipo = _elemento(info.annotation)
+        if _es_modelo(tipo):
+            partes.append(f"{campo}({columnas(tipo)})")
+        elif tipo is dict:
+            raise ValueError(
+                f"{modelo.__name__}.{campo} es una relación sin esquema; "
+                f"indíquela en `relaciones` o en `excluir`"
+            )
+        else:
+            partes.append(campo)
+    return ",".join(partes)
+
+
+def columnas(modelo: Type[BaseModel], excluir: Iterable[str] = (), **relaciones: Relacion) -> str:
+    """
+    Lista de columnas para `select()` derivada de un modelo Pydantic
+
+    Args:
+        modelo: Modelo de respuesta
+        excluir: Campos calculados por la API que no se piden a la base
+        **relaciones: Selección de los campos `dict` embebidos: un modelo,
+            columnas en texto o una tupla `(tabla, modelo_o_columnas)`
+
+    Returns:
+        Texto para `select()`, por ejemplo "id_user,nombre,usuario(nombre)"
+    """
+    return _columnas(modelo, tuple(sorted(excluir)), tuple(sorted(relaciones.items())))
+
+
+async def seleccionar_con_respaldo(
+    db: AsyncPostgrestClient,
+    tabla: str,
+    seleccion: str,
+    respaldo: str,
+    filtrar: Callable
+):
+    """
+    Ejecuta `filtrar(db.table(tabla).select(seleccion))`; si alguna columna aún
+    no existe (migración de `baseDeDatos.md` pendiente) repite con `respaldo`
+
+    Args:
+        db: Cliente de base de datos
+        tabla: Tabla consultada
+        seleccion: Columnas preferidas
+        respaldo: Columnas que existen en el esquema base
+        filtrar: Agrega filtros, orden y paginación a la consulta
+
+    Returns:
+        Respuesta de PostgREST
+    """
+    try:
+        return await filtrar(db.table(tabla).select(seleccion)).execute()
+    except APIError as e:
+        if e.code != COLUMNA_NO_EXISTE:
+            raise
+    return await filtrar(db.table(tabla).select(respaldo)).execute()
@@ -2,7 +2,11 @@
 Utilidades de seguridad: hash de contraseñas, JWT, etc.
 """
 from datetime import datetime, timedelta
-from typing import Optional, Union, Any
+from typing import Optional, Union, Any, Callable, Dict
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import threading
+import time
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from app.config import settings
@@ -11,6 +15,83 @@ from app.config import settings
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
+class HashWorkerPool:
+    """
+    Pool acotado de hilos para ejecutar bcrypt fuera del event loop
+
+    bcrypt libera el GIL, así que los hilos trabajan en paralelo; el límite de
+    hilos evita que una ráfaga de logins acapare la CPU de todo el worker.
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.max_queue_depth = 0
+        self.total_wait = 0.0
+        self.total_run = 0.0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix="bcrypt"
+            )
+        return self._executor
+
+    async def run(self, func: Callable, *args) -> Any:
+        """
+        Ejecuta `func(*args)` en el pool y espera su resultado
+        """
+        submitted = time.perf_counter()
+        with self._lock:
+            self.queued += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queued)
+
+        def job():
+            started = time.perf_counter()
+            with self._lock:
+                self.queued -= 1
+                self.running += 1
+                self.total_wait += started - submitted
+            try:
+                return func(*args)
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self.completed += 1
+                    self.total_run += time.perf_counter() - started
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), job)
+
+    def shutdown(self) -> None:
+        """Detiene los hilos del pool"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Métricas de uso del pool (profundidad de cola y tiempos promedio)"""
+        done = self.completed or 1
+        return {
+            "max_workers": self.max_workers,
+            "queued": self.queued,
+            "running": self.running,
+            "completed": self.completed,
+            "max_queue_depth": self.max_queue_depth,
+            "avg_wait_ms": round(self.total_wait / done * 1000, 2),
+            "avg_run_ms": round(self.total_run / done * 1000, 2),
+        }
+
+
+# Pool compartido para hash y verificación de contraseñas
+hash_pool = HashWorkerPool(max_workers=settings.PASSWORD_HASH_WORKERS)
+
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """
     Verifica si una contraseña coincide con su hash
@@ -38,6 +119,33 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """
+    Versión asíncrona de `verify_password` que se ejecuta en el pool de hash
+    
+    Args:
+        plain_password: Contraseña en texto plano
+        hashed_password: Hash de la contraseña
+        
+    Returns:
+        True si coinciden, False si no
+    """
+    return await hash_pool.run(verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """
+    Versión asíncrona de `get_password_hash` que se ejecuta en el pool de hash
+    
+    Args:
+        password: Contraseña en texto plano
+        
+    Returns:
+        Hash de la contraseña
+    """
+    return await hash_pool.run(get_password_hash, password)
+
+
 def create_access_token(
     data: dict,
     expires_delta: Optional[timedelta] = None
@@ -0,0 +1,556 @@
+"""
+Sincronización incremental de los datos académicos exportados por el SIU
+
+Cada entidad (materias, grupos-materias, horarios, notas) se sincroniza desde
+un archivo exportado (CSV, NDJSON o arreglo JSON). Las filas se identifican
+por una clave natural (el SIU no conoce los ID de la base) y se comparan por
+un hash de su contenido contra las filas actuales con `origen = SIU`:
+
+- clave nueva: se inserta
+- clave existente con otro hash: se actualiza
+- clave que ya no está en el archivo: se elimina
+- mismo hash: no se escribe nada
+
+Las filas `MANUAL` nunca se modifican ni se eliminan: si una fila del archivo
+tiene la clave de una fila manual se omite, y una materia del SIU que
+desaparece del archivo se conserva mientras tenga notas o grupos manuales
+(borrarla los eliminaría en cascada). Los cambios se aplican por lotes, así
+que volver a ejecutar la misma exportación no escribe nada.
+
+Como un archivo dañado parece una exportación en la que "desapareció" todo,
+las eliminaciones se protegen: no se elimina nada si hubo errores de lectura
+o ninguna fila válida, se conservan las filas cuya línea fue rechazada y, si
+se eliminaría más de `SIU_SYNC_MAX_DELETE_RATIO` de las filas del SIU, hace
+falta `permitir_eliminar`.
+
+Uso desde la línea de comandos (por ejemplo, en el cron nocturno):
+    python -m app.utils.siu materias materias.csv [--simular]
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from postgrest import AsyncPostgrestClient
+from pydantic import BaseModel, ValidationError
+
+from app.config import settings
+from app.models.academico import GrupoMateriaCreate, HorarioCreate, MateriaCreate, NotaCreate, OrigenEnum
+from app.utils.catalogo import invalidar_catalogo
+from app.utils.estadisticas import invalidar_estadisticas
+from app.utils.expediente import ajustar_expediente_lote
+from app.utils.importacion import FilaLeida, bloques_archivo, detectar_formato, leer_filas, mensajes_validacion
+from app.utils.ocupacion import indice_horarios, validar_horarios
+
+logger = logging.getLogger(__name__)
+
+# Filas por consulta al leer las filas actuales
+TAMANO_PAGINA = 1000
+
+# IDs por DELETE: viajan en la URL (`id=in.(...)`) y 100 UUID ocupan unos 4 KB,
+# por debajo del límite habitual de los proxies (8 KB en nginx)
+IDS_POR_ELIMINACION = 100
+
+# Referencias del SIU que se traducen a ID de la base: (columna del archivo, columna destino)
+TRADUCCIONES = (("codigo_materia", "id_materia"), ("ci_est", "id_user"))
+
+# Columnas que referencian otra tabla y se verifican antes de escribir
+REFERENCIAS_VERIFICADAS = ("id_materia", "id_user", "id_grupo", "id_doc")
+
+Clave = Tuple
+
+
+class Entidad:
+    """Tabla sincronizable: clave natural, columnas comparadas y modelo de validación"""
+
+    def __init__(
+        self,
+        tabla: str,
+        id_columna: str,
+        clave: Tuple[str, ...],
+        campos: Tuple[str, ...],
+        modelo: type
+    ):
+        self.tabla = tabla
+        self.id_columna = id_columna
+        self.clave = clave
+        self.campos = campos
+        self.modelo = modelo
+
+    def clave_de(self, fila: dict) -> Clave:
+        return tuple(_normalizar(fila.get(columna)) for columna in self.clave)
+
+    def hash_de(self, fila: dict) -> str:
+        valores = [_normalizar(fila.get(campo)) for campo in self.campos]
+        return hashlib.blake2b(json.dumps(valores).encode(), digest_size=16).hexdigest()
+
+
+# En orden de dependencia: los grupos-materias y notas se refieren a materias
+ENTIDADES: Dict[str, Entidad] = {
+    "materias": Entidad(
+        "materia", "id_materia",
+        clave=("codigo_materia",),
+        campos=("nombre_materia", "codigo_materia", "id_doc"),
+        modelo=MateriaCreate
+    ),
+    "grupos_materias": Entidad(
+        "grupomateria", "id_grupo_materia",
+        clave=("id_grupo", "id_materia"),
+        campos=("id_grupo", "id_materia"),
+        modelo=GrupoMateriaCreate
+    ),
+    "horarios": Entidad(
+        "horario", "id_horario",
+        clave=("id_grupo", "dia_semana", "hora_inicio", "aula"),
+        campos=("id_grupo", "dia_semana", "hora_inicio", "hora_fin", "aula"),
+        modelo=HorarioCreate
+    ),
+    "notas": Entidad(
+        "nota", "id_nota",
+        clave=("id_user", "id_materia", "tipo_nota"),
+        campos=("id_user", "id_materia", "tipo_nota", "nota"),
+        modelo=NotaCreate
+    ),
+}
+
+
+def _normalizar(valor):
+    """Valor comparable entre el archivo y la base (números como float, enums como texto)"""
+    valor = getattr(valor, "value", valor)
+    if isinstance(valor, bool) or valor is None:
+        return valor
+    if isinstance(valor, (int, float)):
+        return float(valor)
+    return str(valor)
+
+
+async def _leer_tabla(
+    db: AsyncPostgrestClient,
+    tabla: str,
+    columnas: str,
+    id_columna: str,
+    filtrar: Callable = lambda query: query
+) -> List[dict]:
+    """Todas las filas de una tabla, por páginas ordenadas por ID"""
+    filas: List[dict] = []
+    ultimo = None
+    while True:
+        query = filtrar(db.table(tabla).select(columnas))
+        if ultimo is not None:
+            query = query.gt(id_columna, ultimo)
+        response = await query.order(id_columna).limit(TAMANO_PAGINA).execute()
+        filas.extend(response.data)
+        if len(response.data) < TAMANO_PAGINA:
+            return filas
+        ultimo = response.data[-1][id_columna]
+
+
+async def _referencias(db: AsyncPostgrestClient, entidad: str, filas: List[dict]) -> Dict[str, Dict[str, str]]:
+    """
+    Valores existentes de las columnas que referencian otras tablas
+
+    Sirven para traducir `codigo_materia` y `ci_est` y para verificar
+    `REFERENCIAS_VERIFICADAS`: una referencia rota haría que la base rechace
+    el lote completo, así que se informa antes como error de su fila.
+    """
+    referencias: Dict[str, Dict[str, str]] = {}
+    if entidad in ("grupos_materias", "notas"):
+        materias = await _leer_tabla(db, "materia", "id_materia, codigo_materia", "id_materia")
+        referencias["codigo_materia"] = {m["codigo_materia"]: m["id_materia"] for m in materias}
+        referencias["id_materia"] = {m["id_materia"]: m["id_materia"] for m in materias}
+    if entidad == "notas":
+        estudiantes = await _leer_tabla(db, "estudiante", "ci_est, id_user", "ci_est")
+        referencias["ci_est"] = {e["ci_est"]: e["id_user"] for e in estudiantes}
+        referencias["id_user"] = {e["id_user"]: e["id_user"] for e in estudiantes}
+    if entidad in ("grupos_materias", "horarios"):
+        grupos = await _leer_tabla(db, "grupo", "id_grupo", "id_grupo")
+        referencias["id_grupo"] = {g["id_grupo"]: g["id_grupo"] for g in grupos}
+    if entidad == "materias" and any(fila.get("id_doc") for fila in filas):
+        docentes = await _leer_tabla(db, "docente", "ci_doc", "ci_doc")
+        referencias["id_doc"] = {d["ci_doc"]: d["ci_doc"] for d in docentes}
+    return referencias
+
+
+def _resolver(fila: dict, referencias: Dict[str, Dict[str, str]]) -> Tuple[dict, List[str]]:
+    """Cambia `codigo_materia` y `ci_est` por sus ID y verifica que cada referencia exista"""
+    fila = dict(fila)
+    errores = []
+    for origen, destino in TRADUCCIONES:
+        if origen not in referencias:
+            continue
+        valor = fila.pop(origen, None)
+        if fila.get(destino) or valor is None:
+            continue
+        if str(valor) not in referencias[origen]:
+            errores.append(f"{origen}: {valor} no existe")
+        else:
+            fila[destino] = referencias[origen][str(valor)]
+    for columna in REFERENCIAS_VERIFICADAS:
+        valor = fila.get(columna)
+        if columna in referencias and valor and str(valor) not in referencias[columna]:
+            errores.append(f"{columna}: {valor} no existe")
+    return fila, errores
+
+
+def _resultado(entidad: str, simular: bool) -> dict:
+    return {
+        "entidad": entidad,
+        "simulacion": simular,
+        "total_filas": 0,
+        "insertados": 0,
+        "actualizados": 0,
+        "eliminados": 0,
+        "sin_cambios": 0,
+        "omitidos_manual": 0,
+        "conservados": 0,
+        "errores": [],
+    }
+
+
+async def sincronizar(
+    db: AsyncPostgrestClient,
+    entidad: str,
+    filas: AsyncIterator[FilaLeida],
+    simular: bool = False,
+    tamano_lote: Optional[int] = None,
+    permitir_eliminar: bool = False
+) -> dict:
+    """
+    Sincroniza una entidad con el contenido completo de una exportación del SIU
+
+    Args:
+        db: Cliente de base de datos
+        entidad: Clave de `ENTIDADES`
+        filas: Filas leídas con `leer_filas` (la exportación completa de la entidad)
+        simular: Solo calcula las diferencias, sin escribir
+        tamano_lote: Filas por INSERT/UPSERT/DELETE (por defecto SIU_SYNC_BATCH_SIZE)
+        permitir_eliminar: Eliminar aunque se supere SIU_SYNC_MAX_DELETE_RATIO
+
+    Returns:
+        Cantidades de filas insertadas, actualizadas, eliminadas, sin cambios,
+        omitidas por ser manuales y conservadas, más los errores por fila
+    """
+    spec = ENTIDADES[entidad]
+    tamano_lote = tamano_lote or settings.SIU_SYNC_BATCH_SIZE
+    inicio = time.perf_counter()
+    resultado = _resultado(entidad, simular)
+
+    leidas: List[FilaLeida] = []
+    async for fila_leida in filas:
+        leidas.append(fila_leida)
+    resultado["total_filas"] = len(leidas)
+    referencias = await _referencias(db, entidad, [fila for _, fila, _ in leidas if fila])
+
+    columnas = ", ".join((spec.id_columna, "origen") + tuple(c for c in spec.campos if c != spec.id_columna))
+    actuales = await _leer_tabla(db, spec.tabla, columnas, spec.id_columna)
+    siu: Dict[Clave, dict] = {}
+    manuales = set()
+    for fila in actuales:
+        if fila.get("origen") == OrigenEnum.MANUAL.value:
+            manuales.add(spec.clave_de(fila))
+        else:
+            siu[spec.clave_de(fila)] = fila
+
+    # Filas deseadas, validadas con el modelo de la entidad. Las claves de las
+    # filas rechazadas se conservan: que la línea esté mal no significa que la
+    # fila haya desaparecido del SIU
+    deseadas: Dict[Clave, Tuple[int, dict]] = {}
+    rechazadas = set()
+    errores_lectura = 0
+    for numero, fila, error in leidas:
+        if error:
+            errores_lectura += 1
+            resultado["errores"].append({"fila": numero, "errores": [error]})
+            continue
+        fila, errores = _resolver(fila, referencias)
+        if errores:
+            rechazadas.add(spec.clave_de(fila))
+            resultado["errores"].append({"fila": numero, "errores": errores})
+            continue
+        try:
+            data: BaseModel = spec.modelo(**{**fila, "origen": OrigenEnum.SIU})
+        except ValidationError as e:
+            rechazadas.add(spec.clave_de(fila))
+            resultado["errores"].append({"fila": numero, "errores": mensajes_validacion(e)})
+            continue
+        datos = jsonable_encoder(data.dict())
+        clave = spec.clave_de(datos)
+        if clave in deseadas:
+            resultado["errores"].append({"fila": numero, "errores": ["Clave repetida en el archivo"]})
+            continue
+        if clave in manuales:
+            resultado["omitidos_manual"] += 1
+            continue
+        deseadas[clave] = (numero, datos)
+
+    conservadas = set()
+    if entidad == "horarios":
+        await indice_horarios.asegurar(db)
+        conservadas = _descartar_horarios_en_conflicto(deseadas, siu, resultado)
+
+    # Diferencias por clave y hash de contenido
+    inserciones: List[Tuple[int, dict]] = []
+    actualizaciones: List[Tuple[int, dict, dict]] = []
+    for clave, (numero, datos) in deseadas.items():
+        actual = siu.get(clave)
+        if actual is None:
+            inserciones.append((numero, datos))
+        elif spec.hash_de(actual) != spec.hash_de(datos):
+            actualizaciones.append((numero, {**datos, spec.id_columna: actual[spec.id_columna]}, actual))
+        else:
+            resultado["sin_cambios"] += 1
+
+    con_manuales = await _materias_con_manuales(db) if entidad == "materias" else set()
+    eliminaciones: List[dict] = []
+    for clave, actual in siu.items():
+        if clave in deseadas or clave in conservadas:
+            continue
+        if actual[spec.id_columna] in con_manuales or clave in rechazadas:
+            resultado["conservados"] += 1
+        else:
+            eliminaciones.append(actual)
+
+    motivo = _motivo_sin_eliminar(eliminaciones, len(siu), errores_lectura, len(deseadas), permitir_eliminar)
+    if motivo:
+        logger.warning(f"Sincronización SIU de {entidad}: no se eliminan {len(eliminaciones)} filas: {motivo}")
+        resultado["eliminacion_omitida"] = motivo
+        resultado["conservados"] += len(eliminaciones)
+        eliminaciones = []
+
+    if simular:
+        resultado["insertados"] = len(inserciones)
+        resultado["actualizados"] = len(actualizaciones)
+        resultado["eliminados"] = len(eliminaciones)
+    else:
+        await _aplicar(db, entidad, spec, inserciones, actualizaciones, eliminaciones, tamano_lote, resultado)
+
+    # Primero las filas del archivo; al final las eliminaciones rechazadas (sin fila)
+    resultado["errores"].sort(key=lambda err: (err["fila"] is None, err["fila"] or 0))
+    resultado["duracion_segundos"] = round(time.perf_counter() - inicio, 3)
+    logger.info(
+        f"Sincronización SIU de {entidad}{' (simulación)' if simular else ''}: "
+        f"{resultado['insertados']} insertados, {resultado['actualizados']} actualizados, "
+        f"{resultado['eliminados']} eliminados, {resultado['sin_cambios']} sin cambios "
+        f"en {resultado['duracion_segundos']}s"
+    )
+    return resultado
+
+
+def _motivo_sin_eliminar(
+    eliminaciones: List[dict],
+    filas_siu: int,
+    errores_lectura: int,
+    validas: int,
+    permitir_eliminar: bool
+) -> Optional[str]:
+    """Motivo para no aplicar las eliminaciones, o None si se pueden aplicar"""
+    if not eliminaciones:
+        return None
+    if errores_lectura:
+        return f"El archivo tuvo {errores_lectura} errores de lectura; puede estar incompleto"
+    if not validas:
+        return "El archivo no tiene ninguna fila válida"
+    limite = settings.SIU_SYNC_MAX_DELETE_RATIO
+    if not permitir_eliminar and len(eliminaciones) > limite * filas_siu:
+        return (
+            f"Se eliminarían {len(eliminaciones)} de {filas_siu} filas del SIU (más del {limite:.0%}); "
+            "confirme con permitir_eliminar"
+        )
+    return None
+
+
+def _descartar_horarios_en_conflicto(
+    deseadas: Dict[Clave, Tuple[int, dict]],
+    siu: Dict[Clave, dict],
+    resultado: dict
+) -> set:
+    """
+    Quita los horarios que chocan con horarios manuales o con otros del archivo
+
+    Si el horario ya existía se conserva tal como está en la base.
+
+    Returns:
+        Claves de los horarios existentes que se conservan
+    """
+    base = indice_horarios.copia(excluir=[fila["id_horario"] for fila in siu.values()])
+    claves = list(deseadas)
+    # `validar_horarios` numera por posición en la lista; el mensaje usa la línea del archivo
+    numeros = [deseadas[clave][0] for clave in claves]
+    conflictos = validar_horarios([deseadas[clave][1] for clave in claves], base)
+    conservadas = set()
+    for conflicto in conflictos:
+        clave = claves[conflicto["fila"] - 1]
+        numero, _ = deseadas.pop(clave)
+        resultado["errores"].append({
+            "fila": numero,
+            "errores": [
+                f"Se superpone en {c['tipo']} con el horario "
+                f"{c.get('id_horario') or 'fila ' + str(numeros[c['fila'] - 1])}"
+                for c in conflicto["conflictos"]
+            ]
+        })
+        if clave in siu:
+            conservadas.add(clave)
+    resultado["conservados"] += len(conservadas)
+    return conservadas
+
+
+async def _materias_con_manuales(db: AsyncPostgrestClient) -> set:
+    """IDs de materias con grupos o notas manuales (no se eliminan)"""
+    grupos, notas = await asyncio.gather(
+        _leer_tabla(db, "grupomateria", "id_grupo_materia, id_materia", "id_grupo_materia",
+                    lambda query: query.eq("origen", OrigenEnum.MANUAL.value)),
+        _leer_tabla(db, "nota", "id_nota, id_materia", "id_nota",
+                    lambda query: query.eq("origen", OrigenEnum.MANUAL.value)),
+    )
+    return {fila["id_materia"] for fila in grupos} | {fila["id_materia"] for fila in notas}
+
+
+def _lotes(filas: List, tamano: int):
+    for inicio in range(0, len(filas), tamano):
+        yield filas[inicio:inicio + tamano]
+
+
+def _rechazar_lote(resultado: dict, numeros: List[int], error: Exception, operacion: str) -> None:
+    for numero in numeros:
+        resultado["errores"].append({"fila": numero, "errores": [f"Lote rechazado al {operacion}: {error}"]})
+
+
+async def _aplicar(
+    db: AsyncPostgrestClient,
+    entidad: str,
+    spec: Entidad,
+    inserciones: List[Tuple[int, dict]],
+    actualizaciones: List[Tuple[int, dict, dict]],
+    eliminaciones: List[dict],
+    tamano_lote: int,
+    resultado: dict
+) -> None:
+    """
+    Escribe las diferencias por lotes y actualiza cachés, índices y resúmenes
+
+    Un lote que la base rechaza se informa en `errores` (cada fila con su
+    número) y no detiene los demás. Los lotes ya escritos quedan escritos, por
+    eso los conteos y los efectos sobre índices, cachés y expediente se
+    aplican en `finally` con lo que efectivamente se escribió.
+    """
+    insertadas: List[dict] = []
+    actualizadas: List[Tuple[dict, dict]] = []  # (fila escrita, fila anterior)
+    eliminadas: List[dict] = []
+    try:
+        for lote in _lotes(inserciones, tamano_lote):
+            try:
+                response = await db.table(spec.tabla).insert([datos for _, datos in lote]).execute()
+            except Exception as e:
+                _rechazar_lote(resultado, [numero for numero, _ in lote], e, "insertar")
+            else:
+                insertadas.extend(response.data)
+
+        for lote in _lotes(actualizaciones, tamano_lote):
+            try:
+                response = await db.table(spec.tabla).upsert(
+                    [datos for _, datos, _ in lote], on_conflict=spec.id_columna
+                ).execute()
+            except Exception as e:
+                _rechazar_lote(resultado, [numero for numero, _, _ in lote], e, "actualizar")
+            else:
+                anteriores = {anterior[spec.id_columna]: anterior for _, _, anterior in lote}
+                actualizadas.extend((fila, anteriores[fila[spec.id_columna]]) for fila in response.data)
+
+        for lote in _lotes(eliminaciones, min(tamano_lote, IDS_POR_ELIMINACION)):
+            ids = [fila[spec.id_columna] for fila in lote]
+            try:
+                response = await db.table(spec.tabla).delete().in_(spec.id_columna, ids).execute()
+            except Exception as e:
+                # Las filas eliminadas vienen de la base, no del archivo: se informan por ID
+                resultado["errores"].extend(
+                    {"fila": None, "id": id_fila, "errores": [f"Lote rechazado al eliminar: {e}"]}
+                    for id_fila in ids
+                )
+            else:
+                eliminadas.extend(response.data)
+    finally:
+        resultado["insertados"] = len(insertadas)
+        resultado["actualizados"] = len(actualizadas)
+        resultado["eliminados"] = len(eliminadas)
+        await _propagar(db, entidad, spec, insertadas, actualizadas, eliminadas)
+
+
+async def _propagar(
+    db: AsyncPostgrestClient,
+    entidad: str,
+    spec: Entidad,
+    insertadas: List[dict],
+    actualizadas: List[Tuple[dict, dict]],
+    eliminadas: List[dict]
+) -> None:
+    """Lleva lo escrito al índice de horarios, las cachés del catálogo y el expediente"""
+    if not (insertadas or actualizadas or eliminadas):
+        return
+
+    if entidad == "horarios":
+        for fila in insertadas + [fila for fila, _ in actualizadas]:
+            indice_horarios.registrar(fila)
+        for fila in eliminadas:
+            indice_horarios.quitar(fila["id_horario"])
+        await invalidar_catalogo("horario")
+    elif entidad == "notas":
+        ajustes = [
+            {"id_user": f["id_user"], "id_materia": f["id_materia"], "evaluaciones": 1, "suma": float(f["nota"])}
+            for f in insertadas
+        ] + [
+            {"id_user": f["id_user"], "id_materia": f["id_materia"], "evaluaciones": 0,
+             "suma": float(f["nota"]) - float(anterior["nota"])}
+            for f, anterior in actualizadas
+        ] + [
+            {"id_user": f["id_user"], "id_materia": f["id_materia"], "evaluaciones": -1, "suma": -float(f["nota"])}
+            for f in eliminadas
+        ]
+        await ajustar_expediente_lote(db, ajustes)
+        await invalidar_estadisticas(*{a["id_materia"] for a in ajustes})
+    else:
+        # Borrar una materia elimina en cascada sus grupos-materias y notas del SIU
+        tablas = ("materia", "grupomateria", "nota") if entidad == "materias" and eliminadas else (spec.tabla,)
+        await invalidar_catalogo(*tablas)
+
+
+async def sincronizar_archivo(
+    db: AsyncPostgrestClient,
+    entidad: str,
+    ruta: str,
+    formato: Optional[str] = None,
+    simular: bool = False,
+    permitir_eliminar: bool = False
+) -> dict:
+    """Sincroniza una entidad desde un archivo local"""
+    formato = formato or detectar_formato(ruta)
+    return await sincronizar(
+        db, entidad, leer_filas(bloques_archivo(ruta), formato), simular, permitir_eliminar=permitir_eliminar
+    )
+
+
+async def _main(entidad: str, ruta: str, formato: Optional[str], simular: bool, permitir_eliminar: bool) -> None:
+    from app.database import get_async_client, close_db
+
+    try:
+        resultado = await sincronizar_archivo(get_async_client(), entidad, ruta, formato, simular, permitir_eliminar)
+        print(json.dumps(resultado, ensure_ascii=False, indent=2))
+    finally:
+        await close_db()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Sincronización incremental de datos del SIU")
+    parser.add_argument("entidad", choices=list(ENTIDADES))
+    parser.add_argument("archivo")
+    parser.add_argument("--formato", choices=("csv", "ndjson", "json"))
+    parser.add_argument("--simular", action="store_true", help="Solo mostrar las diferencias")
+    parser.add_argument("--permitir-eliminar", action="store_true",
+                        help="Eliminar aunque se supere SIU_SYNC_MAX_DELETE_RATIO")
+    args = parser.parse_args()
+    asyncio.run(_main(args.entidad, args.archivo, args.formato, args.simular, args.permitir_eliminar))
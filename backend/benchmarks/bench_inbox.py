@@ -0,0 +1,150 @@
+"""
+Benchmark de la bandeja de mensajes (GET /mensajes/conversaciones)
+
+Simula PostgREST con una latencia fija por petición y compara, para distinto
+número de conversaciones:
+  - secuencial: el algoritmo anterior (1 + 3N consultas una tras otra)
+  - lotes:      la alternativa por lotes (sin la función SQL)
+  - rpc:        la función `resumen_conversaciones` (una sola llamada)
+
+Solo mide viajes de red; el costo de las consultas en Postgres no se modela.
+
+Uso:
+    python -m benchmarks.bench_inbox [--latencia-ms 20]
+"""
+import argparse
+import asyncio
+import os
+import time
+
+os.environ.setdefault("SUPABASE_URL", "http://bench.local")
+os.environ.setdefault("SUPABASE_KEY", "bench")
+
+import httpx
+
+from app.database import PooledPostgrestClient
+from app.routes.mensajes import get_my_conversaciones, _resumen_por_lotes
+from app.utils.loaders import DataLoaders
+
+ID_USER = "u0"
+
+
+def build_transport(n_conversaciones: int, latencia: float, contador: list):
+    """Transporte falso que responde según la tabla consultada"""
+    conversaciones = [
+        {
+            "id_conversacion": f"c{i}",
+            "tipo": "privada",
+            "nombre": None,
+            "fecha_creacion": "2025-01-01T00:00:00",
+        }
+        for i in range(n_conversaciones)
+    ]
+    usuario = {"id_user": "u1", "nombre": "Ana", "apellido": "Paz", "foto_perfil": None}
+    mensaje = {
+        "id_mensaje": "m1", "contenido": "hola", "fecha_envio": "2025-01-01T00:00:00",
+        "leido": False, "id_user": "u1", "usuario": {"nombre": "Ana", "apellido": "Paz"},
+    }
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        contador.append(request.url.path)
+        await asyncio.sleep(latencia)
+        path = request.url.path
+        select = request.url.params.get("select", "")
+
+        if path.endswith("/rpc/resumen_conversaciones"):
+            filas = [
+                {**c, "participantes": [usuario], "ultimo_mensaje": {**mensaje, "id_conversacion": c["id_conversacion"]},
+                 "mensajes_no_leidos": 1}
+                for c in conversaciones
+            ]
+            return httpx.Response(200, json=filas)
+        if path.endswith("/usuarioconversacion"):
+            if select.startswith("conversacion"):
+                return httpx.Response(200, json=[{"conversacion": c} for c in conversaciones])
+            ids = _ids(request, conversaciones)
+            return httpx.Response(200, json=[{"id_conversacion": i, "usuario": usuario} for i in ids])
+        if path.endswith("/mensaje"):
+            ids = _ids(request, conversaciones)
+            return httpx.Response(200, json=[{**mensaje, "id_conversacion": i} for i in ids])
+        return httpx.Response(200, json=[])
+
+    return httpx.MockTransport(handler)
+
+
+def _ids(request: httpx.Request, conversaciones: list) -> list:
+    valor = request.url.params.get("id_conversacion", "")
+    if valor.startswith("in."):
+        return valor[4:-1].split(",")
+    if valor.startswith("eq."):
+        return [valor[3:]]
+    return [c["id_conversacion"] for c in conversaciones]
+
+
+def build_db(transport: httpx.MockTransport, rpc: bool) -> PooledPostgrestClient:
+    db = PooledPostgrestClient(
+        "http://bench.local/rest/v1",
+        headers={"apiKey": "bench", "Authorization": "Bearer bench"},
+    )
+    if rpc:
+        db.session._transport = transport
+        return db
+
+    # Simular que la función SQL no está desplegada
+    async def sin_rpc(request: httpx.Request) -> httpx.Response:
+        if "/rpc/" in request.url.path:
+            return httpx.Response(404, json={"code": "PGRST202", "message": "not found"})
+        return await transport.handle_async_request(request)
+
+    db.session._transport = httpx.MockTransport(sin_rpc)
+    return db
+
+
+async def secuencial(db: PooledPostgrestClient) -> list:
+    """Algoritmo anterior: una consulta de membresías y tres por conversación"""
+    query = await db.table("usuarioconversacion").select("conversacion:conversacion(*)").eq("id_usuario", ID_USER).execute()
+    resultado = []
+    for item in query.data:
+        conv = item["conversacion"]
+        conv_id = conv["id_conversacion"]
+        await db.table("usuarioconversacion").select("usuario:usuario(*)").eq("id_conversacion", conv_id).execute()
+        await db.table("mensaje").select("*").eq("id_conversacion", conv_id).limit(1).execute()
+        await db.table("mensaje").select("id_mensaje").eq("id_conversacion", conv_id).execute()
+        resultado.append(conv)
+    return resultado
+
+
+async def medir(nombre: str, n: int, latencia: float) -> tuple:
+    contador: list = []
+    transport = build_transport(n, latencia, contador)
+    db = build_db(transport, rpc=(nombre == "rpc"))
+    inicio = time.perf_counter()
+    if nombre == "secuencial":
+        await secuencial(db)
+    elif nombre == "lotes":
+        await _resumen_por_lotes(db, DataLoaders(db), ID_USER)
+    else:
+        await get_my_conversaciones(db=db, loaders=DataLoaders(db), current_user={"id_user": ID_USER})
+    duracion = (time.perf_counter() - inicio) * 1000
+    await db.aclose()
+    return len(contador), duracion
+
+
+async def main(latencia_ms: float, tamanos: list) -> None:
+    latencia = latencia_ms / 1000
+    print(f"Latencia simulada por petición: {latencia_ms:.0f} ms\n")
+    print(f"{'conversaciones':>14} | {'modo':>10} | {'peticiones':>10} | {'tiempo (ms)':>11}")
+    print("-" * 56)
+    for n in tamanos:
+        for modo in ("secuencial", "lotes", "rpc"):
+            peticiones, duracion = await medir(modo, n, latencia)
+            print(f"{n:>14} | {modo:>10} | {peticiones:>10} | {duracion:>11.1f}")
+        print("-" * 56)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latencia-ms", type=float, default=20)
+    parser.add_argument("--tamanos", type=lambda v: [int(x) for x in v.split(",")], default=[1, 10, 40, 100])
+    args = parser.parse_args()
+    asyncio.run(main(args.latencia_ms, args.tamanos))